@@ -20,96 +20,55 @@ Built with Flask 3.x, Supabase for backend services, and modern web technologies
 """
 
 # ===== CORE IMPORTS =====
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import re
+import hashlib
+import click
 from dotenv import load_dotenv
 
+# Load environment variables from .env file (Supabase credentials, Flask secret key)
+# before anything below reads them
+load_dotenv()
+
 # ===== LOCAL IMPORTS =====
-# Our custom modules for database operations and business logic
+# Our custom modules for database operations and business logic.
+# `supabase` is built on first use (see supabase_client.ServiceClient), so
+# importing the app doesn't pay for supabase-py until a request needs it.
 from supabase_client import (
     supabase, supabase_url, supabase_anon_key,
-    # Student data functions
-    get_student_classes, get_student_books, get_student_materials, 
-    get_student_financial_overview, get_student_room,
-    # Teacher data functions  
-    get_teacher_classes, get_students_in_class, get_all_subjects, get_books_by_subject,
-    # Finance data functions
-    get_all_financial_records, get_all_students, get_financial_record,
-    # Hall data functions
-    get_hall_head_by_id, get_rooms_by_hall, get_students_by_hall_with_clearance,
-    # Lab/Coach data functions
-    get_materials_by_subject, get_all_materials,
-    # Clearance calculation functions
-    calculate_subject_clearance_percentage, calculate_subject_clearance_status,
-    calculate_overall_clearance_percentage, calculate_overall_clearance_status,
-    # Search and utility functions
-    search_students
-)
-
-# Core Flask imports for web framework functionality
-from flask import Flask, render_template, redirect, url_for, request, session, flash, jsonify
-
-# Supabase client and data access functions
-from supabase_client import supabase
-from supabase_client import (
     # Student data functions - getting personal info, classes, books, materials
     get_student_by_id, get_student_classes, get_student_books, get_student_materials,
-    get_student_financial_overview, get_student_room, 
-    
-    # Teacher data functions - getting teacher info and their classes
-    get_teacher_by_id, get_teacher_classes, get_students_in_class, 
-    
+    get_student_financial_overview, get_student_room,
+    # Teacher data functions - their classes and students
+    get_teacher_classes, get_students_in_class,
     # Academic resources - books and materials by subject
-    get_books_by_subject, get_materials_by_subject, get_all_materials, get_all_subjects,
-    
+    get_books_by_subject, get_materials_by_subject,
     # Financial data - records and overviews for finance staff
     get_all_financial_records, get_financial_record,
-    
     # Hall management - hall heads, rooms, and student assignments
-    get_hall_head_by_id, get_rooms_by_hall, get_all_rooms,
-    
-    # General data access - all students, teachers, search functionality
-    get_all_students, get_all_teachers, search_students,
-    
-    # Clearance calculations - the heart of the system!
-    calculate_subject_clearance_percentage, calculate_subject_clearance_status,
-    calculate_overall_clearance_percentage, calculate_overall_clearance_status,
-    get_students_by_hall_with_clearance
+    get_hall_head_by_id, get_rooms_by_hall, get_students_by_hall_with_clearance,
+    # General data access - all students, search, cohorts
+    get_all_students, search_students, get_cohort_student_ids
 )
 
-# Standard library imports
-import os
-import jwt  # JSON Web Token handling for authentication
-from functools import wraps  # For creating decorators
-from dotenv import load_dotenv  # Environment variable management
-
-# Load environment variables from .env file
-# This includes Supabase credentials and Flask secret key
-load_dotenv()
+# Clearance certificate rendering and caching
+from certificates import (
+    CertificateStore, CertificateUnavailable, BulkCertificateRun,
+    load_certificate_state, certificate_filename
+)
+from jobs import JobQueue, FileResult
+from events import EventBus, streams_enabled, student_channel, subject_channel
+from compression import CompressionMiddleware
+from assets import AssetManifest, ASSET_MAX_AGE
+from json_provider import FastJSONProvider, StdlibJSONProvider
+from uploads import (
+    EclariRequest, ChunkedUpload, MAX_PROOF_SIZE, MAX_REQUEST_SIZE, CHUNKED_UPLOAD_CHUNK_SIZE,
+    proof_upload_request, sniff_image_type, stream_size
+)
 
-def create_app() -> Flask:
-    """
-    Main Flask application factory.
-    
-    Creates and configures the Flask app with all routes, authentication,
-    and dashboard functionality. This is where the magic happens!
-    
-    Returns:
-        Flask: Configured Flask application instance
-    """
-    app = Flask(__name__)
-    
-    # Set up secret key for session management and security
-    # In production, this should be a strong, randomly generated key
-    app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-change-this')
-    
-    # Supabase configuration for frontend JavaScript
-    # These are safe to expose to the client (anon key has limited permissions)
-    supabase_url = os.getenv('SUPABASE_URL')
-    supabase_anon_key = os.getenv('SUPABASE_ANON_KEY')
-    
 def verify_supabase_token(f):
     """
     Decorator to verify Supabase authentication and populate session with user data.
@@ -311,15 +270,376 @@ def create_app():
     """
     # Initialize Flask application with custom settings
     app = Flask(__name__)
-    
-    # Load environment variables for configuration
-    load_dotenv()
+    # Lets proof upload routes keep their image in memory (see uploads.proof_upload_request)
+    app.request_class = EclariRequest
     
     # Set Flask configuration
     app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
     app.config['SESSION_PERMANENT'] = False
     app.config['SESSION_TYPE'] = 'filesystem'
+    # Reject oversized bodies before reading them; proof uploads and the
+    # finance import set their own limits per request
+    app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_SIZE
+    
+    # gzip/brotli for HTML, JSON and CSV (set RESPONSE_COMPRESSION=0 if a proxy already compresses)
+    if os.getenv('RESPONSE_COMPRESSION', '1') != '0':
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+
+    # JSON responses through orjson when it's installed (JSON_PROVIDER=stdlib to opt out)
+    app.json = StdlibJSONProvider(app) if os.getenv('JSON_PROVIDER') == 'stdlib' else FastJSONProvider(app)
+
+    # Pages only open /api/events where streams are served (see events.py), and poll otherwise
+    app.add_template_global(streams_enabled, 'live_events')
+
+    # Content-hashed static URLs (see assets.py); templates use asset_url() instead of url_for('static')
+    asset_manifest = AssetManifest(app.static_folder)
+
+    @app.template_global()
+    def asset_url(filename):
+        """URL for a static asset that changes whenever its content does."""
+        resolved, version = asset_manifest.resolve(filename)
+        if version:
+            return url_for('static', filename=resolved, v=version)
+        return url_for('static', filename=resolved)
+
+    @app.after_request
+    def cache_fingerprinted_assets(response):
+        """Let browsers keep hashed assets for a year without revalidating."""
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            filename = (request.view_args or {}).get('filename', '')
+            if asset_manifest.is_fingerprinted(filename, request.args.get('v')):
+                response.cache_control.public = True
+                response.cache_control.max_age = ASSET_MAX_AGE
+                response.cache_control.immutable = True
+                response.cache_control.no_cache = None
+        return response
+
+    # Rendered clearance certificates, keyed by student and clearance state
+    certificate_store = CertificateStore()
+    
+    def invalidate_certificates(rows):
+        """Drop stored certificates for every student touched by an update."""
+        if isinstance(rows, dict):
+            rows = [rows]
+        for row in rows or []:
+            student = row.get('student_id')
+            # student_id may come back as an embedded object on joined selects
+            if isinstance(student, dict):
+                student = student.get('student_id')
+            certificate_store.invalidate(student)
+    
+    # Background jobs for slow operations (see jobs.py); clients poll /api/jobs/<id>
+    job_queue = JobQueue()
+    
+    def run_certificate_job(payload, job):
+        """Job handler: render (or fetch) a student's clearance certificate."""
+        snapshot, state_hash = load_certificate_state(payload['student_id'])
+        pdf_data = certificate_store.get_or_render(snapshot, state_hash)
+        return FileResult(pdf_data, 'application/pdf', certificate_filename(snapshot['student']))
+    
+    def run_proof_upload_job(payload, job):
+        """Job handler: push a saved proof image to storage and mark the item pending."""
+        from supabase_client import upload_proof_image
+        
+        temp_path = payload['temp_path']
+        try:
+            result = upload_proof_image(payload['item_type'], payload['item_id'], payload['student_id'], temp_path)
+            if not result.get('success'):
+                raise RuntimeError(result.get('message', 'Upload failed'))
+            certificate_store.invalidate(payload['student_id'])
+            queue_proof_images(result, payload['item_type'], payload['item_id'], owner=job.owner)
+            publish_proof_submitted(result, payload['item_type'], payload['item_id'], payload['student_id'])
+            return result
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def run_proof_images_job(payload, job):
+        """Job handler: normalize an uploaded proof photo and make its thumbnail."""
+        from supabase_client import download_proof_image, save_proof_renditions
+        from uploads import normalize_proof_image
+        
+        data = download_proof_image(payload['storage_path'])
+        if data is None:
+            raise RuntimeError(f"Proof image {payload['storage_path']} not found")
+        renditions = normalize_proof_image(data)
+        return save_proof_renditions(
+            payload['item_type'], payload['item_id'], payload['storage_path'], payload['image_url'],
+            renditions['image'], renditions['thumbnail']
+        )
+    
+    def queue_proof_images(upload_result, item_type, item_id, owner=None):
+        """Queue normalization/thumbnailing for a successful proof upload."""
+        job_queue.enqueue('proof_images', {
+            'item_type': item_type,
+            'item_id': item_id,
+            'storage_path': upload_result['storage_path'],
+            'image_url': upload_result['image_url']
+        }, owner=owner)
+    
+    job_queue.register('clearance_certificate', run_certificate_job)
+    job_queue.register('proof_upload', run_proof_upload_job)
+    job_queue.register('proof_images', run_proof_images_job)
+    
+    # Live updates for open dashboards (see events.py); browsers listen on /api/events
+    event_bus = EventBus()
+    
+    def run_clearance_events_job(payload, job):
+        """Job handler: recompute clearance for changed students and push any new percentages."""
+        from supabase_client import get_clearance_snapshots
+        
+        snapshots = get_clearance_snapshots(payload['student_ids'])
+        published = 0
+        for student_id, snapshot in snapshots.items():
+            if event_bus.publish_clearance(student_id, snapshot['clearance_percentage']):
+                published += 1
+        return {'students': len(snapshots), 'published': published}
+    
+    job_queue.register('clearance_events', run_clearance_events_job)
+    
+    def run_bulk_certificates_job(payload, job):
+        """Job handler: render a cohort's certificates into the run's ZIP."""
+        run = BulkCertificateRun.load(certificate_store, payload['run_id'])
+        if not run:
+            raise RuntimeError(f"Bulk certificate run {payload['run_id']} not found")
+        # Lets the status route see the job fail if this worker dies mid-run
+        run.progress['job_id'] = job.id
+        # Each saved batch doubles as the job's heartbeat, so only a dead worker goes stale
+        run.run(payload['student_ids'], on_progress=lambda progress: job.set_progress(
+            completed=progress['completed'], total=progress['total']
+        ))
+        return {'run_id': run.run_id, 'total': run.progress['total'], 'skipped': len(run.progress['skipped'])}
+    
+    job_queue.register('bulk_certificates', run_bulk_certificates_job)
+    
+    def publish_clearance_changes(rows):
+        """Queue clearance recalculation (and a push if it moved) for every student touched by an update."""
+        if isinstance(rows, dict):
+            rows = [rows]
+        student_ids = []
+        for row in rows or []:
+            student = row.get('student_id')
+            if isinstance(student, dict):
+                student = student.get('student_id')
+            if student:
+                student_ids.append(student)
+        if student_ids:
+            # Recalculating takes several queries, so it happens off the request
+            job_queue.enqueue('clearance_events', {'student_ids': list(dict.fromkeys(student_ids))})
+    
+    def publish_proof_submitted(upload_result, item_type, item_id, student_id):
+        """Tell the item's reviewers (and the student's other tabs) a proof is waiting."""
+        event_bus.publish('proof_submitted', [
+            subject_channel(upload_result.get('subject_id')), student_channel(student_id)
+        ], {
+            'item_type': item_type,
+            'item_id': item_id,
+            'student_id': student_id,
+            'subject_id': upload_result.get('subject_id')
+        })
     
+    def publish_reviews(item_type, rows):
+        """Tell students their items were reviewed, and other reviewers to drop them."""
+        id_column = 'book_id' if item_type == 'book' else 'material_id'
+        for row in rows or []:
+            event_bus.publish('item_reviewed', [
+                student_channel(row.get('student_id')), subject_channel(row.get('subject_id'))
+            ], {
+                'item_type': item_type,
+                'item_id': row.get(id_column),
+                'student_id': row.get('student_id'),
+                'subject_id': row.get('subject_id'),
+                'approval_status': row.get('approval_status'),
+                'rejection_reason': row.get('rejection_reason')
+            })
+        publish_clearance_changes(rows)
+    
+    def review_scope(staff_role, staff_id):
+        """
+        What a reviewer may approve: (item_type, subject_ids), or None for other roles.
+        
+        Teachers review books in the subjects they teach, lab staff SCI
+        materials and coaches PE materials.
+        """
+        from supabase_client import get_teacher_subject_ids
+        
+        if staff_role == 'teacher':
+            return 'book', get_teacher_subject_ids(staff_id)
+        if staff_role in ['lab', 'coach']:
+            return 'material', ['SCI' if staff_role == 'lab' else 'PE']
+        return None
+    
+    def job_accepted(job_id):
+        """202 response pointing the client at the job's status endpoint."""
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('api_job_status', job_id=job_id)
+        }), 202
+    
+    def conditional_get(version_scopes):
+        """
+        Decorator: answer If-None-Match with a 304 before the view loads any data.
+        
+        `version_scopes(user, **view_args)` names the data-version scopes the
+        page depends on (see get_data_version), or returns None to skip
+        validation for that request. The ETag covers the user, the URL and
+        those versions, which are read before the view runs, so a write that
+        lands mid-render only ever causes an extra full response.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                from flask import make_response
+                from supabase_client import get_data_version
+                
+                user = session.get('user', {})
+                scopes = version_scopes(user, **kwargs)
+                if scopes is None:
+                    return view(*args, **kwargs)
+                
+                etag = hashlib.sha256(
+                    f"{user.get('role')}:{user.get('id')}:{request.full_path}:{get_data_version(*scopes)}".encode()
+                ).hexdigest()[:32]
+                if request.if_none_match.contains_weak(etag):
+                    response = make_response('', 304)
+                    response.set_etag(etag)
+                    return response
+                
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200:
+                    # Private to this user, and always revalidated
+                    response.headers['Cache-Control'] = 'private, no-cache'
+                    response.set_etag(etag)
+                return response
+            return wrapper
+        return decorator
+    
+    def dashboard_versions(user, role):
+        """Data-version scopes behind each dashboard (None for redirects)."""
+        from supabase_client import get_teacher_subject_ids
+        
+        if user.get('role') != role and role != 'student':
+            return None
+        if role == 'student':
+            return [f"student-{user.get('id')}"]
+        if role == 'teacher':
+            return ['teacher-subjects'] + [f"subject-{s}" for s in get_teacher_subject_ids(user.get('id'))]
+        if role == 'finance':
+            return ['finance']
+        if role == 'hall':
+            return [f"hall-{user.get('id')}"]
+        if role in ['lab', 'coach']:
+            return ['subject-SCI' if role == 'lab' else 'subject-PE']
+        return None
+
+    def stream_dashboard(template, sections, **context):
+        """
+        Render a dashboard progressively instead of after all of its queries.
+
+        `sections` maps names to zero-argument loaders. The template pulls each
+        one with `{% set x = section('name') %}` where it is first needed, with
+        `{{ flush() }}` just before it, so the page so far (shell, header,
+        earlier sections) reaches the browser before that section's queries
+        run. Each loader runs at most once per request.
+
+        Args:
+            template (str): Template name
+            sections (dict): Section name -> loader
+            **context: Values available up front (user, config)
+
+        Returns:
+            Response: Streamed HTML, sent in one chunk per flush point
+        """
+        from flask import stream_template
+        from markupsafe import Markup
+
+        flush_marker = Markup('<!-- flush -->')
+        loaded = {}
+
+        def section(name):
+            if name not in loaded:
+                loaded[name] = sections[name]()
+            return loaded[name]
+
+        # Created here so it holds on to the request context while it streams
+        pieces = stream_template(template, section=section, flush=lambda: flush_marker, **context)
+
+        def generate():
+            # Jinja yields every text run and {{ }} separately; send whole sections instead
+            buffer = []
+            for piece in pieces:
+                if piece == flush_marker:
+                    if buffer:
+                        yield ''.join(buffer)
+                        buffer = []
+                else:
+                    buffer.append(piece)
+            if buffer:
+                yield ''.join(buffer)
+
+        return Response(generate(), mimetype='text/html')
+
+    def render_fragment(macro, **kwargs):
+        """
+        Render one macro from templates/_fragments.html.
+
+        The full templates import the same macros, so a refreshed section is
+        exactly what a page reload would have shown.
+        """
+        from flask import get_template_attribute
+        return str(get_template_attribute('_fragments.html', macro)(**kwargs))
+
+    def load_subject_clearance(student_id, subject_id):
+        """
+        A student's books and materials for one subject, with its clearance.
+
+        Returns:
+            dict: { 'books', 'materials', 'percentage', 'status' }
+        """
+        from supabase_client import compute_subject_clearance_percentage, overall_clearance_status
+
+        student = get_student_by_id(student_id) or {}
+        books = get_student_books(student_id)
+        materials = get_student_materials(student_id)
+        percentage = compute_subject_clearance_percentage(student, books, materials, subject_id)
+        return {
+            'books': [book for book in books if (book.get('subject_id') or {}).get('subject_id') == subject_id],
+            'materials': [material for material in materials if material.get('subject_id') == subject_id],
+            'percentage': percentage,
+            'status': overall_clearance_status(percentage)
+        }
+
+    def book_row_fragment(book_id, class_name, user):
+        """
+        The teacher table row for a book, or None if it doesn't exist or isn't
+        in one of `user`'s subjects (same rule as fragment_book_row).
+        """
+        from supabase_client import get_book_with_student
+
+        scope = review_scope(user.get('role'), user.get('id'))
+        if not scope or scope[0] != 'book':
+            return None
+        book = get_book_with_student(book_id)
+        if not book or book.get('subject_id') not in scope[1]:
+            return None
+        return render_fragment('book_row', book=book, class_name=class_name)
+
+    def material_row_fragment(material_id, user):
+        """
+        The lab/coach table row for a material, or None if it doesn't exist or
+        isn't in `user`'s subjects (same rule as fragment_material_row).
+        """
+        from supabase_client import get_material_with_student
+
+        scope = review_scope(user.get('role'), user.get('id'))
+        if not scope or scope[0] != 'material':
+            return None
+        material = get_material_with_student(material_id)
+        if not material or material.get('subject_id') not in scope[1]:
+            return None
+        return render_fragment('material_row', material=material, subject_code=material.get('subject_id'))
+
     # ===== ROUTE DEFINITIONS =====
     # Main application routes handling different pages and functionality
 
@@ -383,6 +703,7 @@ def create_app():
 
     @app.route("/dashboard/<role>")
     @verify_supabase_token
+    @conditional_get(dashboard_versions)
     def dashboard(role):
         """
         Main dashboard route - the heart of the application!
@@ -393,6 +714,10 @@ def create_app():
         - Hall Staff: Monitor students in their hall
         - Finance Staff: Handle financial clearance for all students
         
+        Each dashboard carries an ETag built from the version stamps of the
+        data it shows, so a reload with nothing changed is a 304 that skips
+        all of the loading below.
+        
         Args:
             role (str): The user role (student, teacher, hall, finance, etc.)
             
@@ -417,51 +742,70 @@ def create_app():
         }
         
         # ===== STUDENT DASHBOARD =====
-        # The most complex dashboard with clearance tracking
+        # The most complex dashboard with clearance tracking. It streams: the
+        # header goes out straight away and each section follows as its data
+        # arrives (see stream_dashboard and the section() calls in student.html)
         if role == 'student':
+            from supabase_client import (
+                get_student_clearance_snapshot, compute_subject_clearance_percentage, overall_clearance_status
+            )
+            
             student_id = user.get('id')
-            student_classes = get_student_classes(student_id)
-            
-            # Calculate clearance percentages for each subject
-            # This is the core functionality students care about most!
-            for enrollment in student_classes:
-                subject_id = enrollment.get('class_id', {}).get('subject_id', {}).get('subject_id')
-                if subject_id:
-                    # Add percentage and status for each subject
-                    enrollment['clearance_percentage'] = calculate_subject_clearance_percentage(student_id, subject_id)
-                    enrollment['clearance_status'] = calculate_subject_clearance_status(student_id, subject_id)
-            
-            # Compile comprehensive student data for dashboard
-            dashboard_data.update({
-                'student_classes': student_classes,  # Classes and clearance status
-                'student_books': get_student_books(student_id),  # Books to return
-                'student_materials': get_student_materials(student_id),  # Lab materials status
-                'financial_overview': get_student_financial_overview(student_id),  # Financial status
-                'room_assignment': get_student_room(student_id),  # Hall assignment
-                'overall_clearance_percentage': calculate_overall_clearance_percentage(student_id),  # Overall progress
-                'overall_clearance_status': calculate_overall_clearance_status(student_id)  # Overall status
-            })
+            snapshot = {}
+            
+            def load_clearance():
+                # Books, materials and finance in one pass; every percentage below is worked out from these
+                if not snapshot:
+                    snapshot.update(get_student_clearance_snapshot(student_id) or {
+                        'student': user, 'books': [], 'materials': [], 'financial': None, 'clearance_percentage': 0
+                    })
+                    snapshot['clearance_status'] = overall_clearance_status(snapshot['clearance_percentage'])
+                return snapshot
+            
+            def load_classes():
+                load_clearance()
+                student_classes = get_student_classes(student_id)
+                
+                # Calculate clearance percentages for each subject
+                # This is the core functionality students care about most!
+                for enrollment in student_classes:
+                    subject_id = enrollment.get('class_id', {}).get('subject_id', {}).get('subject_id')
+                    if subject_id:
+                        # Add percentage and status for each subject
+                        percentage = compute_subject_clearance_percentage(
+                            snapshot['student'], snapshot['books'], snapshot['materials'], subject_id
+                        )
+                        enrollment['clearance_percentage'] = percentage
+                        enrollment['clearance_status'] = overall_clearance_status(percentage)
+                return student_classes
+            
+            return stream_dashboard('student.html', {
+                'clearance': load_clearance,  # Overall progress, books, materials, finance
+                'classes': load_classes,  # Classes and per-subject clearance
+                'room': lambda: get_student_room(student_id)  # Hall assignment
+            }, **dashboard_data)
         
         # ===== TEACHER DASHBOARD =====
-        # Teachers manage their classes and track student progress
+        # Teachers manage their classes and track student progress; the page
+        # streams so the header shows while the per-class queries run
         elif role == 'teacher':
             teacher_id = user.get('id')
-            teacher_classes = get_teacher_classes(teacher_id)
-            dashboard_data.update({
-                'teacher_classes': teacher_classes,  # Classes they teach
-                'all_subjects': get_all_subjects()  # For reference
-            })
             
-            # Enrich each class with student lists and resources
-            for class_info in teacher_classes:
-                class_info['students'] = get_students_in_class(class_info['class_id'])
-                if class_info.get('subject_id'):
-                    # Add books for this subject
-                    class_info['books'] = get_books_by_subject(class_info['subject_id']['subject_id'])
+            def load_classes():
+                teacher_classes = get_teacher_classes(teacher_id)
+                # Enrich each class with student lists and resources
+                for class_info in teacher_classes:
+                    class_info['students'] = get_students_in_class(class_info['class_id'])
+                    if class_info.get('subject_id'):
+                        # Add books for this subject
+                        class_info['books'] = get_books_by_subject(class_info['subject_id']['subject_id'])
+                return teacher_classes
+            
+            return stream_dashboard('teacher.html', {'classes': load_classes}, **dashboard_data)
         
         # ===== FINANCE DASHBOARD =====
         # Finance staff handle all student financial clearance
-        elif role == 'finance':
+        if role == 'finance':
             dashboard_data.update({
                 'financial_records': get_all_financial_records(),  # All financial data
                 'all_students': get_all_students()  # Student directory for lookups
@@ -470,13 +814,16 @@ def create_app():
         # ===== HALL DASHBOARD =====
         # Hall staff manage residential clearance for their hall
         elif role == 'hall':
-            hall_id = user.get('id')
-            hall_info = get_hall_head_by_id(hall_id)
+            from supabase_client import get_hall_snapshot
+            
+            # One rooms query, plus a batched clearance rollup for every resident
+            hall = get_hall_snapshot(user.get('id'))
             dashboard_data.update({
-                'hall_rooms': get_rooms_by_hall(hall_id),  # Rooms in this hall
-                'hall_info': hall_info,  # Hall details
-                'hall_students': get_students_by_hall_with_clearance(hall_id),  # Students with clearance status
-                'hall_name': hall_info.get('hall_name') if hall_info else 'Unknown Hall'
+                'hall_rooms': hall['rooms'],  # Rooms in this hall
+                'hall_info': hall['hall_info'],  # Hall details
+                'hall_students': hall['students'],  # Students with hall status and overall clearance
+                'hall_summary': hall['summary'],  # Counts for the overview cards
+                'hall_name': hall['hall_name']
             })
         
         # ===== LAB DASHBOARD =====
@@ -511,17 +858,20 @@ def create_app():
         
         # ===== TEMPLATE ROUTING =====
         # Map each role to its corresponding HTML template
+        # (student and teacher dashboards stream, and have returned above)
         template_map = {
-            'student': 'student.html',              # Student clearance dashboard
-            'teacher': 'teacher.html',              # Teacher class management
             'finance': 'finance.html',              # Financial clearance management
             'hall': 'hall.html',                    # Hall residential management
             'coach': 'materials_dashboard.html',    # Sports equipment (shared template)
             'lab': 'materials_dashboard.html'       # Lab equipment (shared template)
         }
         
-        # Get the appropriate template, defaulting to student if role not found
-        template = template_map.get(role, 'student.html')
+        # Roles without a dashboard of their own get an empty student page
+        template = template_map.get(role)
+        if template is None:
+            return stream_dashboard('student.html', {
+                'clearance': dict, 'classes': list, 'room': lambda: None
+            }, **dashboard_data)
         
         # Render the template with all the role-specific data
         return render_template(template, **dashboard_data)
@@ -580,9 +930,11 @@ def create_app():
     def debug_auth_test():
         """Comprehensive authentication test for all user roles"""
         try:
-            # Get current Supabase user
-            user = supabase.auth.get_user()
-            if not user.user:
+            # Get current Supabase user from this request's token; the shared
+            # client has no session of its own (and must not, with concurrent requests)
+            token = request.cookies.get('supabase-token')
+            user = supabase.auth.get_user(token) if token else None
+            if not user or not user.user:
                 return jsonify({"error": "No authenticated user", "instructions": "Please log in first"})
             
             auth_uid = user.user.id
@@ -664,9 +1016,10 @@ def create_app():
             # Clear everything
             session.clear()
             
-            # Get current user
-            user = supabase.auth.get_user()
-            if not user.user:
+            # Get current user from this request's token (not the shared client's session)
+            token = request.cookies.get('supabase-token')
+            user = supabase.auth.get_user(token) if token else None
+            if not user or not user.user:
                 flash('No authenticated user found.', 'error')
                 return redirect(url_for('login'))
             
@@ -817,6 +1170,7 @@ def create_app():
     @app.route("/subject")
     @app.route("/subject/<subject_id>")
     @verify_supabase_token
+    @conditional_get(lambda user, subject_id=None: [f"student-{user.get('id')}"] if subject_id else None)
     def subject(subject_id=None):
         """
         Subject-specific clearance page for detailed view.
@@ -834,19 +1188,8 @@ def create_app():
         # Get human-readable subject name from URL parameters
         subject_name = request.args.get('name', subject_id)
         
-        # Filter student data to show only this subject's items
-        student_books_for_subject = []
-        student_materials_for_subject = []
-        
-        # Get all books and filter to this subject only
-        all_books = get_student_books(student_id)
-        student_books_for_subject = [book for book in all_books 
-                                   if book.get('subject_id', {}).get('subject_id') == subject_id]
-        
-        # Get all materials and filter to this subject only
-        all_materials = get_student_materials(student_id)
-        student_materials_for_subject = [material for material in all_materials 
-                                       if material.get('subject_id') == subject_id]
+        # This subject's books and materials, and its clearance worked out from them
+        clearance = load_subject_clearance(student_id, subject_id)
         
         # Find the student's enrollment in this subject
         student_classes = get_student_classes(student_id)
@@ -856,23 +1199,98 @@ def create_app():
                 current_class = enrollment
                 break
         
-        # Calculate subject-specific clearance metrics
-        subject_clearance_percentage = calculate_subject_clearance_percentage(student_id, subject_id)
-        subject_clearance_status = calculate_subject_clearance_status(student_id, subject_id)
-        
         # Render subject page with all the filtered data
         return render_template("subject.html", 
                              user=user,
                              subject_id=subject_id,
                              subject_name=subject_name,
                              current_class=current_class,
-                             subject_books=student_books_for_subject,
-                             subject_materials=student_materials_for_subject,
-                             subject_clearance_percentage=subject_clearance_percentage,
-                             subject_clearance_status=subject_clearance_status,
+                             subject_books=clearance['books'],
+                             subject_materials=clearance['materials'],
+                             subject_clearance_percentage=clearance['percentage'],
+                             subject_clearance_status=clearance['status'],
                              supabase_url=supabase_url, 
                              supabase_anon_key=supabase_anon_key)
 
+    # ===== HTML FRAGMENTS =====
+    # One section of a page, rendered from the same macros as the full
+    # templates (templates/_fragments.html), so the frontend can refresh what
+    # changed instead of reloading the whole dashboard
+
+    @app.route("/fragments/student/progress")
+    @verify_supabase_token
+    @conditional_get(lambda user: [f"student-{user.get('id')}"])
+    def fragment_student_progress():
+        """The student dashboard's overall clearance progress card."""
+        from supabase_client import get_student_clearance_snapshot, overall_clearance_status
+        
+        user = session.get('user', {})
+        if user.get('role') != 'student':
+            return jsonify({'success': False, 'message': 'Only students have a clearance progress card'}), 403
+        
+        snapshot = get_student_clearance_snapshot(user.get('id'))
+        if snapshot is None:
+            return jsonify({'success': False, 'message': 'Student not found'}), 404
+        
+        percentage = snapshot['clearance_percentage']
+        return render_fragment('clearance_progress', prefix='overall', label='Total Clearance Status',
+                               percentage=percentage, status=overall_clearance_status(percentage))
+
+    @app.route("/fragments/subject/<subject_id>")
+    @verify_supabase_token
+    @conditional_get(lambda user, subject_id: [f"student-{user.get('id')}"])
+    def fragment_subject_clearance(subject_id):
+        """The subject page's clearance progress plus its books and materials lists."""
+        user = session.get('user', {})
+        if user.get('role') != 'student':
+            return jsonify({'success': False, 'message': 'Only students have subject pages'}), 403
+        
+        subject_name = request.args.get('name', subject_id)
+        clearance = load_subject_clearance(user.get('id'), subject_id)
+        return (
+            render_fragment('clearance_progress', prefix='subject', label=f"{subject_name} Clearance Status",
+                            percentage=clearance['percentage'], status=clearance['status'],
+                            size='1.1rem', padding='20px')
+            + render_fragment('subject_items', subject_name=subject_name,
+                              books=clearance['books'], materials=clearance['materials'])
+        )
+
+    @app.route("/fragments/book/<book_id>/row")
+    @verify_supabase_token
+    def fragment_book_row(book_id):
+        """
+        One row of the teacher's books table.
+        
+        Query params:
+            class_name: Class shown in the row (a subject's books appear under each of its classes)
+        """
+        from supabase_client import get_teacher_subject_ids, get_book_with_student
+        
+        user = session.get('user', {})
+        if user.get('role') != 'teacher':
+            return jsonify({'success': False, 'message': 'Only teachers can view book rows'}), 403
+        
+        book = get_book_with_student(book_id)
+        if not book or book.get('subject_id') not in get_teacher_subject_ids(user.get('id')):
+            return jsonify({'success': False, 'message': 'Book not found or not in your subjects'}), 404
+        return render_fragment('book_row', book=book, class_name=request.args.get('class_name', ''))
+
+    @app.route("/fragments/material/<material_id>/row")
+    @verify_supabase_token
+    def fragment_material_row(material_id):
+        """One row of the lab/coach equipment table."""
+        from supabase_client import get_material_with_student
+        
+        user = session.get('user', {})
+        scope = review_scope(user.get('role'), user.get('id'))
+        if not scope or scope[0] != 'material':
+            return jsonify({'success': False, 'message': 'Only lab staff and coaches can view material rows'}), 403
+        
+        material = get_material_with_student(material_id)
+        if not material or material.get('subject_id') not in scope[1]:
+            return jsonify({'success': False, 'message': 'Material not found or not in your subjects'}), 404
+        return render_fragment('material_row', material=material, subject_code=material.get('subject_id'))
+
     # ===== API ENDPOINTS =====
     # These provide JSON data for AJAX requests from the frontend
     
@@ -893,6 +1311,7 @@ def create_app():
     
     @app.route("/api/student/<student_id>/financial")
     @verify_supabase_token
+    @conditional_get(lambda user, student_id: [f"student-{student_id}"])
     def api_student_financial(student_id):
         """
         Get detailed financial information for a specific student.
@@ -908,78 +1327,342 @@ def create_app():
     @app.route("/api/update/book/<book_id>/return", methods=['POST'])
     @verify_supabase_token
     def api_update_book_return(book_id):
-        """Mark a book as returned or not returned"""
+        """
+        Mark a book as returned or not returned.
+        
+        With `"fragment": true` (and the row's `class_name`) the response also
+        carries `html`: the refreshed teacher table row (null unless the book
+        is in one of the caller's subjects).
+        """
         from supabase_client import update_book_status
         data = request.get_json()
         returned = data.get('returned', False)
         
         result = update_book_status(book_id, returned)
         if result:
-            return jsonify({'success': True, 'message': 'Book status updated'})
+            invalidate_certificates(result)
+            publish_clearance_changes(result)
+            response = {'success': True, 'message': 'Book status updated'}
+            if data.get('fragment'):
+                response['html'] = book_row_fragment(book_id, data.get('class_name', ''), session.get('user', {}))
+            return jsonify(response)
         else:
             return jsonify({'success': False, 'message': 'Failed to update book status'}), 400
     
     @app.route("/api/update/material/<material_id>/return", methods=['POST'])
     @verify_supabase_token
     def api_update_material_return(material_id):
-        """Mark a material as returned or not returned"""
+        """
+        Mark a material as returned or not returned.
+        
+        With `"fragment": true` the response also carries `html`: the
+        refreshed lab/coach table row (null unless the material is in the
+        caller's subjects).
+        """
         from supabase_client import update_material_status
         data = request.get_json()
         returned = data.get('returned', False)
         
         result = update_material_status(material_id, returned)
         if result:
-            return jsonify({'success': True, 'message': 'Material status updated'})
+            invalidate_certificates(result)
+            publish_clearance_changes(result)
+            response = {'success': True, 'message': 'Material status updated'}
+            if data.get('fragment'):
+                response['html'] = material_row_fragment(material_id, session.get('user', {}))
+            return jsonify(response)
         else:
             return jsonify({'success': False, 'message': 'Failed to update material status'}), 400
     
     @app.route("/api/update/financial/<student_id>", methods=['POST'])
     @verify_supabase_token
     def api_update_financial(student_id):
-        """Update financial record for a student"""
-        from supabase_client import update_financial_record, get_financial_record
+        """
+        Update a student's financial record.
+        
+        If amount_paid is provided the balance is calculated from it; a
+        balance on its own is a manual adjustment and amount_paid is
+        calculated from that instead. The status follows from the new
+        balance unless one is given. It all happens in one atomic database
+        call, so concurrent edits to the same student can't overwrite
+        each other.
+        """
+        from supabase_client import apply_financial_update
         data = request.get_json()
         
-        # Get current financial record to calculate values
-        current_record = get_financial_record(student_id)
-        if not current_record:
+        amount_paid = float(data['amount_paid']) if 'amount_paid' in data else None
+        balance = float(data['balance']) if 'balance' in data else None
+        status = data.get('status')
+        if amount_paid is None and balance is None and not status:
+            return jsonify({'success': False, 'message': 'No valid updates provided'}), 400
+        
+        result = apply_financial_update(student_id, amount_paid, balance, status)
+        if result is None:
+            return jsonify({'success': False, 'message': 'Failed to update financial record'}), 400
+        if not result:
             return jsonify({'success': False, 'message': 'Financial record not found'}), 404
         
-        tuition_due = current_record.get('tuition_due', 0)
+        certificate_store.invalidate(student_id)
+        publish_clearance_changes([{'student_id': student_id}])
+        return jsonify({'success': True, 'message': 'Financial record updated', 'data': result})
+    
+    @app.route("/api/import/financial", methods=['POST'])
+    @verify_supabase_token
+    def api_import_financial():
+        """
+        Apply a finance CSV in bulk (finance staff only).
         
-        # Only allow updates to specific fields
-        allowed_updates = {}
+        The file (multipart field "file", or a text/csv body) needs a
+        student_id column plus amount_paid, balance and/or status. Rows are
+        parsed as the file is read and written in chunks through the
+        apply_financial_updates SQL function; the response is
+        newline-delimited JSON streamed as the import runs: an "error" line
+        per rejected row, "progress" lines, then a final "done" line.
+        """
+        import shutil
+        import tempfile
+        from werkzeug.exceptions import RequestEntityTooLarge
+        from spreadsheets import import_finance_csv, FINANCE_IMPORT_MAX_SIZE
         
-        # If amount_paid is provided, calculate balance automatically
-        if 'amount_paid' in data:
-            amount_paid = float(data['amount_paid'])
-            allowed_updates['amount_paid'] = amount_paid
-            allowed_updates['balance'] = tuition_due - amount_paid
+        user = session.get('user', {})
+        if user.get('role') != 'finance':
+            return jsonify({'success': False, 'message': 'Only finance staff can import records'}), 403
         
-        # Allow direct balance updates (for manual adjustments)
-        if 'balance' in data and 'amount_paid' not in data:
-            balance = float(data['balance'])
-            allowed_updates['balance'] = balance
-            # Calculate amount_paid based on balance
-            allowed_updates['amount_paid'] = tuition_due - balance
+        # Spreadsheets are bigger than the default body limit
+        request.max_content_length = FINANCE_IMPORT_MAX_SIZE
+        # Werkzeug spools a large multipart file to disk, but Flask closes the
+        # request's files when this view returns, before the body is streamed,
+        # so the import reads from its own temporary copy, made a block at a time
+        stream = tempfile.TemporaryFile()
+        try:
+            upload = request.files.get('file')
+            if upload:
+                shutil.copyfileobj(upload.stream, stream)
+            elif request.mimetype == 'text/csv':
+                shutil.copyfileobj(request.stream, stream)
+        except RequestEntityTooLarge:
+            stream.close()
+            return jsonify({'success': False, 'message': 'File too large. Split it into smaller files.'}), 413
+        if not stream.tell():
+            stream.close()
+            return jsonify({'success': False, 'message': 'No CSV file provided'}), 400
+        stream.seek(0)
         
-        # Update status if provided
-        if 'status' in data:
-            allowed_updates['status'] = data['status']
+        def generate():
+            with stream:
+                for event in import_finance_csv(stream):
+                    if event['type'] == 'done':
+                        # Same follow-up as a single update, once for the whole file
+                        student_ids = event.pop('student_ids')
+                        for student_id in student_ids:
+                            certificate_store.invalidate(student_id)
+                        publish_clearance_changes([{'student_id': student_id} for student_id in student_ids])
+                        print(f"[DEBUG] Finance import by {user.get('id')}: {event['updated']} updated, {event['failed']} failed")
+                    yield app.json.dumps(event) + '\n'
         
-        if not allowed_updates:
-            return jsonify({'success': False, 'message': 'No valid updates provided'}), 400
+        response = Response(generate(), mimetype='application/x-ndjson')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
+    # ===== SPREADSHEET EXPORTS =====
+    
+    def export_response(pages, available_columns, report_name):
+        """
+        Stream a paged report as CSV, XLSX or JSON (?format=csv|xlsx|json, ?columns=a,b).
         
-        result = update_financial_record(student_id, allowed_updates)
-        if result:
-            return jsonify({'success': True, 'message': 'Financial record updated', 'data': result})
-        else:
-            return jsonify({'success': False, 'message': 'Failed to update financial record'}), 400
+        The first page is read before the response starts so a failing
+        query still gets a proper error status; later pages are read as the
+        client downloads, one at a time.
+        """
+        from spreadsheets import select_columns, stream_export, EXPORT_MIMETYPES
+        
+        export_format = (request.args.get('format') or 'csv').lower()
+        if export_format not in EXPORT_MIMETYPES:
+            return jsonify({'success': False, 'message': f"format must be one of: {', '.join(EXPORT_MIMETYPES)}"}), 400
+        try:
+            columns = select_columns(available_columns, request.args.get('columns'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        pages = iter(pages)
+        try:
+            first_page = next(pages, None)
+        except Exception as e:
+            print(f"Error exporting {report_name}: {e}")
+            return jsonify({'success': False, 'message': 'Could not load the report'}), 500
+        
+        def rows():
+            if first_page is None:
+                return
+            yield first_page
+            try:
+                yield from pages
+            except Exception as e:
+                # Headers are already sent; the download ends short
+                print(f"Error exporting {report_name} part way: {e}")
+        
+        body = stream_export(rows(), columns, export_format, sheet_name=report_name.replace('_', ' ').title())
+        filename = f"{report_name}_{datetime.now().strftime('%Y%m%d')}.{export_format}"
+        response = Response(body, mimetype=EXPORT_MIMETYPES[export_format])
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.headers['Cache-Control'] = 'no-store'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
+    @app.route("/api/export/financial")
+    @verify_supabase_token
+    def api_export_financial():
+        """Every student's financial record (finance staff only)."""
+        from supabase_client import iter_financial_records
+        from spreadsheets import FINANCE_EXPORT_COLUMNS
+        
+        if session.get('user', {}).get('role') != 'finance':
+            return jsonify({'success': False, 'message': 'Only finance staff can export financial records'}), 403
+        return export_response(iter_financial_records(), FINANCE_EXPORT_COLUMNS, 'financial_records')
+    
+    @app.route("/api/export/hall-roster")
+    @verify_supabase_token
+    def api_export_hall_roster():
+        """
+        The hall head's residents with room and hall clearance status.
+        
+        Overall clearance is only worked out when the clearance_percentage
+        column is included (it is by default).
+        """
+        from supabase_client import iter_hall_roster
+        from spreadsheets import HALL_ROSTER_EXPORT_COLUMNS, select_columns
+        
+        user = session.get('user', {})
+        if user.get('role') != 'hall':
+            return jsonify({'success': False, 'message': 'Only hall staff can export a hall roster'}), 403
+        try:
+            with_clearance = 'clearance_percentage' in select_columns(
+                HALL_ROSTER_EXPORT_COLUMNS, request.args.get('columns'))
+        except ValueError:
+            with_clearance = False  # export_response reports the bad column
+        return export_response(iter_hall_roster(user.get('id'), with_clearance=with_clearance),
+                               HALL_ROSTER_EXPORT_COLUMNS, 'hall_roster')
+    
+    @app.route("/api/export/clearance")
+    @verify_supabase_token
+    def api_export_clearance():
+        """
+        Overall clearance for a cohort (staff only).
+        
+        Query: hall_id or year_group; with neither, every student. Hall
+        heads always get their own hall.
+        """
+        from supabase_client import iter_clearance_report
+        from spreadsheets import CLEARANCE_EXPORT_COLUMNS
+        
+        user = session.get('user', {})
+        if user.get('role') not in ['teacher', 'hall', 'finance', 'lab', 'coach']:
+            return jsonify({'success': False, 'message': 'Only staff can export clearance reports'}), 403
+        
+        hall_id = request.args.get('hall_id')
+        year_group = request.args.get('year_group', type=int)
+        if user.get('role') == 'hall':
+            hall_id, year_group = user.get('id'), None
+        return export_response(iter_clearance_report(hall_id=hall_id, year_group=year_group),
+                               CLEARANCE_EXPORT_COLUMNS, 'clearance_report')
+    
+    @app.route("/api/update/hall-rooms", methods=['POST'])
+    @verify_supabase_token
+    def api_update_hall_rooms():
+        """
+        Update room inspection and hall clearance for many rooms at once.
+        
+        Body: {"rooms": [{"room_id", "room_status", "hall_clearance_status"}, ...]}
+        (each room needs at least one of the two statuses)
+        
+        Rooms with the same change are applied with one set-based update,
+        and only rooms in the hall head's own hall are touched. Returns a
+        result for every room plus the refreshed hall rollup, so the
+        dashboard can update without reloading.
+        """
+        try:
+            from supabase_client import update_rooms_bulk, invalidate_hall_snapshot, get_hall_snapshot
+            
+            user = session.get('user', {})
+            if user.get('role') != 'hall':
+                return jsonify({'success': False, 'message': 'Only hall staff can update rooms'}), 403
+            hall_id = user.get('id')
+            
+            data = request.get_json(silent=True) or {}
+            rooms = data.get('rooms')
+            if not isinstance(rooms, list) or not rooms:
+                return jsonify({'success': False, 'message': 'No rooms provided'}), 400
+            if len(rooms) > 1000:
+                return jsonify({'success': False, 'message': 'Too many rooms (max 1000 per request)'}), 400
+            
+            room_statuses = ['clean', 'needs_attention', 'pending_inspection']
+            clearance_statuses = ['approved', 'rejected', 'pending']
+            
+            # Validate each room, then group identical changes into set-based updates
+            results = []
+            groups = {}
+            seen = set()
+            for room in rooms:
+                room = room if isinstance(room, dict) else {}
+                room_id = room.get('room_id')
+                changes = {
+                    column: room[column]
+                    for column in ('room_status', 'hall_clearance_status')
+                    if room.get(column) is not None
+                }
+                
+                result = {'room_id': room_id, 'success': False}
+                results.append(result)
+                
+                if room_id in (None, ''):
+                    result['message'] = 'Missing room_id'
+                elif not changes:
+                    result['message'] = 'Nothing to update'
+                elif changes.get('room_status', 'clean') not in room_statuses:
+                    result['message'] = f"Invalid room_status (use {', '.join(room_statuses)})"
+                elif changes.get('hall_clearance_status', 'approved') not in clearance_statuses:
+                    result['message'] = f"Invalid hall_clearance_status (use {', '.join(clearance_statuses)})"
+                elif str(room_id) in seen:
+                    result['message'] = 'Room listed more than once'
+                else:
+                    seen.add(str(room_id))
+                    key = tuple(sorted(changes.items()))
+                    groups.setdefault(key, []).append(result)
+            
+            for key, group in groups.items():
+                updated = update_rooms_bulk(hall_id, [r['room_id'] for r in group], dict(key))
+                updated_ids = {str(row['room_id']) for row in updated}
+                for result in group:
+                    if str(result['room_id']) in updated_ids:
+                        result['success'] = True
+                    else:
+                        result['message'] = 'Room not found in your hall'
+            
+            succeeded = sum(1 for r in results if r['success'])
+            if succeeded:
+                invalidate_hall_snapshot(hall_id)
+            hall = get_hall_snapshot(hall_id)
+            
+            print(f"[DEBUG] Hall room update by {hall_id}: {succeeded}/{len(results)} rooms updated in {len(groups)} update groups")
+            return jsonify({
+                'success': True,
+                'updated': succeeded,
+                'failed': len(results) - succeeded,
+                'results': results,
+                'students': hall['students'],
+                'summary': hall['summary']
+            })
+            
+        except Exception as e:
+            print(f"Error in update_hall_rooms endpoint: {e}")
+            return jsonify({'success': False, 'message': str(e)}), 500
     
     # ===== YEAR GROUP WORKFLOW API ENDPOINTS =====
     # New endpoints for Y1/Y2 differentiated clearance workflows
     
     @app.route("/api/upload-proof", methods=['POST'])
+    @proof_upload_request
     @verify_supabase_token
     def api_upload_proof():
         """
@@ -987,7 +1670,8 @@ def create_app():
         Students upload photos of books or materials to be approved by staff.
         """
         try:
-            from supabase_client import upload_proof_image
+            from werkzeug.exceptions import RequestEntityTooLarge
+            from supabase_client import upload_proof_stream
             
             user = session.get('user', {})
             student_id = user.get('id')
@@ -999,12 +1683,18 @@ def create_app():
                 print(f"[ERROR] Non-student tried to upload: {user.get('role')}")
                 return jsonify({'success': False, 'message': 'Only students can upload proof images'}), 403
             
-            # Get form data
-            if 'image' not in request.files:
+            # Get form data (Werkzeug enforces the proof size limit while parsing)
+            try:
+                files = request.files
+            except RequestEntityTooLarge:
+                print(f"[ERROR] Upload body too large: {request.content_length} bytes")
+                return jsonify({'success': False, 'message': 'File too large. Maximum size is 5MB.'}), 413
+            
+            if 'image' not in files:
                 print("[ERROR] No image file in request")
                 return jsonify({'success': False, 'message': 'No image file provided'}), 400
             
-            image_file = request.files['image']
+            image_file = files['image']
             item_type = request.form.get('item_type')  # 'book' or 'material'
             item_id = request.form.get('item_id')
             
@@ -1019,48 +1709,170 @@ def create_app():
                 print(f"[ERROR] Invalid item type: {item_type}")
                 return jsonify({'success': False, 'message': 'Invalid item type'}), 400
             
-            # Validate file size (5MB max)
-            image_file.seek(0, 2)  # Seek to end
-            file_size = image_file.tell()
-            image_file.seek(0)  # Seek back to start
-            
-            max_size = 5 * 1024 * 1024  # 5MB
-            if file_size > max_size:
+            # Validate file size (5MB max) - the upload is already in memory, so this is free
+            stream = image_file.stream
+            file_size = stream_size(stream)
+            if file_size > MAX_PROOF_SIZE:
                 print(f"[ERROR] File too large: {file_size} bytes")
                 return jsonify({'success': False, 'message': f'File too large ({file_size / 1024 / 1024:.1f}MB). Maximum size is 5MB.'}), 400
             
-            print(f"[DEBUG] File size OK: {file_size / 1024:.1f}KB")
-            
-            # Save file temporarily
-            import tempfile
-            import os
-            
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, f"{item_id}_{image_file.filename}")
-            
-            print(f"[DEBUG] Saving to temp path: {temp_path}")
-            image_file.save(temp_path)
-            
-            try:
-                # Upload to Supabase
-                print(f"[DEBUG] Calling upload_proof_image...")
-                result = upload_proof_image(item_type, item_id, student_id, temp_path)
-                print(f"[DEBUG] Upload result: {result}")
-                return jsonify(result)
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    print(f"[DEBUG] Cleaned up temp file")
+            # Trust the bytes, not the filename or the browser's content type
+            image_type = sniff_image_type(stream)
+            if not image_type:
+                print(f"[ERROR] Unrecognised image data in {image_file.filename}")
+                return jsonify({'success': False, 'message': 'Unsupported image type. Please upload a JPEG, PNG or HEIC photo.'}), 400
+            content_type, file_ext = image_type
+            
+            print(f"[DEBUG] File OK: {file_size / 1024:.1f}KB {content_type}")
+            
+            if request.args.get('async') == '1':
+                # Background jobs run after this request ends, so hand the image over on disk
+                import tempfile
+                fd, temp_path = tempfile.mkstemp(prefix="eclari-proof-", suffix=file_ext)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(stream.getbuffer())
+                job_id = job_queue.enqueue('proof_upload', {
+                    'item_type': item_type,
+                    'item_id': item_id,
+                    'student_id': student_id,
+                    'temp_path': temp_path
+                }, owner=user.get('auth_uid'))
+                return job_accepted(job_id)
+            
+            # Stream straight from the request buffer to storage
+            result = upload_proof_stream(item_type, item_id, student_id, stream, content_type, file_ext)
+            print(f"[DEBUG] Upload result: {result}")
+            if result.get('success'):
+                certificate_store.invalidate(student_id)
+                queue_proof_images(result, item_type, item_id, owner=user.get('auth_uid'))
+                publish_proof_submitted(result, item_type, item_id, student_id)
+            return jsonify(result)
             
         except Exception as e:
             print(f"[ERROR] Exception in upload_proof endpoint: {e}")
             import traceback
             traceback.print_exc()
             return jsonify({'success': False, 'message': str(e)}), 500
+    
+    # ===== RESUMABLE CHUNKED UPLOADS =====
+    # For large proofs on slow connections: initiate, PUT chunks, complete.
+    # Each chunk is a short request, and a dropped connection only loses one chunk.
+    
+    def load_own_upload(upload_id):
+        """The current student's upload session, or None."""
+        user = session.get('user', {})
+        upload = ChunkedUpload.load(upload_id)
+        if not upload or user.get('role') != 'student' or upload.info['student_id'] != user.get('id'):
+            return None
+        return upload
+    
+    @app.route("/api/upload-proof/chunked", methods=['POST'])
+    @verify_supabase_token
+    def api_chunked_upload_start():
+        """
+        Start a resumable proof upload.
+        
+        Body (JSON): item_type, item_id and size (bytes). Returns the upload_id,
+        the URL to PUT chunks to, and the chunk size to use.
+        """
+        user = session.get('user', {})
+        if user.get('role') != 'student':
+            return jsonify({'success': False, 'message': 'Only students can upload proof images'}), 403
+        
+        data = request.get_json(silent=True) or {}
+        item_type = data.get('item_type')
+        item_id = data.get('item_id')
+        size = data.get('size')
+        
+        if not all([item_type, item_id, size]):
+            return jsonify({'success': False, 'message': 'Missing required fields'}), 400
+        if item_type not in ['book', 'material']:
+            return jsonify({'success': False, 'message': 'Invalid item type'}), 400
+        if not isinstance(size, int) or size <= 0 or size > MAX_PROOF_SIZE:
+            return jsonify({'success': False, 'message': 'File too large. Maximum size is 5MB.'}), 400
+        
+        upload = ChunkedUpload.create(user.get('id'), item_type, str(item_id), size)
+        print(f"[DEBUG] Chunked upload {upload.upload_id} started: {item_type} {item_id}, {size} bytes")
+        return jsonify({
+            'success': True,
+            'upload_id': upload.upload_id,
+            'upload_url': url_for('api_chunked_upload_chunk', upload_id=upload.upload_id),
+            'chunk_size': CHUNKED_UPLOAD_CHUNK_SIZE,
+            'received': 0
+        }), 201
+    
+    @app.route("/api/upload-proof/chunked/<upload_id>", methods=['GET', 'PUT'])
+    @verify_supabase_token
+    def api_chunked_upload_chunk(upload_id):
+        """
+        GET: how many bytes have been received (where to resume from).
+        PUT: store one chunk. The body is raw bytes, and Content-Range
+        ("bytes <start>-<end>/<size>") says where they go.
+        """
+        upload = load_own_upload(upload_id)
+        if not upload:
+            return jsonify({'success': False, 'message': 'Upload not found'}), 404
+        
+        if request.method == 'PUT':
+            content_range = request.headers.get('Content-Range', '')
+            match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)', content_range.strip())
+            if not match:
+                return jsonify({'success': False, 'message': 'Content-Range header required'}), 400
+            start, end, total = (int(n) for n in match.groups())
+            length = end - start + 1
+            if total != upload.size or length <= 0 or request.content_length != length:
+                return jsonify({'success': False, 'message': 'Content-Range does not match the upload'}), 400
+            
+            try:
+                upload.write_chunk(start, request.stream, length)
+            except ValueError as e:
+                # Tell the client where to resume from
+                return jsonify({'success': False, 'message': str(e), 'received': upload.received()}), 409
+        
+        return jsonify({'success': True, 'received': upload.received(), 'size': upload.size})
+    
+    @app.route("/api/upload-proof/chunked/<upload_id>/complete", methods=['POST'])
+    @verify_supabase_token
+    def api_chunked_upload_complete(upload_id):
+        """Finish a chunked upload: store the image and mark the item pending, like /api/upload-proof."""
+        try:
+            from supabase_client import upload_proof_stream
+            
+            user = session.get('user', {})
+            upload = load_own_upload(upload_id)
+            if not upload:
+                return jsonify({'success': False, 'message': 'Upload not found'}), 404
+            if not upload.is_complete():
+                return jsonify({
+                    'success': False,
+                    'message': 'Upload is not complete',
+                    'received': upload.received(),
+                    'size': upload.size
+                }), 409
+            
+            info = upload.info
+            # The chunks were written in place, so the .part file is the image - no assembly step
+            with upload.open() as stream:
+                image_type = sniff_image_type(stream)
+                if not image_type:
+                    upload.discard()
+                    return jsonify({'success': False, 'message': 'Unsupported image type. Please upload a JPEG, PNG or HEIC photo.'}), 400
+                content_type, file_ext = image_type
+                result = upload_proof_stream(info['item_type'], info['item_id'], info['student_id'],
+                                             stream, content_type, file_ext)
+            
+            print(f"[DEBUG] Chunked upload {upload_id} result: {result}")
+            if result.get('success'):
+                upload.discard()
+                certificate_store.invalidate(info['student_id'])
+                queue_proof_images(result, info['item_type'], info['item_id'], owner=user.get('auth_uid'))
+                publish_proof_submitted(result, info['item_type'], info['item_id'], info['student_id'])
+            return jsonify(result)
             
         except Exception as e:
-            print(f"Error in upload_proof endpoint: {e}")
+            print(f"[ERROR] Exception in chunked upload complete: {e}")
+            import traceback
+            traceback.print_exc()
             return jsonify({'success': False, 'message': str(e)}), 500
     
     @app.route("/api/approve-item", methods=['POST'])
@@ -1078,8 +1890,10 @@ def create_app():
             staff_role = user.get('role')
             
             # Security check: only staff can approve
-            if staff_role not in ['teacher', 'lab', 'coach']:
+            scope = review_scope(staff_role, staff_id)
+            if not scope:
                 return jsonify({'success': False, 'message': 'Only staff can approve items'}), 403
+            allowed_type, subject_ids = scope
             
             data = request.get_json()
             item_type = data.get('item_type')  # 'book' or 'material'
@@ -1098,27 +1912,120 @@ def create_app():
             if action == 'reject' and not rejection_reason:
                 return jsonify({'success': False, 'message': 'Rejection reason is required'}), 400
             
-            # Call appropriate approval function
+            if item_type not in ['book', 'material']:
+                return jsonify({'success': False, 'message': 'Invalid item type'}), 400
+            if item_type != allowed_type:
+                return jsonify({'success': False, 'message': f'{staff_role.capitalize()}s cannot review {item_type}s'}), 403
+            
+            # Call appropriate approval function (only matches items in the reviewer's subjects)
             if item_type == 'book':
-                result = approve_book(item_id, staff_id, action, rejection_reason)
-            elif item_type == 'material':
-                result = approve_material(item_id, staff_id, action, rejection_reason)
+                result = approve_book(item_id, staff_id, action, rejection_reason, subject_ids)
             else:
-                return jsonify({'success': False, 'message': 'Invalid item type'}), 400
+                result = approve_material(item_id, staff_id, action, rejection_reason, subject_ids)
             
             if result:
+                invalidate_certificates(result)
+                publish_reviews(item_type, [result])
                 return jsonify({
                     'success': True,
                     'message': f'Item {action}d successfully',
                     'data': result
                 })
             else:
-                return jsonify({'success': False, 'message': 'Failed to update item'}), 500
+                return jsonify({'success': False, 'message': 'Item not found or not in your subjects'}), 404
             
         except Exception as e:
             print(f"Error in approve_item endpoint: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
     
+    @app.route("/api/approve-items", methods=['POST'])
+    @verify_supabase_token
+    def api_approve_items():
+        """
+        Approve or reject many Y1 proof submissions in one request.
+        
+        Body: {"items": [{"item_type", "item_id", "action", "rejection_reason"}, ...]}
+        
+        Items are grouped by type, action and rejection reason, and each group is
+        applied with one set-based update. Teachers can only review books in
+        their subjects, lab staff SCI materials and coaches PE materials.
+        Returns a result for every item.
+        """
+        try:
+            from supabase_client import review_items_bulk
+            
+            user = session.get('user', {})
+            staff_id = user.get('id')
+            staff_role = user.get('role')
+            
+            # Security check: only staff can approve
+            scope = review_scope(staff_role, staff_id)
+            if not scope:
+                return jsonify({'success': False, 'message': 'Only staff can approve items'}), 403
+            allowed_type, subject_ids = scope
+            
+            data = request.get_json(silent=True) or {}
+            items = data.get('items')
+            if not isinstance(items, list) or not items:
+                return jsonify({'success': False, 'message': 'No items provided'}), 400
+            if len(items) > 1000:
+                return jsonify({'success': False, 'message': 'Too many items (max 1000 per request)'}), 400
+            
+            # Validate each item, then group the valid ones into set-based updates
+            results = []
+            groups = {}
+            for item in items:
+                item = item if isinstance(item, dict) else {}
+                item_type = item.get('item_type')
+                item_id = item.get('item_id')
+                action = item.get('action', 'approve')
+                rejection_reason = item.get('rejection_reason')
+                
+                result = {'item_type': item_type, 'item_id': item_id, 'action': action, 'success': False}
+                results.append(result)
+                
+                if not item_type or item_id in (None, ''):
+                    result['message'] = 'Missing required fields'
+                elif action not in ['approve', 'reject']:
+                    result['message'] = 'Invalid action'
+                elif action == 'reject' and not rejection_reason:
+                    result['message'] = 'Rejection reason is required'
+                elif item_type not in ['book', 'material']:
+                    result['message'] = 'Invalid item type'
+                elif item_type != allowed_type:
+                    result['message'] = f'{staff_role.capitalize()}s cannot review {item_type}s'
+                else:
+                    key = (item_type, action, rejection_reason if action == 'reject' else None)
+                    groups.setdefault(key, []).append(result)
+            
+            for (item_type, action, rejection_reason), group in groups.items():
+                updated = review_items_bulk(
+                    item_type, [r['item_id'] for r in group], staff_id, action, rejection_reason, subject_ids
+                )
+                invalidate_certificates(updated)
+                publish_reviews(item_type, updated)
+                
+                id_column = 'book_id' if item_type == 'book' else 'material_id'
+                updated_ids = {str(row[id_column]) for row in updated}
+                for result in group:
+                    if str(result['item_id']) in updated_ids:
+                        result['success'] = True
+                    else:
+                        result['message'] = 'Item not found or not in your subjects'
+            
+            succeeded = sum(1 for r in results if r['success'])
+            print(f"[DEBUG] Bulk review by {staff_role} {staff_id}: {succeeded}/{len(results)} items updated in {len(groups)} update groups")
+            return jsonify({
+                'success': True,
+                'updated': succeeded,
+                'failed': len(results) - succeeded,
+                'results': results
+            })
+            
+        except Exception as e:
+            print(f"Error in approve_items endpoint: {e}")
+            return jsonify({'success': False, 'message': str(e)}), 500
+    
     @app.route("/api/pending-approvals")
     @verify_supabase_token
     def api_pending_approvals():
@@ -1127,48 +2034,125 @@ def create_app():
         - Teachers: see pending book approvals for their subjects
         - Lab staff: see pending material approvals for lab equipment
         - Coaches: see pending material approvals for sports equipment
+        
+        Every response carries a `cursor`. Passing it back as `?since=<cursor>`
+        returns only items whose proof changed since then (`books`/`materials`,
+        including new submissions and finished thumbnails) plus the
+        IDs of items reviewed since then (`removed`). Responses have an ETag
+        derived from the cursor, so an unchanged list is a 304 that skips the
+        list queries entirely.
         """
         try:
-            from supabase_client import get_pending_approvals_for_teacher, get_pending_approvals_for_staff
+            from flask import make_response
+            from supabase_client import (
+                get_pending_approvals_for_teacher, get_pending_approvals_for_staff,
+                get_approvals_version, get_pending_approval_changes
+            )
             
             user = session.get('user', {})
             staff_id = user.get('id')
             staff_role = user.get('role')
             
-            if staff_role == 'teacher':
-                approvals = get_pending_approvals_for_teacher(staff_id)
-                return jsonify({
-                    'success': True,
-                    'books': approvals.get('books', []),
-                    'materials': approvals.get('materials', [])
-                })
+            scope = review_scope(staff_role, staff_id)
+            if not scope:
+                return jsonify({'success': False, 'message': 'Invalid role for approvals'}), 403
+            item_type, subject_ids = scope
             
-            elif staff_role in ['lab', 'coach']:
-                materials = get_pending_approvals_for_staff(staff_id, staff_role)
-                return jsonify({
-                    'success': True,
-                    'books': [],
-                    'materials': materials
-                })
+            since = request.args.get('since') or None
+            if since:
+                try:
+                    since_at = datetime.fromisoformat(since)
+                except ValueError:
+                    return jsonify({'success': False, 'message': 'Invalid since cursor'}), 400
+            
+            # Cheap "has anything changed?" check before the real queries
+            cursor = get_approvals_version(item_type, subject_ids) if subject_ids else ''
+            etag = hashlib.sha256(
+                f"{staff_role}:{staff_id}:{','.join(sorted(subject_ids))}:{since}:{cursor}".encode()
+            ).hexdigest()[:32]
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
             
+            key = 'books' if item_type == 'book' else 'materials'
+            payload = {'success': True, 'books': [], 'materials': [], 'cursor': cursor}
+            
+            if since and subject_ids:
+                # Overlap the window slightly so writes from workers with a skewed
+                # clock aren't missed; the client applies changes idempotently
+                window_start = (since_at - timedelta(seconds=5)).isoformat()
+                changes = get_pending_approval_changes(item_type, subject_ids, window_start)
+                if changes is None:
+                    return jsonify({'success': False, 'message': 'Failed to load changes'}), 500
+                payload[key] = changes['changed']
+                payload['removed'] = {key: changes['removed']}
+                payload['incremental'] = True
+            elif staff_role == 'teacher':
+                approvals = get_pending_approvals_for_teacher(staff_id)
+                payload['books'] = approvals.get('books', [])
+                payload['materials'] = approvals.get('materials', [])
             else:
-                return jsonify({'success': False, 'message': 'Invalid role for approvals'}), 403
+                payload['materials'] = get_pending_approvals_for_staff(staff_id, staff_role)
+            
+            response = jsonify(payload)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.set_etag(etag)
+            return response
             
         except Exception as e:
             print(f"Error in pending_approvals endpoint: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
     
+    @app.route("/api/events")
+    @verify_supabase_token
+    def api_events():
+        """
+        Server-sent events stream of live updates for the current user.
+        - Students: 'item_reviewed' and 'clearance' events for their own items
+        - Teachers: 'proof_submitted' and 'item_reviewed' events in their subjects
+        - Lab staff / coaches: the same for SCI / PE materials
+        
+        Streams end after a few minutes and the browser reconnects on its own,
+        sending Last-Event-ID so nothing published in between is missed.
+        
+        Only served under gevent workers (see events.streams_enabled); elsewhere
+        this answers 204, which tells EventSource to stop and pages to poll.
+        """
+        if not streams_enabled():
+            return Response(status=204)
+        
+        user = session.get('user', {})
+        role = user.get('role')
+        
+        if role == 'student':
+            channels = [student_channel(user.get('id'))]
+        else:
+            scope = review_scope(role, user.get('id'))
+            if not scope:
+                return jsonify({'success': False, 'message': 'No live updates for this role'}), 403
+            channels = [subject_channel(subject_id) for subject_id in scope[1]]
+        
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        subscription = event_bus.subscribe(channels, int(last_event_id) if last_event_id.isdigit() else None)
+        
+        response = Response(event_bus.stream(subscription), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Stop reverse proxies from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
     @app.route("/api/generate-clearance-pdf/<student_id>")
     @verify_supabase_token
     def generate_clearance_pdf(student_id):
-        """Generate a secured, locked clearance certificate PDF"""
+        """
+        Generate a secured, locked clearance certificate PDF.
+
+        Rendered certificates are cached per clearance state (see certificates.py),
+        so repeat downloads skip reportlab entirely and browsers that already hold
+        the current certificate get a 304.
+        """
         try:
-            from reportlab.lib.pagesizes import letter
-            from reportlab.lib.units import inch
-            from reportlab.pdfgen import canvas
-            from reportlab.lib import colors
-            from reportlab.platypus import Table, TableStyle
-            from io import BytesIO
             from flask import make_response
             
             # Verify user has access to this student's data
@@ -1178,247 +2162,34 @@ def create_app():
                 if user.get('role') not in ['teacher', 'hall', 'finance', 'lab', 'coach']:
                     return jsonify({'success': False, 'message': 'Unauthorized'}), 403
             
-            # Get student clearance data
-            from supabase_client import get_student_by_id
-            student = get_student_by_id(student_id)
-            if not student:
-                return jsonify({'success': False, 'message': 'Student not found'}), 404
-            
-            # Check if fully cleared
-            clearance_percentage = calculate_overall_clearance_percentage(student_id)
-            if clearance_percentage < 100:
-                return jsonify({
-                    'success': False, 
-                    'message': f'Student has not completed clearance yet ({clearance_percentage}% complete)'
-                }), 400
+            # Large PDFs can be rendered in the background and collected later
+            if request.args.get('async') == '1':
+                job_id = job_queue.enqueue('clearance_certificate', {'student_id': student_id},
+                                           owner=user.get('auth_uid'))
+                return job_accepted(job_id)
             
-            # Check financial clearance
-            financial_overview = get_student_financial_overview(student_id)
-            if financial_overview and financial_overview.get('tuition_due', 0) > 0:
-                return jsonify({
-                    'success': False,
-                    'message': f'Student has outstanding balance of ${financial_overview["tuition_due"]:.2f}. Financial clearance required.'
-                }), 400
-            
-            # Create PDF in memory
-            buffer = BytesIO()
-            c = canvas.Canvas(buffer, pagesize=letter)
-            width, height = letter
-            
-            # ===== PDF SECURITY SETTINGS =====
-            # Note: Encryption removed due to ReportLab API complexity
-            # PDF will be generated without encryption but still read-only for most viewers
-            # owner_password = os.getenv('PDF_OWNER_PASSWORD', 'EclariSecure2024!')
-            # c.setEncrypt('', owner_password)  # Basic encryption without detailed permissions
-            
-            # ===== HEADER WITH SCHOOL BRANDING =====
-            c.setFont("Helvetica-Bold", 24)
-            c.setFillColor(colors.HexColor("#C8A882"))  # ALA Gold
-            c.drawCentredString(width/2, height - 1*inch, "ECLARI")
-            
-            c.setFont("Helvetica", 12)
-            c.setFillColor(colors.black)
-            c.drawCentredString(width/2, height - 1.3*inch, "Student Clearance System")
-            
-            # Horizontal line
-            c.setStrokeColor(colors.HexColor("#C8A882"))
-            c.setLineWidth(2)
-            c.line(0.75*inch, height - 1.6*inch, width - 0.75*inch, height - 1.6*inch)
-            
-            # ===== CERTIFICATE TITLE =====
-            c.setFont("Helvetica-Bold", 20)
-            c.setFillColor(colors.HexColor("#2563eb"))
-            c.drawCentredString(width/2, height - 2.2*inch, "CLEARANCE CERTIFICATE")
-            
-            # ===== STUDENT INFORMATION =====
-            c.setFillColor(colors.black)
-            c.setFont("Helvetica", 11)
-            
-            y_position = height - 2.8*inch
-            
-            # Student details
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(1*inch, y_position, "Student Name:")
-            c.setFont("Helvetica", 11)
-            c.drawString(2.5*inch, y_position, f"{student['first_name']} {student['last_name']}")
-            
-            y_position -= 0.3*inch
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(1*inch, y_position, "Student ID:")
-            c.setFont("Helvetica", 11)
-            c.drawString(2.5*inch, y_position, student['student_id'])
-            
-            y_position -= 0.3*inch
-            c.setFont("Helvetica-Bold", 11)
-            c.drawString(1*inch, y_position, "Year Group:")
-            c.setFont("Helvetica", 11)
-            c.drawString(2.5*inch, y_position, f"Year {student.get('year_group', 'N/A')}")
-            
-            # ===== CLEARANCE STATUS BOX =====
-            y_position -= 0.6*inch
-            
-            # Green box for cleared status
-            c.setFillColor(colors.HexColor("#22c55e"))
-            c.setStrokeColor(colors.HexColor("#16a34a"))
-            c.setLineWidth(2)
-            c.roundRect(1*inch, y_position - 0.8*inch, width - 2*inch, 0.8*inch, 0.1*inch, fill=1)
-            
-            # White text inside box
-            c.setFillColor(colors.white)
-            c.setFont("Helvetica-Bold", 16)
-            c.drawCentredString(width/2, y_position - 0.35*inch, "✓ FULLY CLEARED")
-            
-            # ===== CLEARANCE BREAKDOWN TABLE =====
-            y_position -= 1.6*inch
-            
-            c.setFillColor(colors.black)
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(1*inch, y_position, "Clearance Breakdown:")
-            
-            y_position -= 0.3*inch
-            
-            # Get clearance details
-            books = get_student_books(student_id)
-            materials = get_student_materials(student_id)
-            
-            # Create table data
-            table_data = [
-                ['Category', 'Total Items', 'Cleared Items', 'Status']
-            ]
-            
-            # Books
-            books_cleared = sum(1 for b in books if b.get('returned') or b.get('approval_status') == 'approved')
-            table_data.append([
-                'Books',
-                str(len(books)),
-                str(books_cleared),
-                '✓' if books_cleared == len(books) else '✗'
-            ])
-            
-            # Materials
-            materials_cleared = sum(1 for m in materials if m.get('returned'))
-            table_data.append([
-                'Lab/Sports Materials',
-                str(len(materials)),
-                str(materials_cleared),
-                '✓' if materials_cleared == len(materials) else '✗'
-            ])
-            
-            # Create table
-            table = Table(table_data, colWidths=[2.5*inch, 1.5*inch, 1.5*inch, 1*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2563eb")),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('TOPPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#f1f5f9")),
-                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor("#cbd5e1")),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 10),
-                ('TOPPADDING', (0, 1), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-            ]))
-            
-            # Draw table
-            table.wrapOn(c, width, height)
-            table.drawOn(c, 1*inch, y_position - 1.5*inch)
-            
-            # ===== CERTIFICATION STATEMENT =====
-            y_position -= 2.3*inch
-            
-            c.setFont("Helvetica-Oblique", 10)
-            cert_text = (
-                "This is to certify that the above-named student has successfully completed "
-                "all clearance requirements and has returned all books, materials, and equipment "
-                "issued during their academic period."
-            )
+            # Get student clearance data and check they are fully cleared (incl. finance)
+            try:
+                snapshot, state_hash = load_certificate_state(student_id)
+            except CertificateUnavailable as e:
+                return jsonify({'success': False, 'message': e.message}), e.status_code
+            
+            # The clearance state hash is both the cache key and the ETag
+            if request.if_none_match.contains_weak(state_hash):
+                response = make_response('', 304)
+                response.set_etag(state_hash)
+                return response
             
-            # Wrap text manually
-            from textwrap import wrap
-            wrapped_lines = wrap(cert_text, width=80)
-            
-            y_pos = y_position
-            for line in wrapped_lines:
-                c.drawString(1*inch, y_pos, line)
-                y_pos -= 0.25*inch
-            
-            # ===== SIGNATURE SECTION (FIXED) =====
-            y_position -= 1.2*inch
-            
-            # Date
-            c.setFont("Helvetica", 10)
-            issue_date = datetime.now().strftime("%B %d, %Y")
-            c.drawString(1*inch, y_position, "Date Issued:")
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(2*inch, y_position, issue_date)
-            
-            y_position -= 0.8*inch
-            
-            # Signature lines - FIXED with proper layout
-            signature_y = y_position
-            
-            # Hall Head Signature (Left)
-            c.setFont("Helvetica", 9)
-            c.setStrokeColor(colors.black)
-            c.setLineWidth(1)
-            c.line(1*inch, signature_y, 3.5*inch, signature_y)  # Signature line
-            c.drawCentredString(2.25*inch, signature_y - 0.25*inch, "Hall Head Signature")
-            
-            # Registrar Signature (Right)
-            c.line(4.5*inch, signature_y, 7*inch, signature_y)  # Signature line
-            c.drawCentredString(5.75*inch, signature_y - 0.25*inch, "Registrar Signature")
-            
-            # ===== OFFICIAL STAMP AREA =====
-            y_position -= 1*inch
-            
-            c.setStrokeColor(colors.HexColor("#94a3b8"))
-            c.setLineWidth(1)
-            c.setDash(3, 3)  # Dashed line
-            c.rect(width/2 - 1*inch, y_position - 0.8*inch, 2*inch, 0.8*inch)
-            c.setDash()  # Reset to solid
-            
-            c.setFont("Helvetica-Oblique", 8)
-            c.setFillColor(colors.HexColor("#64748b"))
-            c.drawCentredString(width/2, y_position - 0.4*inch, "Official School Stamp")
-            
-            # ===== FOOTER =====
-            c.setFont("Helvetica", 7)
-            c.setFillColor(colors.HexColor("#64748b"))
-            footer_text = f"Generated by Eclari Clearance System | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            c.drawCentredString(width/2, 0.5*inch, footer_text)
-            
-            # Security notice
-            c.setFont("Helvetica-Oblique", 8)
-            c.drawCentredString(width/2, 0.3*inch, "This document is digitally secured and cannot be edited")
-            
-            # ===== WATERMARK (SUBTLE) =====
-            c.saveState()
-            c.setFillColor(colors.HexColor("#e2e8f0"))
-            c.setFillAlpha(0.1)
-            c.setFont("Helvetica-Bold", 60)
-            c.translate(width/2, height/2)
-            c.rotate(45)
-            c.drawCentredString(0, 0, "CLEARED")
-            c.restoreState()
-            
-            # ===== FINALIZE PDF =====
-            c.showPage()
-            c.save()
-            
-            # Get PDF data
-            pdf_data = buffer.getvalue()
-            buffer.close()
-            
-            # Generate filename
-            filename = f"clearance_certificate_{student['student_id']}_{datetime.now().strftime('%Y%m%d')}.pdf"
+            pdf_data = certificate_store.get_or_render(snapshot, state_hash)
+            filename = certificate_filename(snapshot['student'])
             
             # Return PDF as download
             response = make_response(pdf_data)
             response.headers['Content-Type'] = 'application/pdf'
             response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            # Private to this user, and always revalidated so a changed clearance shows up
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.set_etag(state_hash)
             
             return response
             
@@ -1428,6 +2199,158 @@ def create_app():
             traceback.print_exc()
             return jsonify({'success': False, 'message': str(e)}), 500
 
+    @app.route("/api/certificates/bulk", methods=['POST'])
+    @verify_supabase_token
+    def api_bulk_certificates():
+        """
+        Start a cohort-wide certificate run (e.g. at graduation).
+
+        Accepts one of hall_id, year_group or student_ids. The run fetches the
+        cohort's clearance data in batch, renders PDFs in a process pool and
+        packs them into a ZIP; this request returns straight away with a run
+        ID to poll.
+        """
+        try:
+            user = session.get('user', {})
+            if user.get('role') not in ['teacher', 'hall', 'finance', 'lab', 'coach']:
+                return jsonify({'success': False, 'message': 'Only staff can generate certificates in bulk'}), 403
+            
+            data = request.get_json() or {}
+            hall_id = data.get('hall_id')
+            year_group = data.get('year_group')
+            student_ids = data.get('student_ids')
+            
+            if not any([hall_id, year_group is not None, student_ids]):
+                return jsonify({'success': False, 'message': 'Provide hall_id, year_group or student_ids'}), 400
+            
+            # Hall heads can only run their own hall
+            if user.get('role') == 'hall' and hall_id != user.get('id'):
+                return jsonify({'success': False, 'message': 'Hall heads can only generate certificates for their own hall'}), 403
+            
+            cohort = get_cohort_student_ids(hall_id=hall_id, year_group=year_group, student_ids=student_ids)
+            if not cohort:
+                return jsonify({'success': False, 'message': 'No students found for this cohort'}), 404
+            
+            owner = {'id': user.get('id'), 'role': user.get('role')}
+            run = BulkCertificateRun(certificate_store, owner=owner)
+            run.progress['total'] = len(cohort)
+            run.save()
+            job_queue.enqueue('bulk_certificates', {
+                'run_id': run.run_id,
+                'student_ids': cohort
+            }, owner=user.get('auth_uid'))
+            return jsonify({
+                'success': True,
+                'run_id': run.run_id,
+                'total': len(cohort),
+                'status_url': url_for('api_bulk_certificates_status', run_id=run.run_id)
+            }), 202
+        
+        except Exception as e:
+            print(f"Error starting bulk certificates: {e}")
+            return jsonify({'success': False, 'message': str(e)}), 500
+    
+    @app.route("/api/certificates/bulk/<run_id>")
+    @verify_supabase_token
+    def api_bulk_certificates_status(run_id):
+        """Progress of a bulk certificate run (completed/total, skipped students)."""
+        run = BulkCertificateRun.load(certificate_store, run_id)
+        if not run or not run.is_owned_by(session.get('user', {})):
+            return jsonify({'success': False, 'message': 'Run not found'}), 404
+        
+        progress = dict(run.progress)
+        progress.pop('owner', None)
+        job_id = progress.pop('job_id', None)
+        if job_id and progress['status'] == 'running':
+            # The progress file can't record a worker dying mid-run; the job can
+            job = job_queue.get(job_id)
+            if job is None or job['status'] == 'failed':
+                progress['status'] = 'failed'
+                progress['error'] = (job or {}).get('error') or 'Run was interrupted'
+        if progress['status'] == 'done':
+            progress['download_url'] = url_for('api_bulk_certificates_download', run_id=run_id)
+        return jsonify({'success': True, **progress})
+    
+    @app.route("/api/certificates/bulk/<run_id>/download")
+    @verify_supabase_token
+    def api_bulk_certificates_download(run_id):
+        """Download the ZIP produced by a finished bulk certificate run."""
+        from flask import send_file
+        
+        run = BulkCertificateRun.load(certificate_store, run_id)
+        if not run or not run.is_owned_by(session.get('user', {})):
+            return jsonify({'success': False, 'message': 'Run not found'}), 404
+        if run.progress['status'] != 'done':
+            return jsonify({'success': False, 'message': 'Run not finished'}), 404
+        
+        return send_file(run.zip_path, mimetype='application/zip', as_attachment=True,
+                         download_name=f"clearance_certificates_{datetime.now().strftime('%Y%m%d')}.zip")
+
+    @app.route("/api/jobs/<job_id>")
+    @verify_supabase_token
+    def api_job_status(job_id):
+        """
+        Poll a background job.
+        
+        Returns status (queued/running/done/failed), progress, the JSON result
+        when done, and result_url when the job produced a file.
+        """
+        user = session.get('user', {})
+        job = job_queue.get(job_id)
+        if not job or job['owner'] != user.get('auth_uid'):
+            return jsonify({'success': False, 'message': 'Job not found'}), 404
+        
+        job.pop('owner')
+        if job.pop('has_file') and job['status'] == 'done':
+            job['result_url'] = url_for('api_job_result', job_id=job_id)
+        return jsonify({'success': True, 'job': job})
+
+    @app.route("/api/jobs/<job_id>/result")
+    @verify_supabase_token
+    def api_job_result(job_id):
+        """Download the file produced by a finished job."""
+        from flask import send_file
+        
+        user = session.get('user', {})
+        job = job_queue.get(job_id)
+        if not job or job['owner'] != user.get('auth_uid'):
+            return jsonify({'success': False, 'message': 'Job not found'}), 404
+        
+        result_file = job_queue.get_file(job_id)
+        if not result_file:
+            return jsonify({'success': False, 'message': 'Job has no result file yet', 'status': job['status']}), 404
+        
+        path, mimetype, filename = result_file
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=filename)
+
+    # ===== MAINTENANCE COMMANDS =====
+    # Run with: flask --app app <command>
+    
+    @app.cli.command("cleanup-proofs")
+    @click.option('--dry-run', is_flag=True, help="Only list the orphaned objects.")
+    @click.option('--min-age-days', default=7, show_default=True,
+                  help="Leave objects younger than this alone.")
+    def cleanup_proofs(dry_run, min_age_days):
+        """Delete proof images that no book or material record uses any more."""
+        from supabase_client import find_orphaned_proof_objects, delete_proof_objects
+        
+        orphans = find_orphaned_proof_objects(min_age_days * 24 * 60 * 60)
+        for path in orphans:
+            click.echo(path)
+        if dry_run:
+            click.echo(f"{len(orphans)} orphaned proof objects (dry run, nothing deleted)")
+        else:
+            click.echo(f"Deleted {delete_proof_objects(orphans)} orphaned proof objects")
+
+    @app.cli.command("refresh-teacher-subjects")
+    def refresh_teacher_subjects():
+        """Reload the cached teacher -> subject index after changing class assignments."""
+        from supabase_client import invalidate_teacher_subjects
+
+        # The stamp file lives on local disk, so run this on the web server itself
+        invalidate_teacher_subjects()
+        click.echo("Teacher subject index will be reloaded on next use by every worker")
+
     # Debug routes for testing hall functionality
     @app.route("/debug/hall/<hall_id>")
     def debug_hall(hall_id):
@@ -0,0 +1,123 @@
+"""
+Eclari Static Asset Fingerprinting
+
+Templates ask for assets by their logical name (`asset_url('js/app.bundle.js')`)
+and get a URL that changes whenever the file's content does, so browsers can
+cache it forever and still pick up a deploy immediately.
+
+- Vite bundles: `npm run build` writes content-hashed files
+  (`app.3f9c2a1b.bundle.js`) and a manifest mapping each entry to its hashed
+  file. `js/app.bundle.js` resolves through that manifest.
+- Everything else under static/ (styles.css, the hand-written app.js, images)
+  is served under its own name with a `?v=<content hash>` query.
+- If there is no manifest (bundles not rebuilt), the logical name is used
+  as-is with a `?v=` hash, so nothing breaks in development.
+
+Responses for fingerprinted URLs are sent with
+`Cache-Control: public, max-age=31536000, immutable`; plain static URLs keep
+Flask's default revalidation.
+"""
+
+import hashlib
+import json
+import os
+
+# Where vite.config.js writes bundles, relative to the static folder
+VITE_OUT_DIR = 'js'
+VITE_MANIFEST = os.path.join(VITE_OUT_DIR, '.vite', 'manifest.json')
+
+# One year: the URL changes whenever the content does
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class AssetManifest:
+    """
+    Resolve logical static filenames to fingerprinted ones.
+
+    The Vite manifest and file hashes are cached and re-read when the file's
+    mtime changes, so `npm run dev` (vite build --watch) is picked up without
+    restarting Flask.
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._manifest = {}
+        self._manifest_mtime = None
+        self._hashes = {}
+
+    def _mtime(self, filename):
+        try:
+            return os.stat(os.path.join(self.static_folder, filename)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _vite_files(self):
+        """
+        Logical name -> hashed filename for every Vite entry.
+
+        Returns:
+            dict: e.g. {'js/app.bundle.js': 'js/app.3f9c2a1b.bundle.js'}
+        """
+        mtime = self._mtime(VITE_MANIFEST)
+        if mtime != self._manifest_mtime:
+            files = {}
+            if mtime is not None:
+                try:
+                    with open(os.path.join(self.static_folder, VITE_MANIFEST)) as f:
+                        manifest = json.load(f)
+                    for chunk in manifest.values():
+                        hashed = f"{VITE_OUT_DIR}/{chunk['file']}"
+                        files[hashed] = hashed
+                        if chunk.get('isEntry'):
+                            files[f"{VITE_OUT_DIR}/{chunk['name']}.bundle.js"] = hashed
+                        for css in chunk.get('css', []):
+                            files[f"{VITE_OUT_DIR}/{css}"] = f"{VITE_OUT_DIR}/{css}"
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error reading Vite manifest: {e}")
+            self._manifest, self._manifest_mtime = files, mtime
+        return self._manifest
+
+    def file_hash(self, filename):
+        """
+        Short content hash of a static file, or None if it doesn't exist.
+        """
+        mtime = self._mtime(filename)
+        if mtime is None:
+            return None
+        cached = self._hashes.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(os.path.join(self.static_folder, filename), 'rb') as f:
+            for block in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(block)
+        value = digest.hexdigest()[:12]
+        self._hashes[filename] = (mtime, value)
+        return value
+
+    def resolve(self, filename):
+        """
+        Fingerprinted location of a static asset.
+
+        Args:
+            filename (str): Logical path under static/, e.g. 'css/styles.css'
+
+        Returns:
+            tuple: (filename, version) - the file to serve and the `v` query
+                   value to add, or None when the filename is already hashed
+        """
+        hashed = self._vite_files().get(filename)
+        if hashed:
+            return hashed, None
+        return filename, self.file_hash(filename)
+
+    def is_fingerprinted(self, filename, version=None):
+        """
+        Whether a static request can be cached as immutable.
+
+        True for Vite's hashed files, and for `?v=` URLs whose hash still
+        matches the file (an old hash after a deploy gets normal caching).
+        """
+        if filename in self._vite_files().values():
+            return True
+        return bool(version) and version == self.file_hash(filename)
@@ -0,0 +1,61 @@
+"""
+Micro-benchmark: clearance certificate rendering, full page vs template + overlay.
+
+Measures per-certificate CPU time (process time, so it isn't skewed by other
+load on the machine) and output size for both render paths.
+
+Usage:
+    python benchmarks/certificate_render.py [iterations]
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import certificates  # noqa: E402
+
+
+def sample_student(i):
+    student = {'student_id': f'ST{i:04d}', 'first_name': 'Ama', 'last_name': f'Mensah-{i}', 'year_group': 2}
+    books = [{'book_id': f'BK{i}-{n}', 'returned': True} for n in range(6)]
+    materials = [{'material_id': f'MT{i}-{n}', 'returned': True} for n in range(2)]
+    return student, books, materials
+
+
+def measure(render, iterations):
+    issued_at = datetime.now()
+    samples = [sample_student(i) for i in range(iterations)]
+    total_bytes = 0
+    start = time.process_time()
+    for student, books, materials in samples:
+        total_bytes += len(render(student, books, materials, issued_at))
+    cpu = time.process_time() - start
+    return cpu / iterations * 1000, total_bytes / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    start = time.process_time()
+    certificates.get_certificate_template()
+    template_ms = (time.process_time() - start) * 1000
+
+    # Warm reportlab's font metrics etc. so neither path pays first-call costs
+    certificates.render_clearance_certificate_full(*sample_student(0))
+
+    full_ms, full_bytes = measure(certificates.render_clearance_certificate_full, iterations)
+    overlay_ms, overlay_bytes = measure(certificates.render_clearance_certificate, iterations)
+
+    print(f"Certificates rendered per path: {iterations}")
+    print(f"One-off template build:        {template_ms:8.2f} ms CPU")
+    print(f"{'':22}{'CPU / cert':>14}{'bytes / cert':>16}")
+    print(f"{'full render (before)':22}{full_ms:11.3f} ms{full_bytes:16.0f}")
+    print(f"{'template + overlay':22}{overlay_ms:11.3f} ms{overlay_bytes:16.0f}")
+    print(f"Speed-up: {full_ms / overlay_ms:.1f}x CPU per certificate")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark: bytes saved by response compression, per route.
+
+Renders the heaviest pages and payloads with synthetic data at a realistic
+school size (finance dashboard, teacher dashboard, pending approvals JSON,
+finance CSV export, plus a certificate PDF that must be left alone), passes
+each through CompressionMiddleware and reports wire size and CPU time per
+response for every encoding available.
+
+Importing the app needs the usual .env (SUPABASE_URL etc.), but no requests
+are made to Supabase.
+
+Usage:
+    python benchmarks/compression.py [students]
+"""
+
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import render_template  # noqa: E402
+from werkzeug.test import EnvironBuilder, run_wsgi_app  # noqa: E402
+from werkzeug.wrappers import Response  # noqa: E402
+
+import certificates  # noqa: E402
+from app import app  # noqa: E402
+from compression import CompressionMiddleware, _brotli  # noqa: E402
+from spreadsheets import FINANCE_EXPORT_COLUMNS, stream_csv  # noqa: E402
+
+USER = {'id': 'STAFF1', 'first_name': 'Efua', 'last_name': 'Owusu', 'role': 'teacher'}
+
+
+FIRST_NAMES = ['Ama', 'Kofi', 'Nana', 'Yaw', 'Efua', 'Kwame', 'Abena', 'Kojo', 'Akosua', 'Fiifi', 'Esi', 'Kwesi']
+LAST_NAMES = ['Mensah', 'Owusu', 'Boateng', 'Asante', 'Osei', 'Addo', 'Appiah', 'Danso', 'Ofori', 'Amoah']
+
+
+def sample_student(i):
+    rng = random.Random(i)
+    return {'student_id': f'ST{i:04d}', 'first_name': rng.choice(FIRST_NAMES),
+            'last_name': f"{rng.choice(LAST_NAMES)}-{rng.choice(LAST_NAMES)}", 'year_group': 1 + i % 2}
+
+
+def sample_amounts(i):
+    rng = random.Random(-i)
+    tuition = rng.randrange(80, 160) * 100.0
+    paid = min(tuition, rng.randrange(0, 170) * 100.0)
+    return tuition, paid
+
+
+def finance_page(students):
+    records = []
+    for i in range(students):
+        tuition, paid = sample_amounts(i)
+        records.append({'student_id': sample_student(i), 'tuition_due': tuition, 'amount_paid': paid,
+                        'balance': tuition - paid, 'status': 'Paid' if paid >= tuition else 'Partial'})
+    return render_template('finance.html', user=dict(USER, role='finance'), financial_records=records,
+                           all_students=[sample_student(i) for i in range(students)],
+                           supabase_url='', supabase_anon_key='')
+
+
+def teacher_page(students):
+    classes = []
+    for c in range(6):
+        class_students = [sample_student(i) for i in range(c, students, 6)]
+        classes.append({
+            'class_id': f'CL{c}',
+            'class_name': f'Mathematics Y{1 + c % 2} ({c})',
+            'subject_id': {'subject_id': 'MATH', 'subject_name': 'Mathematics'},
+            'students': class_students,
+            'books': [{'book_id': f'BK{s["student_id"]}', 'student_id': s, 'cost': 45.0,
+                       'returned': random.Random(n).random() < 0.4} for n, s in enumerate(class_students)]
+        })
+    # teacher.html streams its classes section; render it in one piece here
+    return render_template('teacher.html', user=USER, section=lambda name: classes, flush=lambda: '',
+                           supabase_url='', supabase_anon_key='')
+
+
+def pending_approvals(students):
+    def digest(i):
+        return hashlib.sha256(str(i).encode()).hexdigest()
+
+    books = [{
+        'book_id': f'BK{i}', 'book_name': 'Advanced Mathematics for Senior Secondary', 'approval_status': 'pending',
+        'submitted_at': f'2026-06-01T{8 + i % 10:02d}:{i % 60:02d}:{(i * 7) % 60:02d}', 'student_id': sample_student(i),
+        'subject_id': {'subject_id': 'MATH', 'subject_name': 'Mathematics'},
+        'image_proof_url': f'https://example.supabase.co/storage/v1/object/public/clearance-proofs/books/ST{i:04d}/{digest(i)}.jpg',
+        'image_thumbnail_url': f'https://example.supabase.co/storage/v1/object/public/clearance-proofs/books/ST{i:04d}/{digest(i)}.thumbnail.jpg'
+    } for i in range(students // 4)]
+    return json.dumps({'success': True, 'books': books, 'materials': [], 'cursor': '2026-06-01T10:00:00'})
+
+
+def finance_csv(students):
+    rows = []
+    for i in range(students):
+        tuition, paid = sample_amounts(i)
+        rows.append(dict(sample_student(i), tuition_due=tuition, amount_paid=paid, balance=tuition - paid,
+                         status='Paid' if paid >= tuition else 'Partial'))
+    return ''.join(stream_csv([rows], FINANCE_EXPORT_COLUMNS))
+
+
+def certificate_pdf(_students):
+    student = sample_student(0)
+    books = [{'book_id': f'BK{n}', 'returned': True} for n in range(6)]
+    return certificates.render_clearance_certificate(student, books, [], None)
+
+
+def measure(body, mimetype, encoding, repeat=20):
+    """Wire bytes and CPU ms per response through the middleware."""
+    middleware = CompressionMiddleware(Response(body, mimetype=mimetype))
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    start = time.process_time()
+    for _ in range(repeat):
+        environ = EnvironBuilder(headers=headers).get_environ()
+        app_iter, status, response_headers = run_wsgi_app(middleware, environ)
+        size = sum(len(chunk) for chunk in app_iter)
+    cpu = (time.process_time() - start) / repeat * 1000
+    return size, cpu, response_headers.get('Content-Encoding') or 'identity'
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    encodings = ['gzip'] + (['br'] if _brotli() else [])
+
+    with app.test_request_context():
+        routes = [
+            ('/dashboard/finance', 'text/html', finance_page(students)),
+            ('/dashboard/teacher', 'text/html', teacher_page(students)),
+            ('/api/pending-approvals', 'application/json', pending_approvals(students)),
+            ('/api/export/financial', 'text/csv', finance_csv(students)),
+            ('/api/generate-clearance-pdf', 'application/pdf', certificate_pdf(students)),
+        ]
+
+    print(f"Students: {students}" + ('' if _brotli() else "  (brotli not installed: gzip only)"))
+    print(f"{'route':30}{'encoding':>10}{'bytes':>11}{'saved':>9}{'CPU / resp':>13}")
+    for route, mimetype, body in routes:
+        plain, _, _ = measure(body, mimetype, None)
+        print(f"{route:30}{'identity':>10}{plain:11d}{'':>9}{'':>13}")
+        for encoding in encodings:
+            size, cpu, used = measure(body, mimetype, encoding)
+            saved = f"{(1 - size / plain) * 100:.0f}%"
+            print(f"{'':30}{used:>10}{size:11d}{saved:>9}{cpu:10.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: how long `import app` takes, against a budget.
+
+Every gunicorn worker (and every `flask` CLI command) pays this on start.
+Runs `python -X importtime -c "import app"` a few times in fresh
+interpreters, reports the median total and the slowest modules app.py
+imports directly, and exits non-zero when the total is over budget or
+when a module that should only load on first use (supabase-py, ReportLab,
+Pillow) was imported.
+
+Also reports what the deferred Supabase client costs on first use, which
+gunicorn workers pay in post_worker_init.
+
+No .env is needed: placeholder Supabase settings are used and no requests
+are made.
+
+Usage:
+    python benchmarks/import_time.py [budget_ms]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_KEY = 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.x'
+
+# Over this, importing the app has regressed (Flask itself is about half of it)
+IMPORT_BUDGET_MS = 400
+# Only imported when first needed
+DEFERRED_MODULES = ['supabase', 'reportlab', 'PIL']
+RUNS = 5
+
+CHECK_DEFERRED = f"import sys, app; print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+FIRST_CLIENT = "import time, app; t = time.perf_counter(); app.supabase.get(); print((time.perf_counter() - t) * 1000)"
+
+
+def run(args, scratch):
+    env = dict(
+        os.environ, SUPABASE_URL='https://example.supabase.co', SUPABASE_KEY=FAKE_KEY, SUPABASE_ANON_KEY=FAKE_KEY,
+        JOBS_DB_PATH=os.path.join(scratch, 'jobs.sqlite3'), EVENTS_DB_PATH=os.path.join(scratch, 'events.sqlite3'),
+        CERTIFICATE_CACHE_DIR=os.path.join(scratch, 'certificates')
+    )
+    env.pop('PYTHONDONTWRITEBYTECODE', None)  # measure with warm .pyc files, as a deployed app runs
+    result = subprocess.run([sys.executable] + args, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return result.stdout, result.stderr
+
+
+def parse_importtime(output):
+    """
+    Cumulative microseconds for `app` and for each module it imports directly.
+
+    -X importtime prints a module after everything it imported, indented
+    one level deeper than its importer.
+    """
+    total, children, pending = None, {}, {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if depth == 1:
+            pending[name] = int(cumulative)
+        elif depth == 0:
+            if name == 'app':
+                total, children = int(cumulative), pending
+            pending = {}
+    return total, children
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_BUDGET_MS
+
+    with tempfile.TemporaryDirectory() as scratch:
+        run(['-c', 'import app'], scratch)  # warm-up: writes .pyc files
+        totals, modules = [], {}
+        for _ in range(RUNS):
+            total, children = parse_importtime(run(['-X', 'importtime', '-c', 'import app'], scratch)[1])
+            totals.append(total / 1000)
+            for name, cumulative in children.items():
+                modules.setdefault(name, []).append(cumulative / 1000)
+        deferred = [m for m in run(['-c', CHECK_DEFERRED], scratch)[0].strip().split(',') if m]
+        first_client = float(run(['-c', FIRST_CLIENT], scratch)[0])
+
+    median = statistics.median(totals)
+    print(f"import app: {median:.0f} ms (median of {RUNS}, budget {budget:g} ms)")
+    print("slowest direct imports:")
+    slowest = sorted(modules.items(), key=lambda item: -statistics.median(item[1]))[:8]
+    for name, times in slowest:
+        print(f"  {name:28}{statistics.median(times):8.1f} ms")
+    print(f"Supabase client on first use: {first_client:.0f} ms")
+
+    failed = False
+    if median > budget:
+        print(f"FAIL: import app took {median:.0f} ms, over the {budget:g} ms budget")
+        failed = True
+    if deferred:
+        print(f"FAIL: imported at startup instead of on first use: {', '.join(deferred)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
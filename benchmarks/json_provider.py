@@ -0,0 +1,117 @@
+"""
+Benchmark: JSON serialization, standard library vs orjson.
+
+Encodes API payloads with synthetic data at a realistic school size
+(student search, a student's financial record, pending approvals with
+embedded student and subject objects, a JSON finance export) through both
+JSON providers, and reports time per response and output size.
+
+Importing the app needs the usual .env (SUPABASE_URL etc.), but no requests
+are made to Supabase.
+
+Usage:
+    python benchmarks/json_provider.py [students]
+"""
+
+import hashlib
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from json_provider import FastJSONProvider, StdlibJSONProvider, _orjson, iter_json_array  # noqa: E402
+from spreadsheets import FINANCE_EXPORT_COLUMNS  # noqa: E402
+
+FIRST_NAMES = ['Ama', 'Kofi', 'Nana', 'Yaw', 'Efua', 'Kwame', 'Abena', 'Kojo', 'Akosua', 'Fiifi', 'Esi', 'Kwesi']
+LAST_NAMES = ['Mensah', 'Owusu', 'Boateng', 'Asante', 'Osei', 'Addo', 'Appiah', 'Danso', 'Ofori', 'Amoah']
+SUBMITTED = datetime(2026, 6, 1, 8, 0, 0)
+
+
+def sample_student(i):
+    rng = random.Random(i)
+    return {'student_id': f'ST{i:04d}', 'first_name': rng.choice(FIRST_NAMES),
+            'last_name': f"{rng.choice(LAST_NAMES)}-{rng.choice(LAST_NAMES)}", 'year_group': 1 + i % 2}
+
+
+def finance_row(i):
+    rng = random.Random(-i)
+    tuition = rng.randrange(80, 160) * 100.0
+    paid = min(tuition, rng.randrange(0, 170) * 100.0)
+    return dict(sample_student(i), tuition_due=tuition, amount_paid=paid, balance=tuition - paid,
+                status='Paid' if paid >= tuition else 'Partial')
+
+
+def search_students(students):
+    return [sample_student(i) for i in range(min(students, 50))]
+
+
+def pending_approvals(students):
+    def digest(i):
+        return hashlib.sha256(str(i).encode()).hexdigest()
+
+    books = [{
+        'book_id': f'BK{i}', 'book_name': 'Advanced Mathematics for Senior Secondary', 'approval_status': 'pending',
+        'submitted_at': SUBMITTED + timedelta(minutes=i), 'student_id': sample_student(i),
+        'subject_id': {'subject_id': 'MATH', 'subject_name': 'Mathematics'},
+        'image_proof_url': f'https://example.supabase.co/storage/v1/object/public/clearance-proofs/books/ST{i:04d}/{digest(i)}.jpg',
+        'image_thumbnail_url': f'https://example.supabase.co/storage/v1/object/public/clearance-proofs/books/ST{i:04d}/{digest(i)}.thumbnail.jpg'
+    } for i in range(students // 4)]
+    return {'success': True, 'books': books, 'materials': [], 'cursor': SUBMITTED}
+
+
+def student_financial(_students):
+    row = finance_row(7)
+    # One Decimal and one datetime, to go through the default= hook
+    record = {'student_id': 'ST0007', 'tuition_due': Decimal(str(row['tuition_due'])), 'amount_paid': row['amount_paid'],
+              'balance': row['balance'], 'updated_at': SUBMITTED}
+    return {'financial_record': record, 'financial_overview': dict(record, status=row['status'], percentage_paid=Decimal('62.5'))}
+
+
+def time_response(provider, payload, repeat):
+    """ms per response and body size through provider.response()."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = provider.response(payload)
+    return (time.perf_counter() - start) / repeat * 1000, len(response.get_data())
+
+
+def time_export(students, fast, repeat):
+    """ms per finance export streamed as a JSON array, and its size."""
+    rows = [{column: row[column] for column in FINANCE_EXPORT_COLUMNS} for row in map(finance_row, range(students))]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        size = sum(len(chunk) for chunk in iter_json_array(rows, fast=fast))
+    return (time.perf_counter() - start) / repeat * 1000, size
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = 20
+    if not _orjson():
+        print("orjson is not installed: both columns use the json module")
+
+    providers = [('stdlib', StdlibJSONProvider(app)), ('orjson', FastJSONProvider(app))]
+    payloads = [
+        ('/api/search/students', search_students(students)),
+        ('/api/student/<id>/financial', student_financial(students)),
+        ('/api/pending-approvals', pending_approvals(students)),
+    ]
+
+    print(f"Students: {students}")
+    print(f"{'route':34}{'bytes':>10}{'stdlib':>12}{'orjson':>12}{'speedup':>10}")
+    with app.app_context():
+        for route, payload in payloads:
+            (slow, size), (fast, _) = (time_response(provider, payload, repeat) for _, provider in providers)
+            print(f"{route:34}{size:10d}{slow:9.2f} ms{fast:9.2f} ms{slow / fast:9.1f}x")
+
+    (slow, size), (fast, _) = time_export(students, False, repeat), time_export(students, True, repeat)
+    print(f"{'/api/export/financial?format=json':34}{size:10d}{slow:9.2f} ms{fast:9.2f} ms{slow / fast:9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Load test: requests per second per gunicorn worker, sync vs gthread vs gevent.
+
+Starts a stand-in for Supabase that answers every auth and PostgREST call
+after a fixed delay (the network round trip that dominates real requests),
+then runs one gunicorn worker per mode with gunicorn.conf.py against it and
+hammers an authenticated JSON endpoint (/api/student/<id>/financial: one
+auth check plus three queries) from concurrent clients.
+
+No real Supabase project or .env is needed. gevent is skipped if it isn't
+installed.
+
+Usage:
+    python benchmarks/worker_load.py [clients] [seconds] [latency_ms]
+"""
+
+import http.client
+import importlib.util
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATH = '/api/student/ST0001/financial'
+FAKE_KEY = 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.x'
+
+USER = {'id': 'u1', 'aud': 'authenticated', 'role': 'authenticated', 'email': 'ama@example.com',
+        'app_metadata': {}, 'user_metadata': {}, 'created_at': '2026-01-01T00:00:00Z'}
+ROW = {'student_id': 'ST0001', 'auth_uid': 'u1', 'first_name': 'Ama', 'last_name': 'Mensah', 'year_group': 1,
+       'tuition_due': 12000.0, 'amount_paid': 6000.0, 'balance': 6000.0, 'status': 'Partial'}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_fake_supabase(latency):
+    """Answer /auth/v1/user with a user and any PostgREST read with one row, after `latency` seconds."""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out as separate writes; without this, Nagle's
+        # algorithm adds a delayed-ACK wait to every call
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps(USER if self.path.startswith('/auth/') else [ROW]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_gunicorn(worker_class, supabase_url, port, scratch):
+    env = dict(
+        os.environ, SUPABASE_URL=supabase_url, SUPABASE_KEY=FAKE_KEY, SUPABASE_ANON_KEY=FAKE_KEY,
+        PORT=str(port), WEB_CONCURRENCY='1', GUNICORN_WORKER_CLASS=worker_class,
+        JOBS_DB_PATH=os.path.join(scratch, f'jobs-{worker_class}.sqlite3'),
+        EVENTS_DB_PATH=os.path.join(scratch, f'events-{worker_class}.sqlite3'),
+        CERTIFICATE_CACHE_DIR=os.path.join(scratch, 'certificates')
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            request(port)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+
+
+def request(port, connection=None):
+    connection = connection or http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    connection.request('GET', PATH, headers={'Cookie': 'supabase-token=token'})
+    response = connection.getresponse()
+    response.read()
+    if response.status != 200:
+        raise RuntimeError(f"{PATH} returned {response.status}")
+    return connection
+
+
+def run_load(port, clients, seconds):
+    """Per-request latencies from `clients` looping for `seconds`, and the wall time taken."""
+    started = time.time()
+    stop_at = started + seconds
+
+    def client():
+        latencies = []
+        connection = None
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                connection = request(port, connection)
+            except (OSError, http.client.HTTPException):
+                connection = None
+                continue
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    with ThreadPoolExecutor(clients) as pool:
+        latencies = sorted(sum(pool.map(lambda _: client(), range(clients)), []))
+    # Requests still in flight at stop_at finish (and count) after it
+    return latencies, time.time() - started
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    latency = (float(sys.argv[3]) if len(sys.argv) > 3 else 25) / 1000
+
+    modes = ['sync', 'gthread']
+    if importlib.util.find_spec('gevent'):
+        modes.append('gevent')
+    else:
+        print("gevent is not installed: skipping gevent workers")
+
+    supabase_url = start_fake_supabase(latency)
+    print(f"1 worker per mode, {clients} clients, {seconds:g}s each, {latency * 1000:g} ms per Supabase call")
+    print(f"{'worker class':16}{'requests':>10}{'req/s':>10}{'p50':>10}{'p95':>10}")
+    with tempfile.TemporaryDirectory() as scratch:
+        for worker_class in modes:
+            port = free_port()
+            process = start_gunicorn(worker_class, supabase_url, port, scratch)
+            try:
+                latencies, elapsed = run_load(port, clients, seconds)
+            finally:
+                process.send_signal(signal.SIGINT)  # quick shutdown
+                process.wait()
+            if not latencies:
+                print(f"{worker_class:16}{'no requests completed':>40}")
+                continue
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000
+            print(f"{worker_class:16}{len(latencies):10d}{len(latencies) / elapsed:10.1f}{p50:7.0f} ms{p95:7.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
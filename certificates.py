@@ -0,0 +1,847 @@
+"""
+Eclari Clearance Certificates
+
+Rendering and caching of the PDF clearance certificate students download
+once they are fully cleared.
+
+A certificate only depends on the student's clearance state (their details,
+books, materials and finance), so rendered PDFs are kept in a small on-disk
+store keyed by student_id plus a hash of that state. Repeat downloads are
+served straight from the store, and the hash doubles as the HTTP ETag.
+Whenever one of the student's items changes the hash changes too, and the
+mutation endpoints also drop the student's stored certificates explicitly.
+"""
+
+import os
+import re
+import json
+import glob
+import uuid
+import zlib
+import hashlib
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from textwrap import wrap
+
+# Bump this whenever the certificate layout changes so stored PDFs are re-rendered
+CERTIFICATE_LAYOUT_VERSION = 2
+
+
+# ===== CLEARANCE STATE HASHING =====
+
+def clearance_state_hash(student, books, materials, financial):
+    """
+    Hash everything that appears on (or decides) a student's certificate.
+
+    Args:
+        student (dict): Student record
+        books (list): The student's book records
+        materials (list): The student's material records
+        financial (dict): Financial overview, or None
+
+    Returns:
+        str: Short hex digest identifying this clearance state
+    """
+    state = {
+        'layout': CERTIFICATE_LAYOUT_VERSION,
+        'student': [
+            student.get('student_id'),
+            student.get('first_name'),
+            student.get('last_name'),
+            student.get('year_group')
+        ],
+        'books': sorted(
+            [str(b.get('book_id')), bool(b.get('returned')), b.get('approval_status')]
+            for b in books
+        ),
+        'materials': sorted(
+            [str(m.get('material_id')), bool(m.get('returned')), m.get('approval_status')]
+            for m in materials
+        ),
+        'financial': financial.get('tuition_due', 0) if financial else None
+    }
+    encoded = json.dumps(state, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+# ===== CERTIFICATE STORE =====
+
+class CertificateStore:
+    """
+    On-disk store of rendered certificates, shared by all gunicorn workers
+    on the same machine.
+
+    Files are named ``<student_id>_<state_hash>.pdf``; a student only ever
+    has one stored certificate, older states are removed on write.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv(
+            'CERTIFICATE_CACHE_DIR',
+            os.path.join(tempfile.gettempdir(), 'eclari-certificates')
+        )
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _safe_id(self, student_id):
+        # Student IDs come from the URL, never let them escape the store directory
+        return re.sub(r'[^A-Za-z0-9_-]', '_', str(student_id))
+
+    def _path(self, student_id, state_hash):
+        return os.path.join(self.directory, f"{self._safe_id(student_id)}_{state_hash}.pdf")
+
+    def get(self, student_id, state_hash):
+        """Return the stored PDF bytes for this state, or None on a miss."""
+        try:
+            with open(self._path(student_id, state_hash), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Error reading stored certificate: {e}")
+            return None
+
+    def put(self, student_id, state_hash, pdf_data):
+        """Store a rendered PDF, replacing any certificate for an older state."""
+        try:
+            self.invalidate(student_id)
+            path = self._path(student_id, state_hash)
+            # Write to a temp file first so other workers never see a half-written PDF
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pdf_data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error storing certificate: {e}")
+
+    def invalidate(self, student_id):
+        """Remove every stored certificate for a student."""
+        if not student_id:
+            return
+        pattern = os.path.join(self.directory, f"{glob.escape(self._safe_id(student_id))}_*.pdf")
+        for path in glob.glob(pattern):
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Another worker got there first
+
+    def get_or_render(self, snapshot, state_hash):
+        """Return the stored certificate for this state, rendering it on a miss."""
+        student_id = snapshot['student']['student_id']
+        pdf_data = self.get(student_id, state_hash)
+        if pdf_data is None:
+            pdf_data = render_clearance_certificate(snapshot['student'], snapshot['books'], snapshot['materials'])
+            self.put(student_id, state_hash, pdf_data)
+        return pdf_data
+
+
+# ===== ISSUING =====
+
+class CertificateUnavailable(Exception):
+    """A certificate can't be issued for this student (not found / not cleared)."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def is_certificate_eligible(snapshot):
+    """
+    Check a clearance snapshot against the certificate rules: 100% clearance
+    and nothing owed to finance.
+
+    Returns:
+        tuple: (eligible: bool, reason: str or None)
+    """
+    percentage = snapshot['clearance_percentage']
+    if percentage < 100:
+        return False, f'Student has not completed clearance yet ({percentage}% complete)'
+    financial = snapshot['financial']
+    if financial and financial.get('tuition_due', 0) > 0:
+        return False, f'Student has outstanding balance of ${financial["tuition_due"]:.2f}. Financial clearance required.'
+    return True, None
+
+
+def load_certificate_state(student_id):
+    """
+    Load a student's clearance data and check they can get a certificate.
+
+    Returns:
+        tuple: (snapshot dict, clearance state hash)
+
+    Raises:
+        CertificateUnavailable: Student missing or not fully cleared
+    """
+    from supabase_client import get_student_clearance_snapshot
+
+    snapshot = get_student_clearance_snapshot(student_id)
+    if not snapshot:
+        raise CertificateUnavailable('Student not found', 404)
+    eligible, reason = is_certificate_eligible(snapshot)
+    if not eligible:
+        raise CertificateUnavailable(reason, 400)
+    state_hash = clearance_state_hash(
+        snapshot['student'], snapshot['books'], snapshot['materials'], snapshot['financial']
+    )
+    return snapshot, state_hash
+
+
+def certificate_filename(student):
+    return f"clearance_certificate_{student['student_id']}_{datetime.now().strftime('%Y%m%d')}.pdf"
+
+
+# ===== PDF RENDERING =====
+# The certificate is split into a static layer (branding, rules, status box,
+# table frame, statement, signature lines, stamp area, notices, watermark) and
+# a small per-student layer (names, IDs, counts, dates). The static layer is
+# rendered once per process and every certificate only generates its overlay
+# and merges it onto that template page (see TEMPLATE + OVERLAY below).
+
+CERTIFICATE_STATEMENT = (
+    "This is to certify that the above-named student has successfully completed "
+    "all clearance requirements and has returned all books, materials, and equipment "
+    "issued during their academic period."
+)
+
+BREAKDOWN_HEADER = ['Category', 'Total Items', 'Cleared Items', 'Status']
+BREAKDOWN_CATEGORIES = ['Books', 'Lab/Sports Materials']
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def _layout():
+    """Page geometry shared by both layers, in points."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+
+    width, height = letter
+    info_y = height - 2.8*inch
+    status_y = info_y - 0.6*inch - 0.6*inch          # after the three info rows
+    breakdown_y = status_y - 1.6*inch
+    table_y = breakdown_y - 0.3*inch
+    statement_y = table_y - 2.3*inch
+    date_y = statement_y - 1.2*inch
+    signature_y = date_y - 0.8*inch
+    stamp_y = signature_y - 1*inch
+    return {
+        'inch': inch, 'width': width, 'height': height,
+        'info_y': [info_y, info_y - 0.3*inch, info_y - 0.6*inch],
+        'status_y': status_y, 'breakdown_y': breakdown_y, 'table_y': table_y,
+        'statement_y': statement_y, 'date_y': date_y,
+        'signature_y': signature_y, 'stamp_y': stamp_y
+    }
+
+
+def _breakdown_rows(books, materials):
+    """Rows of the clearance breakdown table for one student."""
+    books_cleared = sum(1 for b in books if b.get('returned') or b.get('approval_status') == 'approved')
+    materials_cleared = sum(1 for m in materials if m.get('returned'))
+    return [
+        ['Books', str(len(books)), str(books_cleared),
+         '✓' if books_cleared == len(books) else '✗'],
+        ['Lab/Sports Materials', str(len(materials)), str(materials_cleared),
+         '✓' if materials_cleared == len(materials) else '✗']
+    ]
+
+
+def _draw_static_layer(c, layout, rows=None):
+    """
+    Draw everything that is identical on every certificate.
+
+    When ``rows`` is None the breakdown table is drawn with empty value cells
+    (the category column is static) and the positions of those cells are
+    returned so the student layer can fill them in.
+    """
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle
+
+    inch, width, height = layout['inch'], layout['width'], layout['height']
+
+    # ===== HEADER WITH SCHOOL BRANDING =====
+    c.setFont("Helvetica-Bold", 24)
+    c.setFillColor(colors.HexColor("#C8A882"))  # ALA Gold
+    c.drawCentredString(width/2, height - 1*inch, "ECLARI")
+
+    c.setFont("Helvetica", 12)
+    c.setFillColor(colors.black)
+    c.drawCentredString(width/2, height - 1.3*inch, "Student Clearance System")
+
+    # Horizontal line
+    c.setStrokeColor(colors.HexColor("#C8A882"))
+    c.setLineWidth(2)
+    c.line(0.75*inch, height - 1.6*inch, width - 0.75*inch, height - 1.6*inch)
+
+    # ===== CERTIFICATE TITLE =====
+    c.setFont("Helvetica-Bold", 20)
+    c.setFillColor(colors.HexColor("#2563eb"))
+    c.drawCentredString(width/2, height - 2.2*inch, "CLEARANCE CERTIFICATE")
+
+    # ===== STUDENT INFORMATION LABELS =====
+    c.setFillColor(colors.black)
+    c.setFont("Helvetica-Bold", 11)
+    for label, y in zip(["Student Name:", "Student ID:", "Year Group:"], layout['info_y']):
+        c.drawString(1*inch, y, label)
+
+    # ===== CLEARANCE STATUS BOX =====
+    status_y = layout['status_y']
+
+    # Green box for cleared status
+    c.setFillColor(colors.HexColor("#22c55e"))
+    c.setStrokeColor(colors.HexColor("#16a34a"))
+    c.setLineWidth(2)
+    c.roundRect(1*inch, status_y - 0.8*inch, width - 2*inch, 0.8*inch, 0.1*inch, fill=1)
+
+    # White text inside box
+    c.setFillColor(colors.white)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(width/2, status_y - 0.35*inch, "✓ FULLY CLEARED")
+
+    # ===== CLEARANCE BREAKDOWN TABLE =====
+    c.setFillColor(colors.black)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(1*inch, layout['breakdown_y'], "Clearance Breakdown:")
+
+    table_rows = rows or [[category, '', '', ''] for category in BREAKDOWN_CATEGORIES]
+    table = Table([BREAKDOWN_HEADER] + table_rows, colWidths=[2.5*inch, 1.5*inch, 1.5*inch, 1*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2563eb")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('TOPPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor("#f1f5f9")),
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor("#cbd5e1")),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('TOPPADDING', (0, 1), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+    ]))
+
+    # Draw table
+    table_x, table_y = 1*inch, layout['table_y'] - 1.5*inch
+    table.wrapOn(c, width, height)
+    table.drawOn(c, table_x, table_y)
+
+    # Baseline of each value cell, using the same formula reportlab uses for
+    # bottom-aligned 10pt strings with 8pt bottom padding and 12pt leading
+    value_cells = []
+    for row in range(1, len(table_rows) + 1):
+        row_bottom = table_y + table._rowpositions[row + 1]
+        value_cells.append([
+            (table_x + (table._colpositions[col] + table._colpositions[col + 1]) / 2, row_bottom + 8 + 12 - 10)
+            for col in range(1, len(BREAKDOWN_HEADER))
+        ])
+
+    # ===== CERTIFICATION STATEMENT =====
+    c.setFillColor(colors.black)
+    c.setFont("Helvetica-Oblique", 10)
+    y_pos = layout['statement_y']
+    for line in wrap(CERTIFICATE_STATEMENT, width=80):
+        c.drawString(1*inch, y_pos, line)
+        y_pos -= 0.25*inch
+
+    # ===== SIGNATURE SECTION (FIXED) =====
+    c.setFont("Helvetica", 10)
+    c.drawString(1*inch, layout['date_y'], "Date Issued:")
+
+    # Signature lines - FIXED with proper layout
+    signature_y = layout['signature_y']
+
+    # Hall Head Signature (Left)
+    c.setFont("Helvetica", 9)
+    c.setStrokeColor(colors.black)
+    c.setLineWidth(1)
+    c.line(1*inch, signature_y, 3.5*inch, signature_y)  # Signature line
+    c.drawCentredString(2.25*inch, signature_y - 0.25*inch, "Hall Head Signature")
+
+    # Registrar Signature (Right)
+    c.line(4.5*inch, signature_y, 7*inch, signature_y)  # Signature line
+    c.drawCentredString(5.75*inch, signature_y - 0.25*inch, "Registrar Signature")
+
+    # ===== OFFICIAL STAMP AREA =====
+    stamp_y = layout['stamp_y']
+    c.setStrokeColor(colors.HexColor("#94a3b8"))
+    c.setLineWidth(1)
+    c.setDash(3, 3)  # Dashed line
+    c.rect(width/2 - 1*inch, stamp_y - 0.8*inch, 2*inch, 0.8*inch)
+    c.setDash()  # Reset to solid
+
+    c.setFont("Helvetica-Oblique", 8)
+    c.setFillColor(colors.HexColor("#64748b"))
+    c.drawCentredString(width/2, stamp_y - 0.4*inch, "Official School Stamp")
+
+    # ===== FOOTER =====
+    # Security notice (the generated-at line is per student)
+    c.setFont("Helvetica-Oblique", 8)
+    c.drawCentredString(width/2, 0.3*inch, "This document is digitally secured and cannot be edited")
+
+    # ===== WATERMARK (SUBTLE) =====
+    c.saveState()
+    c.setFillColor(colors.HexColor("#e2e8f0"))
+    c.setFillAlpha(0.1)
+    c.setFont("Helvetica-Bold", 60)
+    c.translate(width/2, height/2)
+    c.rotate(45)
+    c.drawCentredString(0, 0, "CLEARED")
+    c.restoreState()
+
+    return value_cells
+
+
+def _student_layer_items(layout, student, books, materials, issued_at, value_cells=None):
+    """
+    The per-student text on a certificate.
+
+    Returns:
+        list: (font, size, hex_color, x, y, text, centred) tuples
+    """
+    inch, width = layout['inch'], layout['width']
+    items = []
+
+    # ===== STUDENT INFORMATION =====
+    values = [
+        f"{student['first_name']} {student['last_name']}",
+        str(student['student_id']),
+        f"Year {student.get('year_group', 'N/A')}"
+    ]
+    for value, y in zip(values, layout['info_y']):
+        items.append(('Helvetica', 11, '#000000', 2.5*inch, y, value, False))
+
+    # ===== CLEARANCE BREAKDOWN VALUES =====
+    if value_cells:
+        for row, cells in zip(_breakdown_rows(books, materials), value_cells):
+            for value, (x, y) in zip(row[1:], cells):
+                items.append(('Helvetica', 10, '#000000', x, y, value, True))
+
+    # ===== DATE ISSUED =====
+    items.append(('Helvetica-Bold', 10, '#000000', 2*inch, layout['date_y'],
+                  issued_at.strftime("%B %d, %Y"), False))
+
+    # ===== FOOTER =====
+    footer_text = f"Generated by Eclari Clearance System | {issued_at.strftime('%Y-%m-%d %H:%M:%S')}"
+    items.append(('Helvetica', 7, '#64748b', width/2, 0.5*inch, footer_text, True))
+    return items
+
+
+def _draw_student_layer(c, items):
+    """Draw the per-student text items onto a reportlab canvas."""
+    from reportlab.lib import colors
+
+    for font, size, color, x, y, text, centred in items:
+        c.setFillColor(colors.HexColor(color))
+        c.setFont(font, size)
+        if centred:
+            c.drawCentredString(x, y, text)
+        else:
+            c.drawString(x, y, text)
+
+
+def render_clearance_certificate_full(student, books, materials, issued_at=None):
+    """
+    Draw the whole certificate on a fresh canvas (no template).
+
+    Used when the template can't be used for a student (e.g. characters
+    outside the standard fonts' encoding), and as the reference for the
+    template benchmark.
+    """
+    from reportlab.pdfgen import canvas
+    from io import BytesIO
+
+    issued_at = issued_at or datetime.now()
+    layout = _layout()
+
+    # ===== PDF SECURITY SETTINGS =====
+    # Note: Encryption removed due to ReportLab API complexity
+    # PDF will be generated without encryption but still read-only for most viewers
+    # owner_password = os.getenv('PDF_OWNER_PASSWORD', 'EclariSecure2024!')
+    # c.setEncrypt('', owner_password)  # Basic encryption without detailed permissions
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(layout['width'], layout['height']))
+    _draw_static_layer(c, layout, rows=_breakdown_rows(books, materials))
+    _draw_student_layer(c, _student_layer_items(layout, student, books, materials, issued_at))
+    c.showPage()
+    c.save()
+
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    return pdf_data
+
+
+# ===== TEMPLATE + OVERLAY =====
+# The template is a normal reportlab PDF of the static layer. A certificate is
+# that PDF, byte for byte, plus a PDF incremental update: one new content
+# stream with the student's text, a replacement page object whose /Contents
+# lists the template stream and the new one, and a small xref/trailer.
+# No PDF library runs per certificate.
+
+# Registered in this order on the template so font resource names are predictable
+_CERTIFICATE_FONTS = ['Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'ZapfDingbats']
+
+# Glyphs reportlab draws from ZapfDingbats instead of the text font
+_DINGBATS = {'✓': b'3', '✗': b'7'}
+
+
+def get_certificate_template():
+    """
+    Render the static layer once per process and index it for overlays.
+
+    Returns:
+        dict: Template PDF bytes plus what's needed to append an update,
+              or None if the template couldn't be built (full renders are used)
+    """
+    global _template
+    with _template_lock:
+        if _template is None:
+            try:
+                _template = _build_certificate_template()
+            except Exception as e:
+                print(f"Error building certificate template, rendering full certificates: {e}")
+                _template = {}
+        return _template or None
+
+
+def _build_certificate_template():
+    from reportlab.pdfgen import canvas
+    from io import BytesIO
+
+    layout = _layout()
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(layout['width'], layout['height']), pageCompression=1)
+    for font in _CERTIFICATE_FONTS:
+        c.setFont(font, 10)
+    # Leave the graphics state exactly as we found it for the overlay stream
+    c.saveState()
+    value_cells = _draw_static_layer(c, layout)
+    c.restoreState()
+    c.showPage()
+    c.save()
+    pdf = buffer.getvalue()
+
+    objects = {int(num): body for num, body in re.findall(rb'(\d+) 0 obj\r?\n(.*?)\r?\nendobj', pdf, re.S)}
+    page_num, page_dict = next(
+        (num, body) for num, body in objects.items()
+        if re.search(rb'/Type /Page\b(?!s)', body)
+    )
+    fonts = {
+        name.decode(): b'/' + alias
+        for body in objects.values()
+        for name, alias in re.findall(rb'/BaseFont /([\w-]+).*?/Name /(F\d+)', body, re.S)
+    }
+    trailer = re.search(rb'trailer\s*<<(.*?)>>\s*startxref\s*(\d+)\s*%%EOF\s*$', pdf, re.S)
+    size = int(re.search(rb'/Size (\d+)', trailer.group(1)).group(1))
+    content_num = size  # the overlay stream becomes the next object number
+
+    page_dict, replaced = re.subn(
+        rb'/Contents (\d+) 0 R', rb'/Contents [ \1 0 R %d 0 R ]' % content_num, page_dict
+    )
+    if not replaced or set(fonts) != set(_CERTIFICATE_FONTS):
+        raise ValueError('unexpected template structure')
+
+    id_match = re.search(rb'/ID\s*(\[<\w+><\w+>\])', trailer.group(1))
+    return {
+        'pdf': pdf if pdf.endswith(b'\n') else pdf + b'\n',
+        'layout': layout,
+        'value_cells': value_cells,
+        'fonts': fonts,
+        'page_num': page_num,
+        'page_dict': page_dict,
+        'content_num': content_num,
+        'trailer': b'/Size %d %s %s %s /Prev %s' % (
+            content_num + 1,
+            re.search(rb'/Root \d+ 0 R', trailer.group(1)).group(0),
+            re.search(rb'/Info \d+ 0 R', trailer.group(1)).group(0),
+            b'/ID ' + id_match.group(1) if id_match else b'',
+            trailer.group(2)
+        )
+    }
+
+
+def _pdf_number(value):
+    return (b'%.2f' % value).rstrip(b'0').rstrip(b'.')
+
+
+def _overlay_stream(template, items):
+    """
+    Turn student layer items into raw PDF text operators.
+
+    Raises UnicodeEncodeError for text the standard fonts can't encode, so
+    the caller can fall back to a full render.
+    """
+    from reportlab.lib import colors
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    ops = []
+    for font, size, color, x, y, text, centred in items:
+        if text in _DINGBATS:
+            font, encoded = 'ZapfDingbats', _DINGBATS[text]
+        else:
+            encoded = text.encode('cp1252')  # WinAnsiEncoding
+        if centred:
+            x -= stringWidth(text, font, size) / 2
+        rgb = colors.HexColor(color)
+        escaped = encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+        ops.append(b'%s %s %s rg BT %s %s Tf 1 0 0 1 %s %s Tm (%s) Tj ET' % (
+            _pdf_number(rgb.red), _pdf_number(rgb.green), _pdf_number(rgb.blue),
+            template['fonts'][font], _pdf_number(size),
+            _pdf_number(x), _pdf_number(y), escaped
+        ))
+    return b'\n'.join(ops)
+
+
+def _append_overlay(template, stream):
+    """Append the overlay stream to the template PDF as an incremental update."""
+    out = bytearray(template['pdf'])
+    stream = zlib.compress(stream)
+
+    content_offset = len(out)
+    out += b'%d 0 obj\n<< /Filter /FlateDecode /Length %d >>\nstream\n' % (template['content_num'], len(stream))
+    out += stream + b'\nendstream\nendobj\n'
+
+    page_offset = len(out)
+    out += b'%d 0 obj\n%s\nendobj\n' % (template['page_num'], template['page_dict'])
+
+    xref_offset = len(out)
+    out += b'xref\n0 1\n0000000000 65535 f \n'
+    out += b'%d 1\n%010d 00000 n \n' % (template['page_num'], page_offset)
+    out += b'%d 1\n%010d 00000 n \n' % (template['content_num'], content_offset)
+    out += b'trailer\n<< %s >>\nstartxref\n%d\n%%%%EOF\n' % (template['trailer'], xref_offset)
+    return bytes(out)
+
+
+def render_clearance_certificate(student, books, materials, issued_at=None):
+    """
+    Draw the clearance certificate for a fully cleared student.
+
+    Only the student's text is generated per certificate; it is appended as
+    an overlay onto the cached static template page.
+
+    Args:
+        student (dict): Student record
+        books (list): The student's book records
+        materials (list): The student's material records
+        issued_at (datetime, optional): Issue timestamp, defaults to now
+
+    Returns:
+        bytes: The rendered PDF
+    """
+    issued_at = issued_at or datetime.now()
+    template = get_certificate_template()
+    if not template:
+        return render_clearance_certificate_full(student, books, materials, issued_at)
+
+    items = _student_layer_items(
+        template['layout'], student, books, materials, issued_at, template['value_cells']
+    )
+    try:
+        stream = _overlay_stream(template, items)
+    except UnicodeEncodeError:
+        # e.g. a name with characters outside WinAnsi - let reportlab handle it
+        return render_clearance_certificate_full(student, books, materials, issued_at)
+    return _append_overlay(template, stream)
+
+
+# ===== BULK GENERATION =====
+# Cohort-wide certificate runs (graduation). Rendering happens in a process
+# pool so reportlab never runs on a web worker, and the run itself is a
+# 'bulk_certificates' job so the request that starts it returns immediately.
+# Progress is persisted next to the ZIP so any gunicorn worker can report it.
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Lazily create the process pool used for certificate rendering."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            workers = int(os.getenv('CERTIFICATE_RENDER_PROCESSES', min(4, os.cpu_count() or 1)))
+            # spawn, not fork: forking a threaded web worker can deadlock the child
+            _render_pool = ProcessPoolExecutor(
+                max_workers=max(1, workers),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _render_pool
+
+
+def reset_render_pool():
+    """Drop a broken pool (e.g. a child was OOM-killed) so the next run starts fresh."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+class BulkCertificateRun:
+    """
+    A single cohort certificate run: progress file plus the ZIP it produces.
+
+    Both live in ``<store>/bulk/`` as ``<run_id>.json`` and ``<run_id>.zip``.
+    The run itself executes as a 'bulk_certificates' job (see jobs.py), so a
+    worker that dies mid-run is noticed and the run retried or failed; the
+    progress file records that job's ID.
+    """
+
+    def __init__(self, store, run_id=None, owner=None):
+        self.store = store
+        self.run_id = run_id or uuid.uuid4().hex
+        self.on_progress = None
+        self.directory = os.path.join(store.directory, 'bulk')
+        os.makedirs(self.directory, exist_ok=True)
+        self.progress = {
+            'run_id': self.run_id,
+            # {'id', 'role'} of the staff member who started it; only they can read it
+            'owner': owner,
+            'status': 'queued',
+            'total': 0,
+            'completed': 0,
+            'rendered': 0,
+            'from_cache': 0,
+            'skipped': [],
+            'error': None,
+            'job_id': None,
+            'created_at': datetime.utcnow().isoformat()
+        }
+
+    def is_owned_by(self, user):
+        """Whether `user` (the session user) started this run."""
+        owner = self.progress.get('owner') or {}
+        return bool(user.get('id')) and owner.get('id') == user.get('id') and owner.get('role') == user.get('role')
+
+    @property
+    def zip_path(self):
+        return os.path.join(self.directory, f"{self.run_id}.zip")
+
+    @property
+    def progress_path(self):
+        return os.path.join(self.directory, f"{self.run_id}.json")
+
+    @classmethod
+    def load(cls, store, run_id):
+        """Read a run's progress from disk, or None if the run doesn't exist."""
+        if not re.fullmatch(r'[0-9a-f]{32}', run_id or ''):
+            return None
+        run = cls(store, run_id)
+        try:
+            with open(run.progress_path) as f:
+                run.progress = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return run
+
+    def save(self):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.progress, f)
+        os.replace(temp_path, self.progress_path)
+
+    def run(self, student_ids, on_progress=None):
+        """
+        Fetch the cohort's clearance data once, render, and write the ZIP.
+
+        Args:
+            student_ids (list): The cohort, in ZIP order
+            on_progress (callable, optional): Called with the progress dict each
+                time it is saved (the job handler uses it as its heartbeat)
+
+        Raises:
+            Exception: Whatever stopped the run, after recording it as failed
+        """
+        from supabase_client import get_clearance_snapshots
+
+        self.on_progress = on_progress
+        try:
+            # A retried run starts over rather than adding to the dead attempt's counts
+            self.progress.update(
+                status='running', total=len(student_ids), completed=0, rendered=0,
+                from_cache=0, skipped=[], error=None
+            )
+            self.save()
+
+            snapshots = get_clearance_snapshots(student_ids)
+            issued_at = datetime.now()
+            pool = get_render_pool()
+            # (student_id, state_hash, cached PDF or render future), in cohort order
+            entries = []
+
+            with zipfile.ZipFile(self.zip_path + '.part', 'w', zipfile.ZIP_DEFLATED) as archive:
+                for student_id in student_ids:
+                    snapshot = snapshots.get(student_id)
+                    if not snapshot:
+                        self._skip(student_id, 'Student not found')
+                        continue
+                    eligible, reason = is_certificate_eligible(snapshot)
+                    if not eligible:
+                        self._skip(student_id, reason)
+                        continue
+
+                    student = snapshot['student']
+                    state_hash = clearance_state_hash(
+                        student, snapshot['books'], snapshot['materials'], snapshot['financial']
+                    )
+                    cached = self.store.get(student_id, state_hash)
+                    if cached is not None:
+                        entries.append((student_id, state_hash, cached))
+                        continue
+
+                    future = pool.submit(
+                        render_clearance_certificate,
+                        student, snapshot['books'], snapshot['materials'], issued_at
+                    )
+                    entries.append((student_id, state_hash, future))
+
+                # Renders run concurrently in the pool, but entries are written
+                # in cohort order so the ZIP lists certificates the way they were asked for
+                for student_id, state_hash, entry in entries:
+                    if isinstance(entry, bytes):
+                        archive.writestr(f"clearance_certificate_{student_id}.pdf", entry)
+                        self.progress['from_cache'] += 1
+                        self._advance()
+                        continue
+                    try:
+                        pdf_data = entry.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        self._skip(student_id, f'Render failed: {e}')
+                        continue
+                    self.store.put(student_id, state_hash, pdf_data)
+                    archive.writestr(f"clearance_certificate_{student_id}.pdf", pdf_data)
+                    self.progress['rendered'] += 1
+                    self._advance()
+
+            os.replace(self.zip_path + '.part', self.zip_path)
+            self.progress['status'] = 'done'
+            self.save()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                reset_render_pool()
+            print(f"Error in bulk certificate run {self.run_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            self.progress['status'] = 'failed'
+            self.progress['error'] = str(e)
+            self.save()
+            raise
+
+    def _skip(self, student_id, reason):
+        self.progress['skipped'].append({'student_id': student_id, 'reason': reason})
+        self._advance()
+
+    def _advance(self):
+        self.progress['completed'] += 1
+        # Don't rewrite the progress file for every single certificate on big cohorts
+        if self.progress['completed'] % 10 == 0 or self.progress['completed'] == self.progress['total']:
+            self.save()
+            if self.on_progress:
+                self.on_progress(self.progress)
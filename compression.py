@@ -0,0 +1,156 @@
+"""
+Eclari Response Compression
+
+WSGI middleware that gzip- or brotli-compresses text responses (HTML, JSON,
+CSV, JavaScript, CSS) for clients that accept it. Dashboards like the finance
+and teacher pages are large, repetitive HTML tables, so they shrink several
+times over.
+
+- The encoding is negotiated from Accept-Encoding. Brotli is used when the
+  optional `brotli` package is installed; otherwise gzip.
+- Small responses (below COMPRESSION_MIN_SIZE) are sent as-is.
+- PDFs, images, ZIPs and anything already encoded are never touched.
+- Streamed responses (NDJSON imports, CSV exports) are compressed chunk by
+  chunk and flushed after each one, so progress still reaches the browser
+  as it happens. Server-sent event streams are left alone.
+- ETags on compressed responses are made weak, since the bytes differ from
+  the uncompressed representation. Conditional GETs compare with
+  If-None-Match using weak comparison, so 304s keep working.
+"""
+
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+# Responses smaller than this aren't worth the CPU or the extra headers
+COMPRESSION_MIN_SIZE = 1024
+# Dynamic responses favour speed: gzip 6 is zlib's default, brotli 4 is
+# roughly as fast with a better ratio
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript', 'text/xml',
+    'application/json', 'application/javascript', 'application/x-ndjson',
+    'application/xml', 'application/manifest+json', 'image/svg+xml'
+}
+
+
+def _brotli():
+    """The brotli module, or None if it isn't installed."""
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def choose_encoding(accept_encoding):
+    """
+    Pick the response encoding from an Accept-Encoding header.
+
+    Returns:
+        str: 'br', 'gzip', or None to send the response uncompressed
+    """
+    if not accept_encoding:
+        return None
+    offered = ['br', 'gzip'] if _brotli() else ['gzip']
+    return parse_accept_header(accept_encoding).best_match(offered)
+
+
+def _mimetype(headers):
+    return headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+
+class _Compressor:
+    """Incremental gzip or brotli compressor with a common interface."""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._brotli = _brotli().Compressor(quality=BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits 16 + MAX_WBITS writes a gzip header and trailer
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._brotli.process(data) if self._brotli else self._zlib.compress(data)
+
+    def flush(self):
+        """Emit everything compressed so far without ending the stream."""
+        return self._brotli.flush() if self._brotli else self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._brotli.finish() if self._brotli else self._zlib.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """
+    Compress eligible responses from the wrapped WSGI app.
+
+    Install with `app.wsgi_app = CompressionMiddleware(app.wsgi_app)`.
+    """
+
+    def __init__(self, app, min_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            encoding = None
+        state = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            headers = Headers(headers)
+            if encoding and status.startswith('304') and headers.get('ETag', '').startswith('"'):
+                # Match the weak ETag the compressed 200 carried (a 304 may
+                # carry the 200's Content-Type, so check before the type)
+                headers['ETag'] = 'W/' + headers['ETag']
+            if _mimetype(headers) in COMPRESSIBLE_TYPES:
+                # Whether or not this one is compressed, the response depends on Accept-Encoding
+                vary = headers.get('Vary', '')
+                if 'accept-encoding' not in vary.lower():
+                    headers['Vary'] = f"{vary}, Accept-Encoding" if vary else 'Accept-Encoding'
+                if encoding and self._should_compress(status, headers):
+                    state['streaming'] = 'Content-Length' not in headers
+                    del headers['Content-Length']
+                    headers['Content-Encoding'] = encoding
+                    etag = headers.get('ETag')
+                    if etag and not etag.startswith('W/'):
+                        headers['ETag'] = 'W/' + etag
+                    state['compress'] = True
+            return start_response(status, headers.to_wsgi_list(), exc_info)
+
+        body = self.app(environ, compressing_start_response)
+        if not state.get('compress'):
+            return body
+        return self._compress(body, encoding, state['streaming'])
+
+    def _should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        if headers.get('Content-Encoding') or 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def _compress(self, body, encoding, streaming):
+        compressor = _Compressor(encoding)
+        try:
+            for chunk in body:
+                if not chunk:
+                    continue
+                data = compressor.compress(chunk)
+                if streaming:
+                    # Don't hold back a streamed chunk waiting for more input
+                    data += compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            close = getattr(body, 'close', None)
+            if close:
+                close()
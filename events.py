@@ -0,0 +1,308 @@
+"""
+Eclari Live Events
+
+Publish/subscribe for pushing changes to open dashboards over server-sent
+events (/api/events), so staff and students see submissions, approvals and
+clearance changes without reloading or polling.
+
+Each process keeps its own subscribers in memory. Published events are also
+appended to a small SQLite log on local disk (the same approach as the job
+queue), and one pump thread per process tails that log, so an event published
+by any gunicorn worker reaches subscribers connected to every worker. Event
+IDs come from the log, which lets a reconnecting browser resume from its
+Last-Event-ID without missing anything.
+
+Streams are only served where an open connection is cheap: under gevent
+workers, each stream is a greenlet. gthread and sync workers would give up a
+whole thread or process to every open dashboard, so there /api/events
+answers 204 and pages check for changes on a timer instead.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import sqlite3
+import tempfile
+import threading
+
+# How often each process checks the log for events published by other workers
+POLL_INTERVAL_SECONDS = 0.5
+# Events are kept this long for clients resuming with Last-Event-ID
+EVENT_RETENTION_SECONDS = 60 * 60
+# Events buffered per subscriber before a slow client is dropped
+SUBSCRIBER_QUEUE_SIZE = 256
+# Comment lines sent on idle streams so proxies don't close them
+KEEPALIVE_SECONDS = 15
+# Streams end after this long and the browser reconnects (resuming from its
+# Last-Event-ID), so a connection never holds a worker thread indefinitely
+STREAM_MAX_SECONDS = 5 * 60
+
+
+def streams_enabled():
+    """
+    Whether /api/events should hold streams open in this process.
+
+    EVENT_STREAMS=1 or 0 forces it (e.g. 1 for the threaded development
+    server); by default streams are on only once gevent has patched sockets.
+    """
+    setting = os.getenv('EVENT_STREAMS', '')
+    if setting in ('0', '1'):
+        return setting == '1'
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    return bool(gevent_monkey and gevent_monkey.is_module_patched('socket'))
+
+
+def student_channel(student_id):
+    """Channel for events about one student (their items and clearance)."""
+    return f"student:{student_id}"
+
+
+def subject_channel(subject_id):
+    """Channel for proof submissions and reviews in one subject (reviewers listen here)."""
+    return f"subject:{subject_id}"
+
+
+class Subscription:
+    """One open event stream: the channels it listens to and its pending events."""
+
+    def __init__(self, channels):
+        self.channels = set(channels)
+        self.events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def deliver(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # The client isn't keeping up; end its stream so it reconnects and resumes
+            self.closed = True
+
+    def get(self, timeout):
+        """Next event dict, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """
+    In-process pub/sub bridged across gunicorn workers through a SQLite log.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv(
+            'EVENTS_DB_PATH', os.path.join(tempfile.gettempdir(), 'eclari-events.sqlite3')
+        )
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._last_id = None
+        self._started_pid = None
+        self._last_cleanup = 0
+
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    type TEXT NOT NULL,
+                    channels TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS clearance_levels (
+                    student_id TEXT PRIMARY KEY,
+                    percentage INTEGER NOT NULL
+                )
+            ''')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # A fresh connection per operation keeps this safe across threads and forks
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    # ===== PUBLISHING =====
+
+    def publish(self, event_type, channels, data):
+        """
+        Publish an event to every subscriber of any of `channels`, in any worker.
+
+        Args:
+            event_type (str): SSE event name, e.g. 'item_reviewed'
+            channels (list): Channel names (see student_channel/subject_channel)
+            data (dict): JSON-serialisable event body
+
+        Returns:
+            int: The event ID, or None if it couldn't be recorded
+        """
+        channels = [c for c in dict.fromkeys(channels) if c]
+        if not channels:
+            return None
+        conn = self._connect()
+        try:
+            event_id = conn.execute(
+                "INSERT INTO events (type, channels, data, created_at) VALUES (?, ?, ?, ?)",
+                (event_type, json.dumps(channels), json.dumps(data, default=str), time.time())
+            ).lastrowid
+        except Exception as e:
+            print(f"Error publishing {event_type} event: {e}")
+            return None
+        finally:
+            conn.close()
+        # Local subscribers don't have to wait for the next poll
+        self._wakeup.set()
+        self._cleanup()
+        return event_id
+
+    def publish_clearance(self, student_id, percentage):
+        """
+        Publish a 'clearance' event if the student's percentage differs from the
+        last one published.
+
+        Returns:
+            bool: True if an event was published
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT percentage FROM clearance_levels WHERE student_id = ?", (str(student_id),)
+            ).fetchone()
+            if row and row[0] == percentage:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO clearance_levels (student_id, percentage) VALUES (?, ?)",
+                (str(student_id), percentage)
+            )
+        finally:
+            conn.close()
+        self.publish('clearance', [student_channel(student_id)], {
+            'student_id': student_id,
+            'clearance_percentage': percentage
+        })
+        return True
+
+    # ===== SUBSCRIBING =====
+
+    def subscribe(self, channels, last_event_id=None):
+        """
+        Start receiving events for `channels`.
+
+        Args:
+            channels (list): Channel names to listen to
+            last_event_id (int, optional): Also replay logged events after this ID
+
+        Returns:
+            Subscription: Call unsubscribe() with it when the stream ends
+        """
+        self.start()
+        subscription = Subscription(channels)
+        with self._lock:
+            if last_event_id is not None:
+                # Replay up to where the pump has got to; it delivers everything after
+                for event in self._read_events(last_event_id, self._last_id):
+                    if subscription.channels.intersection(event['channels']):
+                        subscription.deliver(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stream(self, subscription):
+        """
+        Generate the text/event-stream body for a subscription.
+
+        Unsubscribes when the stream ends, whether it timed out, fell behind
+        or the client went away.
+        """
+        try:
+            # Tell the browser how soon to reconnect once the stream ends
+            yield "retry: 3000\n\n"
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while not subscription.closed and time.monotonic() < deadline:
+                event = subscription.get(timeout=KEEPALIVE_SECONDS)
+                yield format_sse(event) if event else ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    # ===== PUMP THREAD =====
+
+    def start(self):
+        """Start this process's pump thread (idempotent, and safe after a fork)."""
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._subscribers = set()
+            # Only events published from now on are pumped; older ones are replay-only
+            self._last_id = self._max_id()
+            threading.Thread(target=self._pump, name="eclari-events", daemon=True).start()
+
+    def _pump(self):
+        while True:
+            self._wakeup.wait(timeout=POLL_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            try:
+                with self._lock:
+                    if not self._subscribers:
+                        # Nobody to deliver to: skip ahead rather than reading the log
+                        self._last_id = self._max_id()
+                        continue
+                    events = self._read_events(self._last_id)
+                    for event in events:
+                        for subscription in self._subscribers:
+                            if subscription.channels.intersection(event['channels']):
+                                subscription.deliver(event)
+                        self._last_id = event['id']
+            except Exception as e:
+                print(f"Error pumping events: {e}")
+
+    def _max_id(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _read_events(self, after_id, up_to_id=None):
+        sql = "SELECT id, type, channels, data FROM events WHERE id > ?"
+        params = [after_id]
+        if up_to_id is not None:
+            sql += " AND id <= ?"
+            params.append(up_to_id)
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql + " ORDER BY id", params).fetchall()
+        finally:
+            conn.close()
+        return [
+            {'id': row[0], 'type': row[1], 'channels': json.loads(row[2]), 'data': json.loads(row[3])}
+            for row in rows
+        ]
+
+    def _cleanup(self):
+        """Drop events past retention (at most once a minute per process)."""
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM events WHERE created_at < ?", (now - EVENT_RETENTION_SECONDS,))
+        except Exception as e:
+            print(f"Error cleaning up events: {e}")
+        finally:
+            conn.close()
+
+
+def format_sse(event):
+    """Encode an event dict as a server-sent events message."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
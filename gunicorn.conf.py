@@ -0,0 +1,66 @@
+"""
+Eclari Gunicorn Settings
+
+Used by `gunicorn -c gunicorn.conf.py app:app` (see render.yaml).
+
+Almost all of a request's time is spent waiting on Supabase over HTTP, so
+workers run many requests at once instead of one:
+
+- gthread (default): WEB_CONCURRENCY processes x GUNICORN_THREADS threads.
+- gevent: GUNICORN_WORKER_CLASS=gevent (pip install gevent). Each worker
+  runs up to GUNICORN_WORKER_CONNECTIONS requests as greenlets. Only this
+  mode serves the long-lived /api/events streams (see events.py). The app is
+  never preloaded in it, so gevent patches the standard library before it is
+  imported.
+- sync: GUNICORN_WORKER_CLASS=sync, one request per process.
+
+benchmarks/worker_load.py compares the three.
+"""
+
+import os
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# gunicorn quietly turns sync workers into gthread ones when threads > 1
+threads = int(os.getenv('GUNICORN_THREADS', 8 if worker_class == 'gthread' else 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 200))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+keepalive = 5
+
+# GUNICORN_PRELOAD=1 imports the app once in the master and forks workers
+# from it (faster respawns, shared memory); post_fork below drops whatever
+# the workers must not inherit
+preload_app = os.getenv('GUNICORN_PRELOAD') == '1' and worker_class != 'gevent'
+
+
+def when_ready(server):
+    """With preloading, import supabase-py once here so workers only build their client."""
+    if preload_app:
+        import supabase  # noqa: F401
+
+
+def post_fork(server, worker):
+    """Drop per-process state inherited from a preloaded master."""
+    if worker_class == 'gevent':
+        # httpx's transport imports trio when it is installed, and trio fails to
+        # import once gevent has patched `select`; the app never uses it
+        sys.modules.setdefault('trio', None)
+    # Only modules the master already imported; importing them here would
+    # run before gevent has patched the standard library
+    supabase_client = sys.modules.get('supabase_client')
+    if supabase_client:
+        # Its HTTP connections belong to the master
+        supabase_client.supabase.reset()
+    certificates = sys.modules.get('certificates')
+    if certificates:
+        certificates.reset_render_pool()
+
+
+def post_worker_init(worker):
+    """Build the worker's Supabase client before it accepts requests."""
+    supabase_client = sys.modules.get('supabase_client')
+    if supabase_client:
+        supabase_client.supabase.get()
+    worker.log.info(f"Eclari worker {worker.pid} ready ({type(worker).__name__})")
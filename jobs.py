@@ -0,0 +1,304 @@
+"""
+Eclari Background Jobs
+
+A small local job queue for slow operations (PDF generation, proof uploads,
+bulk work) so they don't tie up one of the few gunicorn web workers.
+
+Jobs live in a SQLite database on local disk, which every gunicorn worker on
+the machine shares: any worker can enqueue a job, any worker's job threads
+can pick it up, and any worker can answer a status poll. Handlers are plain
+functions registered by name; they receive the job's payload plus the Job so
+they can report progress, and return either a JSON-able result or a
+FileResult for binary output (stored next to the database).
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+import traceback
+from datetime import datetime
+
+# How long a 'running' job may go without finishing before another worker
+# assumes its process died and runs it again
+STALE_AFTER_SECONDS = 15 * 60
+# Finished jobs (and their result files) are cleaned up after this long
+RETENTION_SECONDS = 24 * 60 * 60
+MAX_ATTEMPTS = 3
+
+
+class FileResult:
+    """Binary job output, e.g. a PDF, served back from /api/jobs/<id>/result."""
+
+    def __init__(self, data, mimetype, filename):
+        self.data = data
+        self.mimetype = mimetype
+        self.filename = filename
+
+
+class Job:
+    """A claimed job, as seen by its handler."""
+
+    def __init__(self, queue, job_id, kind, payload, owner=None):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.owner = owner
+
+    def set_progress(self, **progress):
+        """Record handler progress (shown by the status endpoint)."""
+        self.queue._execute(
+            "UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ?",
+            (json.dumps(progress), time.time(), self.id)
+        )
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a per-process pool of worker threads.
+    """
+
+    def __init__(self, path=None, workers=None):
+        self.path = path or os.getenv(
+            'JOBS_DB_PATH', os.path.join(tempfile.gettempdir(), 'eclari-jobs.sqlite3')
+        )
+        self.results_dir = self.path + '.results'
+        self.workers = int(workers if workers is not None else os.getenv('JOB_WORKERS', 2))
+        self.handlers = {}
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._started_pid = None
+        self._lock = threading.Lock()
+
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._execute('PRAGMA journal_mode=WAL')
+        self._execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                owner TEXT,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                progress TEXT,
+                result TEXT,
+                result_file TEXT,
+                result_mimetype TEXT,
+                result_filename TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL
+            )
+        ''')
+        self._execute('CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)')
+
+    # ===== DATABASE HELPERS =====
+
+    def _connect(self):
+        # A fresh connection per operation keeps this safe across threads and forks
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _execute(self, sql, params=()):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).rowcount
+        finally:
+            conn.close()
+
+    def _fetchone(self, sql, params=()):
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute(sql, params).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    # ===== PUBLIC API =====
+
+    def register(self, kind, handler):
+        """Register the function that runs jobs of this kind: handler(payload, job)."""
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, payload, owner=None):
+        """
+        Queue a job and return its ID immediately.
+
+        Args:
+            kind (str): Registered handler name
+            payload (dict): JSON-serialisable arguments for the handler
+            owner (str, optional): Who may read the job's status/result
+
+        Returns:
+            str: The job ID
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"No job handler registered for '{kind}'")
+        self.start()
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, kind, owner, status, payload, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, kind, owner, json.dumps(payload), time.time())
+        )
+        self._wakeup.set()
+        self._cleanup()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Job status for polling.
+
+        Returns:
+            dict: id, kind, owner, status (queued/running/done/failed), progress,
+                  result (JSON results only), has_file, error, timestamps - or None
+        """
+        row = self._fetchone("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not row:
+            return None
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'owner': row['owner'],
+            'status': row['status'],
+            'progress': json.loads(row['progress']) if row['progress'] else None,
+            'result': json.loads(row['result']) if row['result'] else None,
+            'has_file': bool(row['result_file']),
+            'error': row['error'],
+            'created_at': _iso(row['created_at']),
+            'started_at': _iso(row['started_at']),
+            'finished_at': _iso(row['finished_at'])
+        }
+
+    def get_file(self, job_id):
+        """Return (path, mimetype, filename) for a job's binary result, or None."""
+        row = self._fetchone(
+            "SELECT result_file, result_mimetype, result_filename FROM jobs WHERE id = ? AND status = 'done'",
+            (job_id,)
+        )
+        if not row or not row['result_file']:
+            return None
+        return row['result_file'], row['result_mimetype'], row['result_filename']
+
+    # ===== WORKER THREADS =====
+
+    def start(self):
+        """Start this process's job threads (idempotent, and safe after a fork)."""
+        with self._lock:
+            if self._started_pid == os.getpid() or self.workers <= 0:
+                return
+            self._started_pid = os.getpid()
+            self._threads = []
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"eclari-job-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"Error claiming job: {e}")
+                job = None
+            if job is None:
+                # Nothing queued here; other workers' enqueues are picked up on the next poll
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _claim(self):
+        """
+        Atomically take the oldest queued (or abandoned) job.
+
+        Abandoned jobs that have already used up their attempts are marked
+        failed here, so their status stops reading 'running'.
+        """
+        if not self.handlers:
+            return None
+        now = time.time()
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                """UPDATE jobs SET status = 'failed', error = ?, finished_at = ?
+                   WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?""",
+                (f"Abandoned after {MAX_ATTEMPTS} attempts (worker stopped responding)",
+                 now, now - STALE_AFTER_SECONDS, MAX_ATTEMPTS)
+            )
+            row = conn.execute(
+                """SELECT id, kind, owner, payload FROM jobs
+                   WHERE kind IN (%s)
+                     AND (status = 'queued'
+                          OR (status = 'running' AND heartbeat_at < ? AND attempts < ?))
+                   ORDER BY created_at LIMIT 1""" % ','.join('?' * len(self.handlers)),
+                (*self.handlers, now - STALE_AFTER_SECONDS, MAX_ATTEMPTS)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    """UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                       started_at = ?, heartbeat_at = ? WHERE id = ?""",
+                    (now, now, row['id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        if not row:
+            return None
+        return Job(self, row['id'], row['kind'], json.loads(row['payload']), row['owner'])
+
+    def _run(self, job):
+        try:
+            result = self.handlers[job.kind](job.payload, job)
+            if isinstance(result, FileResult):
+                path = os.path.join(self.results_dir, job.id)
+                with open(path, 'wb') as f:
+                    f.write(result.data)
+                self._execute(
+                    """UPDATE jobs SET status = 'done', result_file = ?, result_mimetype = ?,
+                       result_filename = ?, finished_at = ? WHERE id = ?""",
+                    (path, result.mimetype, result.filename, time.time(), job.id)
+                )
+            else:
+                self._execute(
+                    "UPDATE jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ?",
+                    (json.dumps(result, default=str), time.time(), job.id)
+                )
+        except Exception as e:
+            print(f"Error running {job.kind} job {job.id}: {e}")
+            traceback.print_exc()
+            self._execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (str(e), time.time(), job.id)
+            )
+
+    def _cleanup(self):
+        """Drop finished jobs past retention, along with their result files."""
+        cutoff = time.time() - RETENTION_SECONDS
+        conn = self._connect()
+        try:
+            expired = conn.execute(
+                "SELECT id, result_file FROM jobs WHERE finished_at < ?", (cutoff,)
+            ).fetchall()
+            for job_id, result_file in expired:
+                if result_file and os.path.exists(result_file):
+                    os.remove(result_file)
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        except Exception as e:
+            print(f"Error cleaning up jobs: {e}")
+        finally:
+            conn.close()
+
+
+def _iso(timestamp):
+    return datetime.utcfromtimestamp(timestamp).isoformat() if timestamp else None
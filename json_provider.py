@@ -0,0 +1,147 @@
+"""
+Eclari JSON Provider
+
+Flask JSON provider backed by orjson, with the standard library as a
+fallback when orjson isn't installed (or JSON_PROVIDER=stdlib). API
+responses are mostly lists of nested row dicts (students, pending approvals
+with embedded student and subject objects), where orjson is several times
+faster than json.dumps.
+
+Both paths produce the same JSON:
+- datetimes and dates as ISO 8601 strings, Decimals as numbers (matching how
+  PostgREST returns numeric columns), UUIDs and dataclasses as usual
+- keys in insertion order (Flask's default provider sorts them, which costs
+  time and buys nothing for API clients)
+- compact output, indented in debug mode (like Flask's default provider)
+
+iter_json_array() serializes a large list piece by piece, for streaming
+responses that shouldn't hold the whole document in memory.
+"""
+
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, time
+
+from flask.json.provider import DefaultJSONProvider
+
+# Items encoded per batch when streaming a JSON array
+STREAM_BATCH_SIZE = 500
+
+
+def _orjson():
+    """The orjson module, or None if it isn't installed."""
+    try:
+        import orjson
+        return orjson
+    except ImportError:
+        return None
+
+
+def _default(o):
+    """Encode the types neither serializer handles on its own."""
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj, pretty=False, fast=True):
+    """
+    Serialize to UTF-8 JSON bytes.
+
+    Args:
+        obj: Value to encode
+        pretty (bool): Indent the output
+        fast (bool): Use orjson if it is installed
+
+    Returns:
+        bytes: The encoded JSON
+    """
+    orjson = _orjson() if fast else None
+    if orjson:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+    return json.dumps(
+        obj, default=_default, ensure_ascii=False,
+        indent=2 if pretty else None, separators=None if pretty else (',', ':')
+    ).encode('utf-8')
+
+
+def iter_json_array(items, batch_size=STREAM_BATCH_SIZE, fast=True):
+    """
+    Serialize an iterable as one JSON array, a batch of items at a time.
+
+    Each batch is encoded in one call (much cheaper than one call per item)
+    and sent as its own chunk, so a long export never exists as one big
+    string.
+
+    Args:
+        items: Iterable of JSON-serializable values
+        batch_size (int): Items per yielded chunk
+        fast (bool): Use orjson if it is installed
+
+    Yields:
+        bytes: Consecutive pieces of the array
+    """
+    opening = b'['
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield opening + dumps_bytes(batch, fast=fast)[1:-1]
+            opening = b','
+            batch = []
+    if batch:
+        yield opening + dumps_bytes(batch, fast=fast)[1:-1] + b']'
+    else:
+        yield b'[]' if opening == b'[' else b']'
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider using orjson when available.
+
+    Install with `app.json = FastJSONProvider(app)`. Calls with extra
+    json.dumps/json.loads keyword arguments go through the standard library
+    so nothing that relied on them breaks.
+    """
+
+    sort_keys = False
+    use_orjson = True
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return dumps_bytes(obj, fast=self.use_orjson).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        orjson = _orjson() if self.use_orjson else None
+        if orjson and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        data = dumps_bytes(obj, pretty=pretty, fast=self.use_orjson)
+        if pretty:
+            data += b'\n'
+        return self._app.response_class(data, mimetype=self.mimetype)
+
+
+class StdlibJSONProvider(FastJSONProvider):
+    """Same output as FastJSONProvider using only the standard library (JSON_PROVIDER=stdlib)."""
+
+    use_orjson = False
@@ -0,0 +1,395 @@
+"""
+Eclari Spreadsheet Import and Export
+
+Bulk finance updates from the payment spreadsheets the finance office
+receives. Files are parsed one row at a time as they are read and applied
+in chunks: each chunk is one call to the apply_financial_updates SQL
+function, which locks and recomputes every row in the database, instead of
+a read and a write per student. Progress and per-row errors are
+reported as they happen so the browser can show them while the import runs.
+
+Exports go the other way: reports are read from Supabase a page at a time
+and encoded as CSV or XLSX while they stream to the browser, so memory use
+doesn't grow with the size of the school.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# Rows validated and written per round trip
+FINANCE_IMPORT_CHUNK_SIZE = 500
+# Largest finance CSV accepted (well over a whole school's payments)
+FINANCE_IMPORT_MAX_SIZE = 50 * 1024 * 1024
+FINANCE_STATUSES = ['Paid', 'Partial', 'Outstanding']
+
+# Columns each export offers, in their default order
+FINANCE_EXPORT_COLUMNS = [
+    'student_id', 'first_name', 'last_name', 'tuition_due', 'amount_paid', 'balance', 'status'
+]
+HALL_ROSTER_EXPORT_COLUMNS = [
+    'room_number', 'student_id', 'first_name', 'last_name', 'year_group',
+    'room_status', 'hall_clearance_status', 'clearance_percentage'
+]
+CLEARANCE_EXPORT_COLUMNS = [
+    'student_id', 'first_name', 'last_name', 'year_group', 'books', 'books_returned',
+    'materials', 'materials_returned', 'tuition_due', 'clearance_percentage', 'clearance_status'
+]
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'json': 'application/json'
+}
+
+
+def read_csv_rows(stream, required=()):
+    """
+    Lazily parse a CSV upload.
+
+    Header names are matched case-insensitively and surrounding whitespace is
+    ignored. A UTF-8 byte order mark (as written by Excel) is skipped.
+
+    Args:
+        stream: Binary file-like object holding the CSV
+        required (list): Columns the header must contain
+
+    Yields:
+        tuple: (line_number, row dict keyed by lower-case header)
+
+    Raises:
+        ValueError: If the file is empty or a required column is missing
+    """
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = next(reader, None)
+    if not header:
+        raise ValueError('The file is empty')
+    header = [name.strip().lower() for name in header]
+    missing = [name for name in required if name not in header]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue  # blank line
+        yield reader.line_num, {name: value.strip() for name, value in zip(header, row)}
+
+
+def _parse_amount(value):
+    """'$1,250.00' -> 1250.0; '' -> None. Raises ValueError for anything else."""
+    if value in (None, ''):
+        return None
+    amount = float(value.replace('$', '').replace(',', ''))
+    if amount < 0:
+        raise ValueError("amounts can't be negative")
+    return amount
+
+
+def validate_finance_row(row):
+    """
+    Check one import row.
+
+    Returns:
+        tuple: (update dict with student_id and any of amount_paid/balance/status, None)
+               or (None, error message)
+    """
+    student_id = row.get('student_id')
+    if not student_id:
+        return None, 'Missing student_id'
+
+    update = {'student_id': student_id}
+    for column in ('amount_paid', 'balance'):
+        try:
+            amount = _parse_amount(row.get(column))
+        except ValueError:
+            return None, f"Invalid {column}: {row.get(column)!r}"
+        if amount is not None:
+            update[column] = amount
+
+    status = row.get('status')
+    if status:
+        matches = [s for s in FINANCE_STATUSES if s.lower() == status.lower()]
+        if not matches:
+            return None, f"Invalid status {status!r} (use {', '.join(FINANCE_STATUSES)})"
+        update['status'] = matches[0]
+
+    if len(update) == 1:
+        return None, 'Nothing to update (give amount_paid, balance or status)'
+    return update, None
+
+
+def import_finance_csv(stream):
+    """
+    Apply a finance CSV (student_id plus amount_paid, balance and/or status).
+
+    balance, amount_paid and (unless given) status are recomputed from each
+    student's tuition_due by the same locked database update as a single
+    change from the finance dashboard, so concurrent edits aren't lost.
+
+    Args:
+        stream: Binary file-like object holding the CSV
+
+    Yields:
+        dict: {'type': 'error', 'line', 'student_id', 'message'} for rejected rows,
+              {'type': 'progress', 'processed', 'updated', 'failed'} after each chunk,
+              and finally {'type': 'done', ..., 'student_ids': [...]} with every
+              student whose record was written
+    """
+    from supabase_client import apply_financial_updates
+
+    totals = {'processed': 0, 'updated': 0, 'failed': 0}
+    updated_ids = []
+
+    def apply_chunk(chunk):
+        """Write one chunk of validated rows; yields error events for rows that failed."""
+        try:
+            written = apply_financial_updates([update for _, update in chunk])
+        except Exception as e:
+            print(f"Error applying finance import chunk: {e}")
+            for line, update in chunk:
+                totals['failed'] += 1
+                yield {'type': 'error', 'line': line, 'student_id': update['student_id'], 'message': f'Write failed: {e}'}
+            return
+
+        written_ids = {str(row['student_id']) for row in written}
+        for line, update in chunk:
+            if str(update['student_id']) in written_ids:
+                totals['updated'] += 1
+                updated_ids.append(str(update['student_id']))
+            else:
+                totals['failed'] += 1
+                yield {'type': 'error', 'line': line, 'student_id': update['student_id'], 'message': 'Financial record not found'}
+
+    rows = read_csv_rows(stream, required=['student_id'])
+    chunk = []
+    seen = {}
+    while True:
+        try:
+            line, row = next(rows)
+        except StopIteration:
+            break
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            # A bad header or an unreadable file: nothing after this point can be trusted
+            totals['failed'] += 1
+            yield {'type': 'error', 'line': 1 if not totals['processed'] else None, 'student_id': None, 'message': str(e)}
+            break
+        totals['processed'] += 1
+        update, error = validate_finance_row(row)
+        if error is None and update['student_id'] in seen:
+            error = f"student_id already listed on line {seen[update['student_id']]}"
+        if error:
+            totals['failed'] += 1
+            yield {'type': 'error', 'line': line, 'student_id': row.get('student_id'), 'message': error}
+            continue
+        seen[update['student_id']] = line
+        chunk.append((line, update))
+        if len(chunk) >= FINANCE_IMPORT_CHUNK_SIZE:
+            yield from apply_chunk(chunk)
+            chunk = []
+            yield dict(totals, type='progress')
+
+    if chunk:
+        yield from apply_chunk(chunk)
+    yield dict(totals, type='progress')
+    yield dict(totals, type='done', student_ids=updated_ids)
+
+
+# ===== EXPORT =====
+
+def select_columns(available, requested=None):
+    """
+    Resolve a ?columns=a,b,c selection against the columns an export offers.
+
+    Args:
+        available (list): The export's columns, in default order
+        requested (str, optional): Comma-separated names; empty means all
+
+    Returns:
+        list: Columns to write, in the order requested
+
+    Raises:
+        ValueError: If a requested column doesn't exist
+    """
+    if not requested:
+        return list(available)
+    columns = list(dict.fromkeys(name.strip().lower() for name in requested.split(',') if name.strip()))
+    unknown = [name for name in columns if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)} (available: {', '.join(available)})")
+    return columns or list(available)
+
+
+def _csv_cell(value):
+    """CSV text for a value; formula-like strings are neutralised."""
+    if value is None:
+        return ''
+    text = str(value)
+    # A leading =, +, - or @ would run as a formula when the file is opened in Excel
+    if isinstance(value, str) and text[:1] in ('=', '+', '-', '@'):
+        return "'" + text
+    return text
+
+
+def stream_csv(pages, columns):
+    """
+    Encode pages of row dicts as CSV.
+
+    Yields:
+        str: The header, then one chunk of CSV text per page
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(columns)
+    yield flush()
+    for page in pages:
+        for row in page:
+            writer.writerow([_csv_cell(row.get(column)) for column in columns])
+        yield flush()
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# Characters XML 1.0 doesn't allow, even escaped
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '</Relationships>'
+)
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if value is None:
+            cells.append('<c/>')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c><v>{value}</v></c>')
+        else:
+            # Inline strings are never evaluated as formulas, so no escaping beyond XML
+            text = escape(_XML_INVALID.sub('', str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return '<row>' + ''.join(cells) + '</row>'
+
+
+def stream_xlsx(pages, columns, sheet_name='Export'):
+    """
+    Encode pages of row dicts as a single-sheet XLSX workbook.
+
+    The workbook is a ZIP written straight into the response: the sheet XML
+    is compressed a page at a time and nothing is kept once it has been
+    sent. Cells are inline strings and numbers, with no styles, which every
+    spreadsheet program opens.
+
+    Yields:
+        bytes: Pieces of the .xlsx file
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        workbook.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        workbook.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(name=escape(sheet_name[:31])))
+        workbook.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                .encode('utf-8')
+            )
+            sheet.write(_xlsx_row(columns).encode('utf-8'))
+            yield sink.drain()
+            for page in pages:
+                sheet.write(''.join(_xlsx_row([row.get(column) for column in columns]) for row in page).encode('utf-8'))
+                yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def stream_json(pages, columns):
+    """
+    Stream rows as one JSON array of objects with just the selected columns.
+
+    Values keep their JSON types (numbers stay numbers), and the array is
+    encoded a chunk at a time (see json_provider.iter_json_array).
+
+    Args:
+        pages: Iterable of lists of row dicts
+        columns (list): Columns to write (see select_columns)
+
+    Returns:
+        generator: Pieces of the array, as bytes
+    """
+    from json_provider import iter_json_array
+
+    return iter_json_array({column: row.get(column) for column in columns} for page in pages for row in page)
+
+
+def stream_export(pages, columns, export_format='csv', sheet_name='Export'):
+    """
+    Encode an export in the requested format.
+
+    Args:
+        pages: Iterable of lists of row dicts
+        columns (list): Columns to write (see select_columns)
+        export_format (str): 'csv', 'xlsx' or 'json'
+        sheet_name (str): Worksheet name for XLSX
+
+    Returns:
+        generator: Pieces of the file, ready for a streaming response
+    """
+    if export_format == 'xlsx':
+        return stream_xlsx(pages, columns, sheet_name)
+    if export_format == 'json':
+        return stream_json(pages, columns)
+    return stream_csv(pages, columns)
@@ -0,0 +1,51 @@
+-- ============================================================================
+-- ECLARI DATABASE MIGRATION: Atomic Bulk Finance Import
+-- ============================================================================
+-- The finance CSV import (POST /api/import/financial) used to read each
+-- chunk's finance rows, work out the new values in Python and upsert them,
+-- so an edit made from the finance dashboard in between was overwritten.
+-- apply_financial_updates() applies a whole chunk in one call through
+-- apply_financial_update() (sql/migration_finance_update_rpc.sql, run that
+-- first), locking each row as it goes, and returns the updated rows.
+--
+--   p_updates: [{"student_id": "ST001", "amount_paid": 500, "balance": null,
+--                "status": null}, ...]
+--
+-- Students without a finance record are left out of the result. Rows are
+-- locked in student_id order so two imports can't deadlock each other.
+--
+-- Safe to run more than once.
+-- ============================================================================
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION apply_financial_updates(p_updates JSONB)
+RETURNS SETOF finance
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    update_row JSONB;
+    v_student_id finance.student_id%TYPE;
+BEGIN
+    FOR update_row IN
+        SELECT value FROM jsonb_array_elements(p_updates) ORDER BY value->>'student_id'
+    LOOP
+        v_student_id := update_row->>'student_id';
+        RETURN QUERY SELECT * FROM apply_financial_update(
+            v_student_id,
+            (update_row->>'amount_paid')::NUMERIC,
+            (update_row->>'balance')::NUMERIC,
+            update_row->>'status'
+        );
+    END LOOP;
+END;
+$$;
+
+-- Only the backend (service role) applies finance updates
+REVOKE EXECUTE ON FUNCTION apply_financial_updates(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_financial_updates(JSONB) TO service_role;
+
+COMMENT ON FUNCTION apply_financial_updates(JSONB)
+IS 'Apply a chunk of finance import rows, each as one locked apply_financial_update';
+
+COMMIT;
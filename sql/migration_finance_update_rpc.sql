@@ -0,0 +1,76 @@
+-- ============================================================================
+-- ECLARI DATABASE MIGRATION: Atomic Finance Updates
+-- ============================================================================
+-- POST /api/update/financial/<student_id> used to read the student's finance
+-- row, work out balance/amount_paid in Python and write it back: two round
+-- trips, and two finance staff editing the same student at once could
+-- overwrite each other. apply_financial_update() does the whole update in
+-- one call, with the row locked, and returns the new row.
+--
+--   amount_paid given  -> balance = tuition_due - amount_paid
+--   balance given      -> amount_paid = tuition_due - balance
+--   status not given   -> Paid when nothing is owed, Partial after any
+--                         payment, otherwise Outstanding (left alone if
+--                         neither amount was given)
+--
+-- Returns no rows if the student has no finance record.
+--
+-- Safe to run more than once.
+-- ============================================================================
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION apply_financial_update(
+    p_student_id finance.student_id%TYPE,
+    p_amount_paid NUMERIC DEFAULT NULL,
+    p_balance NUMERIC DEFAULT NULL,
+    p_status TEXT DEFAULT NULL
+)
+RETURNS SETOF finance
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    current_row finance%ROWTYPE;
+    new_amount_paid NUMERIC;
+    new_balance NUMERIC;
+BEGIN
+    -- Concurrent updates to the same student wait here instead of racing
+    SELECT * INTO current_row FROM finance WHERE student_id = p_student_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    IF p_amount_paid IS NOT NULL THEN
+        new_amount_paid := p_amount_paid;
+        new_balance := COALESCE(current_row.tuition_due, 0) - p_amount_paid;
+    ELSIF p_balance IS NOT NULL THEN
+        new_amount_paid := COALESCE(current_row.tuition_due, 0) - p_balance;
+        new_balance := p_balance;
+    ELSE
+        new_amount_paid := current_row.amount_paid;
+        new_balance := current_row.balance;
+    END IF;
+
+    RETURN QUERY
+    UPDATE finance
+    SET amount_paid = new_amount_paid,
+        balance = new_balance,
+        status = COALESCE(p_status, CASE
+            WHEN p_amount_paid IS NULL AND p_balance IS NULL THEN current_row.status
+            WHEN new_balance <= 0 THEN 'Paid'
+            WHEN new_amount_paid > 0 THEN 'Partial'
+            ELSE 'Outstanding'
+        END)
+    WHERE student_id = p_student_id
+    RETURNING *;
+END;
+$$;
+
+-- Only the backend (service role) applies finance updates
+REVOKE EXECUTE ON FUNCTION apply_financial_update(finance.student_id%TYPE, NUMERIC, NUMERIC, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_financial_update(finance.student_id%TYPE, NUMERIC, NUMERIC, TEXT) TO service_role;
+
+COMMENT ON FUNCTION apply_financial_update(finance.student_id%TYPE, NUMERIC, NUMERIC, TEXT)
+IS 'Apply a payment or balance adjustment and recompute amount_paid/balance/status in one locked update';
+
+COMMIT;
@@ -0,0 +1,23 @@
+-- ============================================================================
+-- ECLARI DATABASE MIGRATION: Proof Image Thumbnails
+-- ============================================================================
+-- Proof photos are normalized in the background after upload (capped-size
+-- JPEG plus a small thumbnail). image_proof_url is repointed at the
+-- normalized image and the thumbnail URL is stored alongside it, so the
+-- pending-approval screens no longer load full-size phone photos.
+--
+-- Safe to run more than once.
+-- ============================================================================
+
+BEGIN;
+
+ALTER TABLE books
+ADD COLUMN IF NOT EXISTS image_thumbnail_url TEXT;
+
+ALTER TABLE materials
+ADD COLUMN IF NOT EXISTS image_thumbnail_url TEXT;
+
+COMMENT ON COLUMN books.image_thumbnail_url IS 'URL to a small thumbnail of the proof image (set by the background image job)';
+COMMENT ON COLUMN materials.image_thumbnail_url IS 'URL to a small thumbnail of the proof image (set by the background image job)';
+
+COMMIT;
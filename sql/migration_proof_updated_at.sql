@@ -0,0 +1,34 @@
+-- ============================================================================
+-- ECLARI DATABASE MIGRATION: Proof Change Timestamps
+-- ============================================================================
+-- The approval dashboards sync incrementally (GET /api/pending-approvals
+-- ?since=<cursor>): the cursor is the newest proof change or review among a
+-- reviewer's items. submitted_at can't serve as "proof changed" because the
+-- background image job swaps in the normalized image and thumbnail after
+-- the student submitted, and submitted_at must keep the real submission time
+-- (the queue is sorted and labelled by it).
+--
+-- proof_updated_at is set on every upload and again when the image job
+-- finishes. Existing rows start at their submitted_at.
+--
+-- Safe to run more than once.
+-- ============================================================================
+
+BEGIN;
+
+ALTER TABLE books
+ADD COLUMN IF NOT EXISTS proof_updated_at TIMESTAMPTZ;
+
+ALTER TABLE materials
+ADD COLUMN IF NOT EXISTS proof_updated_at TIMESTAMPTZ;
+
+UPDATE books SET proof_updated_at = submitted_at WHERE proof_updated_at IS NULL AND submitted_at IS NOT NULL;
+UPDATE materials SET proof_updated_at = submitted_at WHERE proof_updated_at IS NULL AND submitted_at IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_books_subject_proof_updated ON books(subject_id, proof_updated_at);
+CREATE INDEX IF NOT EXISTS idx_materials_subject_proof_updated ON materials(subject_id, proof_updated_at);
+
+COMMENT ON COLUMN books.proof_updated_at IS 'When the proof image (or its normalized version/thumbnail) last changed';
+COMMENT ON COLUMN materials.proof_updated_at IS 'When the proof image (or its normalized version/thumbnail) last changed';
+
+COMMIT;
@@ -716,7 +716,7 @@
         emptyRow = document.createElement('tr');
         emptyRow.className = 'empty-row';
         emptyRow.innerHTML = `
-          <td colspan="6" style="text-align: center; padding: 60px 20px; color: var(--muted);">
+          <td colspan="7" style="text-align: center; padding: 60px 20px; color: var(--muted);">
             <div style="font-size: 48px; margin-bottom: 16px;">🔍</div>
             <h3 style="margin: 0 0 8px; color: var(--text);">No Results Found</h3>
             <p style="margin: 0;">Try adjusting your search or filter criteria.</p>
@@ -740,38 +740,120 @@
     initializeHallSelects();
   }
 
+  // Hall room updates: the per-row buttons and the bulk toolbar both go through
+  // /api/update/hall-rooms, which answers with the refreshed hall rollup
+  const roomStatusLabels = {
+    clean: ['badge-success', 'Clean & Ready'],
+    needs_attention: ['badge-warning', 'Needs Attention'],
+    pending_inspection: ['badge-neutral', 'Pending Inspection']
+  };
+
+  const applyHallRollup = (data) => {
+    (data.students || []).forEach(student => {
+      const row = document.querySelector(`tr[data-student-id="${student.student_id}"]`);
+      if (!row) return;
+      
+      const [badgeClass, label] = roomStatusLabels[student.room_status] || roomStatusLabels.pending_inspection;
+      const badge = row.querySelector('.room-status-badge');
+      if (badge) {
+        badge.className = `badge room-status-badge ${badgeClass}`;
+        badge.textContent = label;
+      }
+      
+      const status = student.hall_clearance_status || 'pending';
+      row.querySelectorAll('.hall-clearance-buttons button').forEach(button => {
+        const isApprove = button.textContent.includes('Approve');
+        button.classList.remove('button-success', 'button-error', 'button-outline');
+        if (isApprove && status === 'approved') {
+          button.classList.add('button-success');
+        } else if (!isApprove && status === 'rejected') {
+          button.classList.add('button-error');
+        } else {
+          button.classList.add('button-outline');
+        }
+      });
+      
+      // Update the row's data attribute for filtering
+      row.setAttribute('data-status', status);
+    });
+    
+    const summary = data.summary;
+    if (summary) {
+      const setText = (id, value) => {
+        const el = document.getElementById(id);
+        if (el) el.textContent = value;
+      };
+      setText('summaryResidents', summary.residents);
+      setText('summaryHallApproved', summary.hall_clearance.approved);
+      setText('summaryNeedsAttention', summary.room_status.needs_attention);
+      setText('summaryRoomsReady', summary.room_status.clean);
+      setText('summaryFullyCleared', summary.fully_cleared);
+      setText('summaryHallProgress', summary.hall_approved_percentage);
+      setText('summaryAverageClearance', summary.average_clearance);
+    }
+  };
+
+  const submitRoomUpdates = async (rooms) => {
+    const response = await fetch('/api/update/hall-rooms', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ rooms })
+    });
+    const data = await response.json();
+    if (!data.success) {
+      throw new Error(data.message || 'Update failed');
+    }
+    applyHallRollup(data);
+    return data;
+  };
+
   // Update Hall Clearance functionality
-  window.updateHallClearance = function(studentId, status) {
+  window.updateHallClearance = async function(roomId, status) {
     const statusText = status === 'approved' ? 'Approved' : 'Rejected';
     
-    if (window.showNotification) {
-      const message = `Hall clearance ${statusText.toLowerCase()} for student ${studentId}`;
-      window.showNotification(message, status === 'approved' ? 'success' : 'warning');
+    try {
+      const data = await submitRoomUpdates([{ room_id: roomId, hall_clearance_status: status }]);
+      if (data.failed > 0) {
+        showNotification(data.results[0].message || 'Update failed', 'error');
+      } else {
+        showNotification(`Hall clearance ${statusText.toLowerCase()} for room ${roomId}`, status === 'approved' ? 'success' : 'warning');
+      }
+    } catch (error) {
+      console.error('Error updating hall clearance:', error);
+      showNotification('Could not update hall clearance', 'error');
+    }
+  };
+
+  window.toggleSelectAllRooms = function(checked) {
+    document.querySelectorAll('.room-select').forEach(box => {
+      // Only rows the current search/filter shows
+      if (box.closest('tr').style.display !== 'none') {
+        box.checked = checked;
+      }
+    });
+  };
+
+  // Apply the same change (e.g. {room_status: 'clean'}) to every selected room
+  window.bulkUpdateRooms = async function(changes) {
+    const selected = Array.from(document.querySelectorAll('.room-select:checked'));
+    if (selected.length === 0) {
+      showNotification('Select at least one room first', 'error');
+      return;
     }
     
-    // Here you would typically make an API call to update the database
-    console.log(`Updating hall clearance for student ${studentId} to ${status}`);
-    
-    // Update button states
-    const row = document.querySelector(`tr[data-student-name*="${studentId}"]`);
-    if (row) {
-      const buttons = row.querySelectorAll('.hall-clearance-buttons button');
-      buttons.forEach(button => {
-        button.classList.remove('button-success', 'button-error');
-        button.classList.add('button-outline');
-      });
-      
-      // Highlight the selected button
-      const targetButton = Array.from(buttons).find(btn => 
-        btn.textContent.includes(status === 'approved' ? 'Approve' : 'Reject')
-      );
-      if (targetButton) {
-        targetButton.classList.remove('button-outline');
-        targetButton.classList.add(status === 'approved' ? 'button-success' : 'button-error');
+    try {
+      const data = await submitRoomUpdates(selected.map(box => ({ room_id: box.value, ...changes })));
+      if (data.failed > 0) {
+        showNotification(`${data.updated} room(s) updated, ${data.failed} failed`, 'error');
+      } else {
+        showNotification(`${data.updated} room(s) updated`, 'success');
       }
-      
-      // Update the row's data attribute for filtering
-      row.setAttribute('data-status', status);
+      selected.forEach(box => { box.checked = false; });
+      const selectAll = document.getElementById('selectAllRooms');
+      if (selectAll) selectAll.checked = false;
+    } catch (error) {
+      console.error('Error in bulk room update:', error);
+      showNotification('Could not update rooms', 'error');
     }
   };
 
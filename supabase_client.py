@@ -12,8 +12,11 @@ Date: 2025
 """
 
 import os
+import re
+import time
+import tempfile
+import threading
 from dotenv import load_dotenv
-from supabase import create_client
 
 # Load environment variables from .env file
 load_dotenv()
@@ -31,9 +34,62 @@ if not service_key:
 if not anon_key:
     raise ValueError("SUPABASE_ANON_KEY environment variable is not set")
 
+class ServiceClient:
+    """
+    The service-role Supabase client, one per process, shared by its threads.
+
+    Everything uses it like the real client (`supabase.table(...)`); calls
+    are forwarded to a client built for the current process on first use.
+    supabase-py is only imported then, which keeps importing this module
+    (and app.py) cheap; gunicorn workers build their client in
+    post_worker_init, before taking requests.
+
+    Query builders are created per call and httpx connection pools are
+    thread-safe, so one client serves every request thread (or greenlet).
+    Two things still need care, and are handled here:
+
+    - A gunicorn worker forked from a preloaded master must not share the
+      master's HTTP connections, so a new client is built when the PID
+      changes (see also gunicorn.conf.py).
+    - The PostgREST and storage sub-clients are created lazily by
+      supabase-py; they are built up front under a lock so concurrent first
+      requests can't each create their own.
+    """
+
+    def __init__(self, url, key):
+        self._url = url
+        self._key = key
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The real client for this process, created on first use."""
+        client = self._client
+        if client is not None and self._pid == os.getpid():
+            return client
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                # Importing supabase-py takes a few hundred milliseconds
+                from supabase import create_client
+
+                client = create_client(self._url, self._key)
+                client.postgrest, client.storage  # build the lazy sub-clients now
+                self._client, self._pid = client, os.getpid()
+            return self._client
+
+    def reset(self):
+        """Drop this process's client; the next call builds a new one."""
+        with self._lock:
+            self._client = None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
 # Create the Supabase client instance
 # Use service key for server-side operations (database access)
-supabase = create_client(url, service_key)
+supabase = ServiceClient(url, service_key)
 
 # Export these for use in templates and frontend
 # IMPORTANT: Only export the anonymous key to the frontend, never the service key
@@ -314,6 +370,37 @@ def get_all_financial_records():
         print(f"Error getting financial records: {e}")
         return []
 
+def iter_financial_records(page_size=None):
+    """
+    All financial records with student names, one page at a time (for exports).
+
+    Yields:
+        list: Rows with student_id, first_name, last_name, tuition_due,
+              amount_paid, balance and status
+    """
+    pages = _paged(lambda: supabase.table('finance').select('''
+            *,
+            student_id (
+                student_id,
+                first_name,
+                last_name
+            )
+        ''').order('student_id'), page_size)
+    for page in pages:
+        rows = []
+        for record in page:
+            student = record['student_id'] if isinstance(record.get('student_id'), dict) else {}
+            rows.append({
+                'student_id': student.get('student_id', record.get('student_id')),
+                'first_name': student.get('first_name'),
+                'last_name': student.get('last_name'),
+                'tuition_due': record.get('tuition_due'),
+                'amount_paid': record.get('amount_paid'),
+                'balance': record.get('balance'),
+                'status': record.get('status')
+            })
+        yield rows
+
 def get_financial_record(student_id):
     """Get financial record for a specific student"""
     try:
@@ -327,11 +414,65 @@ def update_financial_record(student_id, updates):
     """Update financial record for a student"""
     try:
         result = supabase.table('finance').update(updates).eq('student_id', student_id).execute()
+        _bump_versions(result.data, 'finance')
         return result.data
     except Exception as e:
         print(f"Error updating financial record: {e}")
         return None
 
+def apply_financial_update(student_id, amount_paid=None, balance=None, status=None):
+    """
+    Apply a payment or balance adjustment in one atomic round trip.
+    
+    Calls the apply_financial_update SQL function
+    (sql/migration_finance_update_rpc.sql), which locks the student's row,
+    recomputes amount_paid/balance from tuition_due, sets the status (unless
+    one is given) and returns the new row.
+    
+    Returns:
+        list: The updated row (empty if the student has no finance record),
+              or None if the update failed
+    """
+    try:
+        result = supabase.rpc('apply_financial_update', {
+            'p_student_id': student_id,
+            'p_amount_paid': amount_paid,
+            'p_balance': balance,
+            'p_status': status
+        }).execute()
+        _bump_versions(result.data, 'finance')
+        return result.data or []
+    except Exception as e:
+        print(f"Error applying financial update: {e}")
+        return None
+
+def apply_financial_updates(updates):
+    """
+    Apply many finance updates (as from a CSV import) in one round trip.
+    
+    Calls the apply_financial_updates SQL function
+    (sql/migration_finance_import_rpc.sql), which runs apply_financial_update
+    for each entry, so every row is locked and recomputed in the database
+    rather than read here and written back.
+    
+    Args:
+        updates (list): Dicts with student_id and any of amount_paid, balance, status
+    
+    Returns:
+        list: The updated rows; students without a finance record are left out
+    """
+    if not updates:
+        return []
+    payload = [{
+        'student_id': update['student_id'],
+        'amount_paid': update.get('amount_paid'),
+        'balance': update.get('balance'),
+        'status': update.get('status')
+    } for update in updates]
+    result = supabase.rpc('apply_financial_updates', {'p_updates': payload}).execute()
+    _bump_versions(result.data, 'finance')
+    return result.data or []
+
 # ===============================
 # HALL DATA FUNCTIONS
 # ===============================
@@ -362,6 +503,32 @@ def get_rooms_by_hall(hall_id):
         print(f"Error getting rooms by hall: {e}")
         return []
 
+def update_rooms_bulk(hall_id, room_ids, changes):
+    """
+    Apply the same room_status/hall_clearance_status change to many rooms.
+    
+    Runs one UPDATE ... WHERE room_id IN (...) per chunk of IDs, restricted
+    to the hall so a hall head can't touch another hall's rooms.
+    
+    Args:
+        hall_id (str): The hall head's ID
+        room_ids (list): room_id values
+        changes (dict): Columns to set (room_status and/or hall_clearance_status)
+        
+    Returns:
+        list: The updated rooms (rooms that didn't match are simply absent)
+    """
+    updated = []
+    for chunk in _chunked(list(room_ids)):
+        try:
+            result = supabase.table('rooms').update(changes).in_('room_id', chunk).eq('hall_id', hall_id).execute()
+            _bump_versions(result.data)
+            updated.extend(result.data or [])
+        except Exception as e:
+            # Keep going: rooms in this chunk are reported as not updated
+            print(f"Error bulk updating rooms: {e}")
+    return updated
+
 def get_all_rooms():
     """Get all rooms with student and hall details"""
     try:
@@ -421,10 +588,50 @@ def get_all_materials():
         print(f"Error getting all materials: {e}")
         return []
 
+def get_material_with_student(material_id):
+    """
+    Get one material with its student embedded, shaped like the rows of
+    get_materials_by_subject (for re-rendering a single table row).
+    """
+    try:
+        result = supabase.table('materials').select('''
+            *,
+            student_id (
+                student_id,
+                first_name,
+                last_name
+            )
+        ''').eq('material_id', material_id).execute()
+        return result.data[0] if result.data else None
+    except Exception as e:
+        print(f"Error getting material: {e}")
+        return None
+
+def get_book_with_student(book_id):
+    """
+    Get one book with its student embedded, shaped like the rows of
+    get_books_by_subject (for re-rendering a single table row).
+    """
+    try:
+        result = supabase.table('books').select('''
+            *,
+            student_id (
+                student_id,
+                first_name,
+                last_name,
+                year_group
+            )
+        ''').eq('book_id', book_id).execute()
+        return result.data[0] if result.data else None
+    except Exception as e:
+        print(f"Error getting book: {e}")
+        return None
+
 def update_material_status(material_id, returned):
     """Update material return status"""
     try:
         result = supabase.table('materials').update({'returned': returned}).eq('material_id', material_id).execute()
+        _bump_versions(result.data)
         return result.data
     except Exception as e:
         print(f"Error updating material status: {e}")
@@ -434,6 +641,7 @@ def update_book_status(book_id, returned):
     """Update book return status"""
     try:
         result = supabase.table('books').update({'returned': returned}).eq('book_id', book_id).execute()
+        _bump_versions(result.data)
         return result.data
     except Exception as e:
         print(f"Error updating book status: {e}")
@@ -496,46 +704,62 @@ def calculate_subject_clearance_percentage(student_id, subject_id):
         if not student:
             return 0
         
-        year_group = student.get('year_group', 2)  # Default to Y2 if not set
-        
-        # Get books for this subject
-        books = get_student_books(student_id)
-        subject_books = [book for book in books if book.get('subject_id', {}).get('subject_id') == subject_id]
-        
-        # Get materials for this subject
-        materials = get_student_materials(student_id)
-        subject_materials = [material for material in materials if material.get('subject_id') == subject_id]
-        
-        total_items = len(subject_books) + len(subject_materials)
-        if total_items == 0:
-            return 100  # If no items, consider it cleared
-        
-        # Count cleared items based on year group
-        cleared_count = 0
-        
-        # Books: Y1 uses approval_status OR returned (for testing), Y2 uses returned
-        for book in subject_books:
-            if year_group == 1:
-                # Y1: Check approval_status OR returned (fallback for direct DB testing)
-                if book.get('approval_status') == 'approved' or book.get('returned', False):
-                    cleared_count += 1
-            else:
-                # Y2: Check returned status
-                if book.get('returned', False):
-                    cleared_count += 1
-        
-        # Materials: ALWAYS require physical return (both Y1 and Y2)
-        for material in subject_materials:
-            if material.get('returned', False):
-                cleared_count += 1
-        
-        percentage = (cleared_count / total_items) * 100
-        return round(percentage)
+        return compute_subject_clearance_percentage(
+            student, get_student_books(student_id), get_student_materials(student_id), subject_id
+        )
         
     except Exception as e:
         print(f"Error calculating subject clearance percentage: {e}")
         return 0
 
+def compute_subject_clearance_percentage(student, books, materials, subject_id):
+    """
+    Calculate a subject's clearance percentage from already-fetched data.
+
+    Same rules as calculate_subject_clearance_percentage, without any
+    database calls - the student dashboard works out every subject from one
+    set of books and materials.
+
+    Args:
+        student (dict): Student record (needs year_group)
+        books (list): The student's book records (with subject_id embedded)
+        materials (list): The student's material records
+        subject_id (str): Subject to calculate
+
+    Returns:
+        int: Rounded clearance percentage (0-100)
+    """
+    year_group = student.get('year_group', 2)  # Default to Y2 if not set
+    
+    subject_books = [book for book in books if (book.get('subject_id') or {}).get('subject_id') == subject_id]
+    subject_materials = [material for material in materials if material.get('subject_id') == subject_id]
+    
+    total_items = len(subject_books) + len(subject_materials)
+    if total_items == 0:
+        return 100  # If no items, consider it cleared
+    
+    # Count cleared items based on year group
+    cleared_count = 0
+    
+    # Books: Y1 uses approval_status OR returned (for testing), Y2 uses returned
+    for book in subject_books:
+        if year_group == 1:
+            # Y1: Check approval_status OR returned (fallback for direct DB testing)
+            if book.get('approval_status') == 'approved' or book.get('returned', False):
+                cleared_count += 1
+        else:
+            # Y2: Check returned status
+            if book.get('returned', False):
+                cleared_count += 1
+    
+    # Materials: ALWAYS require physical return (both Y1 and Y2)
+    for material in subject_materials:
+        if material.get('returned', False):
+            cleared_count += 1
+    
+    percentage = (cleared_count / total_items) * 100
+    return round(percentage)
+
 def calculate_subject_clearance_status(student_id, subject_id):
     """Calculate clearance status for a specific subject"""
     try:
@@ -568,72 +792,68 @@ def calculate_overall_clearance_percentage(student_id):
         if not student:
             print(f"[DEBUG] Student not found: {student_id}")
             return 0
-        
-        year_group = student.get('year_group', 2)
-        print(f"[DEBUG] Student {student_id}, Year Group: {year_group}")
-        
+
         # Get all books
         books = get_student_books(student_id)
-        print(f"[DEBUG] Total books: {len(books)}")
-        
+
         # Get ALL materials (not filtered by subject)
         materials = get_student_materials(student_id)
-        print(f"[DEBUG] Total materials: {len(materials)}")
-        
-        # Calculate total items and cleared items
-        total_items = len(books) + len(materials)
-        
+
         # Add financial check (1 item)
         financial = get_student_financial_overview(student_id)
-        if financial:
-            total_items += 1
-            print(f"[DEBUG] Financial overview exists, tuition_due: {financial.get('tuition_due', 0)}")
-        
-        print(f"[DEBUG] Total items to clear: {total_items}")
-        
+
+        return compute_overall_clearance_percentage(student, books, materials, financial)
+
+    except Exception as e:
+        print(f"Error calculating overall clearance percentage: {e}")
+        import traceback
+        traceback.print_exc()
+        return 0
+
+def compute_overall_clearance_percentage(student, books, materials, financial):
+    """
+    Calculate overall clearance percentage from already-fetched data.
+
+    Same rules as calculate_overall_clearance_percentage, but without any
+    database calls - useful when the caller already holds the student's
+    books, materials and financial overview (certificates, batch jobs).
+
+    Args:
+        student (dict): Student record (needs student_id and year_group)
+        books (list): The student's book records
+        materials (list): The student's material records
+        financial (dict): Financial overview, or None if there isn't one
+
+    Returns:
+        int: Rounded clearance percentage (0-100)
+    """
+    try:
+        year_group = student.get('year_group', 2)
+
+        # One item per book and material, plus finance if there's a record
+        total_items = len(books) + len(materials) + (1 if financial else 0)
         if total_items == 0:
-            print("[DEBUG] No items to clear, returning 100%")
             return 100  # No items to clear
         
         cleared_count = 0
         
-        # Count cleared books
+        # Year 1 books also count once their photo proof is approved
         for book in books:
-            book_returned = book.get('returned', False)
-            book_approved = book.get('approval_status') == 'approved'
-            if year_group == 1:
-                if book_approved or book_returned:
-                    cleared_count += 1
-                    print(f"[DEBUG] Book {book.get('book_id')} cleared (approved={book_approved}, returned={book_returned})")
-                else:
-                    print(f"[DEBUG] Book {book.get('book_id')} NOT cleared (approved={book_approved}, returned={book_returned})")
-            else:
-                if book_returned:
-                    cleared_count += 1
-                    print(f"[DEBUG] Book {book.get('book_id')} cleared (returned={book_returned})")
-                else:
-                    print(f"[DEBUG] Book {book.get('book_id')} NOT cleared (returned={book_returned})")
+            if book.get('returned', False) or (year_group == 1 and book.get('approval_status') == 'approved'):
+                cleared_count += 1
         
         # Count cleared materials (ALL materials, regardless of subject)
         for material in materials:
-            material_returned = material.get('returned', False)
-            if material_returned:
+            if material.get('returned', False):
                 cleared_count += 1
-                print(f"[DEBUG] Material {material.get('material_name')} cleared")
-            else:
-                print(f"[DEBUG] Material {material.get('material_name')} NOT cleared")
         
         # Check financial clearance
-        if financial:
-            if financial.get('tuition_due', 0) == 0:
-                cleared_count += 1
-                print(f"[DEBUG] Financial cleared")
-            else:
-                print(f"[DEBUG] Financial NOT cleared (due: ${financial.get('tuition_due', 0)})")
+        if financial and financial.get('tuition_due', 0) == 0:
+            cleared_count += 1
         
-        percentage = (cleared_count / total_items) * 100
-        print(f"[DEBUG] Final: {cleared_count}/{total_items} = {percentage}%")
-        return round(percentage)
+        # Runs once per student in batch paths (hall snapshot, exports, bulk
+        # certificates), so no per-student logging here
+        return round((cleared_count / total_items) * 100)
         
     except Exception as e:
         print(f"Error calculating overall clearance percentage: {e}")
@@ -647,19 +867,284 @@ def calculate_overall_clearance_status(student_id):
     Simpler approach: just check if percentage is 100%
     """
     try:
-        percentage = calculate_overall_clearance_percentage(student_id)
-        
-        if percentage == 100:
-            return 'approved'
-        elif percentage > 0:
-            return 'pending'
-        else:
-            return 'not-started'
+        return overall_clearance_status(calculate_overall_clearance_percentage(student_id))
             
     except Exception as e:
         print(f"Error calculating overall clearance status: {e}")
         return 'not-started'
 
+def get_student_clearance_snapshot(student_id):
+    """
+    Fetch everything that decides a student's overall clearance in one pass.
+
+    calculate_overall_clearance_percentage() and the certificate generator
+    used to fetch the same books/materials/finance rows separately. This
+    loads them once and computes the percentage in memory.
+
+    Args:
+        student_id (str): The student's unique identifier
+
+    Returns:
+        dict: { 'student', 'books', 'materials', 'financial',
+                'clearance_percentage' }, or None if the student doesn't exist
+    """
+    try:
+        student = get_student_by_id(student_id)
+        if not student:
+            return None
+
+        books = get_student_books(student_id)
+        materials = get_student_materials(student_id)
+        financial = get_student_financial_overview(student_id)
+
+        return {
+            'student': student,
+            'books': books,
+            'materials': materials,
+            'financial': financial,
+            'clearance_percentage': compute_overall_clearance_percentage(student, books, materials, financial)
+        }
+    except Exception as e:
+        print(f"Error getting clearance snapshot: {e}")
+        return None
+
+def _stamp_path(name):
+    # Stamp files mark cached data stale for every worker on this machine
+    return os.path.join(tempfile.gettempdir(), f"eclari-{re.sub(r'[^A-Za-z0-9_-]', '_', str(name))}.stamp")
+
+def _read_stamp(name):
+    """Modification time of a stamp file (None if it was never touched)."""
+    try:
+        return os.stat(_stamp_path(name)).st_mtime_ns
+    except OSError:
+        return None
+
+def _touch_stamp(name):
+    """Mark whatever is cached under `name` stale in every worker."""
+    path = _stamp_path(name)
+    try:
+        with open(path, 'a'):
+            os.utime(path)
+    except OSError as e:
+        print(f"Error touching {name} stamp: {e}")
+
+# Versions roll over this often even without a write, so changes made outside
+# the app (e.g. in the Supabase dashboard) still show up within a minute
+DATA_VERSION_MAX_AGE_SECONDS = 60
+
+def get_data_version(*scopes):
+    """
+    Cheap version string for the data behind a response.
+    
+    Every write in this module touches a stamp for each student, subject and
+    hall it affects (and 'finance' for finance writes), so the version
+    changes whenever the underlying rows might have. Reading it is a stat()
+    per scope - no database calls - which makes it suitable for ETags.
+    
+    Args:
+        *scopes: Stamp names, e.g. 'student-ST001', 'subject-SCI', 'hall-H1', 'finance'
+        
+    Returns:
+        str: Changes whenever any of the scopes is written (or the max age passes)
+    """
+    bucket = int(time.time() // DATA_VERSION_MAX_AGE_SECONDS)
+    return ':'.join([str(bucket)] + [str(_read_stamp(scope) or 0) for scope in scopes])
+
+def _bump_versions(rows, *scopes):
+    """Touch the version stamps for written rows (their student, subject and hall) plus `scopes`."""
+    names = set(scopes)
+    for row in rows or []:
+        for column, prefix in (('student_id', 'student'), ('subject_id', 'subject'), ('hall_id', 'hall')):
+            value = row.get(column)
+            if isinstance(value, dict):
+                value = value.get(column)
+            if value:
+                names.add(f"{prefix}-{value}")
+    for name in names:
+        _touch_stamp(name)
+
+def _chunked(values, size=200):
+    """Split a list into chunks small enough for a PostgREST in_() filter."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+# PostgREST caps a response at 1000 rows by default
+EXPORT_PAGE_SIZE = 1000
+
+def _paged(build_query, page_size=None):
+    """
+    Read a query one page at a time with range requests.
+
+    Args:
+        build_query: Callable returning a fresh query builder with a stable
+                     order (a builder can't be reused once ranged)
+        page_size (int, optional): Rows per request (default EXPORT_PAGE_SIZE)
+
+    Yields:
+        list: Each non-empty page of rows
+
+    Raises:
+        Exception: Whatever the client raises; a caller that has already
+                   sent part of a response decides what a failure means
+    """
+    page_size = page_size or EXPORT_PAGE_SIZE
+    start = 0
+    while True:
+        rows = build_query().range(start, start + page_size - 1).execute().data
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+def get_clearance_snapshots(student_ids):
+    """
+    Batch version of get_student_clearance_snapshot for many students.
+
+    Runs one query per table per chunk of IDs instead of four queries per
+    student, then groups the rows in memory. Used for cohort-wide work like
+    bulk certificate generation.
+
+    Args:
+        student_ids (list): Student identifiers
+
+    Returns:
+        dict: student_id -> snapshot dict (students that don't exist are left out)
+
+    Raises:
+        Exception: Whatever the client raises. A partial result would make
+                   students look missing or wrongly cleared, so callers
+                   decide how to fail.
+    """
+    students, books, materials, financials = {}, {}, {}, {}
+    for chunk in _chunked(dict.fromkeys(student_ids)):
+        # A chunk can match more rows than PostgREST returns at once (200
+        # students with 6 books each is 1200 rows), so every table is paged
+        for page in _paged(lambda: supabase.table('students').select('*')
+                           .in_('student_id', chunk).order('student_id')):
+            for row in page:
+                students[row['student_id']] = row
+
+        for page in _paged(lambda: supabase.table('books').select('''
+                *,
+                subject_id (
+                    subject_id,
+                    subject_name
+                )
+            ''').in_('student_id', chunk).order('book_id')):
+            for row in page:
+                books.setdefault(row['student_id'], []).append(row)
+
+        for page in _paged(lambda: supabase.table('materials').select('*')
+                           .in_('student_id', chunk).order('material_id')):
+            for row in page:
+                materials.setdefault(row['student_id'], []).append(row)
+
+        for page in _paged(lambda: supabase.table('student_financial_overview').select('*')
+                           .in_('student_id', chunk).order('student_id')):
+            for row in page:
+                financials.setdefault(row['student_id'], row)
+
+    snapshots = {}
+    for student_id, student in students.items():
+        student_books = books.get(student_id, [])
+        student_materials = materials.get(student_id, [])
+        financial = financials.get(student_id)
+        snapshots[student_id] = {
+            'student': student,
+            'books': student_books,
+            'materials': student_materials,
+            'financial': financial,
+            'clearance_percentage': compute_overall_clearance_percentage(
+                student, student_books, student_materials, financial
+            )
+        }
+    return snapshots
+
+def get_cohort_student_ids(hall_id=None, year_group=None, student_ids=None):
+    """
+    Resolve a cohort (a hall, a year group, or an explicit ID list) to student IDs.
+
+    Args:
+        hall_id (str, optional): Every student with a room in this hall
+        year_group (int, optional): Every student in this year group
+        student_ids (list, optional): Explicit list, returned as-is (de-duplicated)
+
+    Returns:
+        list: Student IDs in the cohort
+    """
+    try:
+        if student_ids:
+            return list(dict.fromkeys(student_ids))
+        if hall_id:
+            build_query = lambda: (supabase.table('rooms').select('student_id')
+                                   .eq('hall_id', hall_id).not_.is_('student_id', 'null').order('student_id'))
+        elif year_group is not None:
+            build_query = lambda: (supabase.table('students').select('student_id')
+                                   .eq('year_group', year_group).order('student_id'))
+        else:
+            return []
+        # Paged: a large cohort is more rows than PostgREST returns at once
+        return [row['student_id'] for page in _paged(build_query) for row in page if row.get('student_id')]
+    except Exception as e:
+        print(f"Error resolving cohort: {e}")
+        return []
+
+def overall_clearance_status(percentage):
+    """'approved' at 100%, 'pending' part way, 'not-started' at 0."""
+    if percentage == 100:
+        return 'approved'
+    elif percentage > 0:
+        return 'pending'
+    return 'not-started'
+
+def iter_clearance_report(hall_id=None, year_group=None, page_size=None):
+    """
+    Overall clearance for a cohort, one page of students at a time (for exports).
+
+    Covers a hall's residents, a year group, or (with neither) every
+    student. Each page's clearance comes from get_clearance_snapshots, so
+    only one page of books, materials and finance rows is held at once.
+
+    Yields:
+        list: Rows with student_id, first_name, last_name, year_group,
+              books, books_returned, materials, materials_returned,
+              tuition_due, clearance_percentage and clearance_status
+    """
+    if hall_id:
+        build_query = lambda: (supabase.table('rooms').select('student_id')
+                               .eq('hall_id', hall_id).not_.is_('student_id', 'null').order('student_id'))
+    elif year_group is not None:
+        build_query = lambda: (supabase.table('students').select('student_id')
+                               .eq('year_group', year_group).order('student_id'))
+    else:
+        build_query = lambda: supabase.table('students').select('student_id').order('student_id')
+
+    for page in _paged(build_query, page_size):
+        student_ids = [row['student_id'] for row in page]
+        snapshots = get_clearance_snapshots(student_ids)
+        rows = []
+        for student_id in student_ids:
+            snapshot = snapshots.get(student_id)
+            if not snapshot:
+                continue
+            student, financial = snapshot['student'], snapshot['financial']
+            rows.append({
+                'student_id': student_id,
+                'first_name': student.get('first_name'),
+                'last_name': student.get('last_name'),
+                'year_group': student.get('year_group'),
+                'books': len(snapshot['books']),
+                'books_returned': sum(1 for b in snapshot['books'] if b.get('returned')),
+                'materials': len(snapshot['materials']),
+                'materials_returned': sum(1 for m in snapshot['materials'] if m.get('returned')),
+                'tuition_due': financial.get('tuition_due', 0) if financial else 0,
+                'clearance_percentage': snapshot['clearance_percentage'],
+                'clearance_status': overall_clearance_status(snapshot['clearance_percentage'])
+            })
+        yield rows
+
 def get_students_by_hall_with_clearance(hall_id):
     """Get students in a hall with their room assignments and hall-specific status"""
     try:
@@ -674,52 +1159,278 @@ def get_students_by_hall_with_clearance(hall_id):
             )
         ''').eq('hall_id', hall_id).execute()
         
-        students_data = []
-        for room in result.data:
-            if room['student_id'] and isinstance(room['student_id'], dict):  # Only include rooms with assigned students
-                student = room['student_id']
-                    
-                students_data.append({
-                    'student_id': student['student_id'],
-                    'first_name': student['first_name'],
-                    'last_name': student['last_name'],
-                    'year_group': student.get('year_group', 'N/A'),
-                    'room_number': room.get('room_id', 'N/A'),
-                    'room_status': room.get('room_status', 'pending_inspection'),
-                    'hall_clearance_status': room.get('hall_clearance_status', 'pending'),
-                    'hall_name': room.get('hall_name', 'Unknown Hall')
-                })
-        
-        return students_data
+        return _hall_residents(result.data)
     except Exception as e:
         print(f"Error getting students by hall: {e}")
         # If there are database issues, return empty list instead of dummy data
         return []
 
+def _hall_residents(rooms):
+    """One row per student from a rooms query with an embedded student_id."""
+    students_data = []
+    for room in rooms:
+        if room['student_id'] and isinstance(room['student_id'], dict):  # Only include rooms with assigned students
+            student = room['student_id']
+                
+            students_data.append({
+                'student_id': student['student_id'],
+                'first_name': student['first_name'],
+                'last_name': student['last_name'],
+                'year_group': student.get('year_group', 'N/A'),
+                'room_number': room.get('room_id', 'N/A'),
+                'room_status': room.get('room_status', 'pending_inspection'),
+                'hall_clearance_status': room.get('hall_clearance_status', 'pending'),
+                'hall_name': room.get('hall_name', 'Unknown Hall')
+            })
+    return students_data
 
-# ===============================
-# YEAR GROUP WORKFLOW FUNCTIONS
-# ===============================
-# These functions support the new Y1/Y2 differentiated clearance workflow
-
-def get_pending_approvals_for_teacher(teacher_id):
+def summarize_hall(students, rooms=None):
     """
-    Get all pending photo proof submissions for a teacher's subjects.
-    Used by teacher dashboard to show Y1 student submissions awaiting approval.
+    Hall-wide rollup for the hall dashboard summary cards.
     
     Args:
-        teacher_id (str): The teacher's unique identifier
+        students (list): Residents as returned in a hall snapshot
+        rooms (list, optional): The hall's rooms, for the room count
         
     Returns:
-        dict: { 'books': [...], 'materials': [...] } with pending items
+        dict: residents, rooms, room_status and hall_clearance counts,
+              hall_approved_percentage, fully_cleared and average_clearance
+              (the last two only count residents with a clearance_percentage)
     """
-    try:
-        # Get teacher's classes to find their subjects
-        teacher_classes = get_teacher_classes(teacher_id)
-        subject_ids = [c['subject_id']['subject_id'] for c in teacher_classes if c.get('subject_id')]
+    room_status = {'clean': 0, 'needs_attention': 0, 'pending_inspection': 0}
+    hall_clearance = {'approved': 0, 'rejected': 0, 'pending': 0}
+    for student in students:
+        status = student.get('room_status') or 'pending_inspection'
+        room_status[status] = room_status.get(status, 0) + 1
+        clearance = student.get('hall_clearance_status') or 'pending'
+        hall_clearance[clearance] = hall_clearance.get(clearance, 0) + 1
+    
+    percentages = [s['clearance_percentage'] for s in students if s.get('clearance_percentage') is not None]
+    residents = len(students)
+    return {
+        'residents': residents,
+        'rooms': len(rooms) if rooms is not None else residents,
+        'room_status': room_status,
+        'hall_clearance': hall_clearance,
+        'hall_approved_percentage': round(hall_clearance['approved'] / residents * 100, 1) if residents else 0,
+        'fully_cleared': sum(1 for p in percentages if p == 100),
+        'average_clearance': round(sum(percentages) / len(percentages)) if percentages else 0
+    }
+
+# Hall snapshots are kept per process for a minute so repeated dashboard
+# loads don't redo the clearance rollup. Hall updates call
+# invalidate_hall_snapshot(), which reaches every worker through a stamp file;
+# residents' overall clearance can otherwise lag by up to the TTL.
+HALL_SNAPSHOT_TTL_SECONDS = 60
+_hall_snapshots = {}
+_hall_snapshots_lock = threading.Lock()
+
+def invalidate_hall_snapshot(hall_id):
+    """Drop the cached snapshot for a hall in every worker."""
+    with _hall_snapshots_lock:
+        _hall_snapshots.pop(hall_id, None)
+    _touch_stamp(f"hall-{hall_id}")
+
+def get_hall_snapshot(hall_id, fresh=False):
+    """
+    Everything the hall dashboard shows, from one rooms query.
+    
+    Rooms (with their residents and the hall head embedded) are read once
+    and both the room list and the student list are derived from them.
+    Each resident's overall clearance comes from get_clearance_snapshots,
+    which is a handful of batched queries for the whole hall rather than
+    several per student.
+    
+    Args:
+        hall_id (str): The hall head's ID
+        fresh (bool): Skip the cache and rebuild the snapshot
         
-        if not subject_ids:
-            return {'books': [], 'materials': []}
+    Returns:
+        dict: { 'hall_info', 'hall_name', 'rooms', 'students', 'summary' }
+    """
+    stamp = _read_stamp(f"hall-{hall_id}")
+    with _hall_snapshots_lock:
+        cached = _hall_snapshots.get(hall_id)
+    if (not fresh and cached and cached['stamp'] == stamp
+            and time.time() - cached['loaded_at'] < HALL_SNAPSHOT_TTL_SECONDS):
+        return cached['snapshot']
+    
+    snapshot = _build_hall_snapshot(hall_id)
+    with _hall_snapshots_lock:
+        _hall_snapshots[hall_id] = {'snapshot': snapshot, 'loaded_at': time.time(), 'stamp': stamp}
+    return snapshot
+
+def iter_hall_roster(hall_id, with_clearance=False, page_size=None):
+    """
+    A hall's residents, one page of rooms at a time (for exports).
+
+    Args:
+        hall_id (str): The hall head's ID
+        with_clearance (bool): Also work out each resident's overall
+                               clearance_percentage (a few batched queries per page)
+
+    Yields:
+        list: Resident rows as in a hall snapshot
+    """
+    pages = _paged(lambda: supabase.table('rooms').select('''
+            *,
+            student_id (
+                student_id,
+                first_name,
+                last_name,
+                year_group
+            ),
+            hall_id (
+                hall_name
+            )
+        ''').eq('hall_id', hall_id).order('room_id'), page_size)
+    for page in pages:
+        for room in page:
+            if isinstance(room.get('hall_id'), dict):
+                room['hall_name'] = room.pop('hall_id').get('hall_name')
+        students = _hall_residents(page)
+        if with_clearance:
+            clearance = get_clearance_snapshots([s['student_id'] for s in students])
+            for student in students:
+                snapshot = clearance.get(student['student_id'])
+                student['clearance_percentage'] = snapshot['clearance_percentage'] if snapshot else None
+        yield students
+
+def _build_hall_snapshot(hall_id):
+    try:
+        rooms = supabase.table('rooms').select('''
+            *,
+            student_id (
+                student_id,
+                first_name,
+                last_name,
+                year_group
+            ),
+            hall_id (
+                hall_id,
+                first_name,
+                last_name,
+                hall_name
+            )
+        ''').eq('hall_id', hall_id).execute().data
+    except Exception as e:
+        print(f"Error getting hall snapshot: {e}")
+        rooms = []
+    
+    # The hall head comes embedded in every room; only an empty hall needs a lookup
+    hall_info = None
+    for room in rooms:
+        if isinstance(room.get('hall_id'), dict):
+            hall_info = room['hall_id']
+            room['hall_id'] = hall_info.get('hall_id')
+    if hall_info is None:
+        hall_info = get_hall_head_by_id(hall_id)
+    
+    students = _hall_residents(rooms)
+    try:
+        clearance = get_clearance_snapshots([s['student_id'] for s in students])
+    except Exception as e:
+        # Still show the hall, just without residents' percentages
+        print(f"Error getting clearance snapshots: {e}")
+        clearance = {}
+    for student in students:
+        snapshot = clearance.get(student['student_id'])
+        student['clearance_percentage'] = snapshot['clearance_percentage'] if snapshot else None
+    
+    return {
+        'hall_info': hall_info,
+        'hall_name': hall_info.get('hall_name') if hall_info else 'Unknown Hall',
+        'rooms': rooms,
+        'students': students,
+        'summary': summarize_hall(students, rooms)
+    }
+
+
+# ===============================
+# YEAR GROUP WORKFLOW FUNCTIONS
+# ===============================
+# These functions support the new Y1/Y2 differentiated clearance workflow
+
+# Teacher -> subject IDs, loaded for every teacher at once from `classes`.
+# Approval routing and authorization look this up on every request, and class
+# assignments rarely change, so each process keeps a copy. It is reloaded
+# after TEACHER_SUBJECTS_TTL_SECONDS, or as soon as any process calls
+# invalidate_teacher_subjects() (which touches a stamp file all workers check).
+TEACHER_SUBJECTS_TTL_SECONDS = 5 * 60
+_teacher_subjects = {'index': None, 'loaded_at': 0, 'stamp': None}
+_teacher_subjects_lock = threading.Lock()
+
+
+def _load_teacher_subject_index():
+    """Read every class's teacher and subject, a page at a time."""
+    index = {}
+    for rows in _paged(lambda: supabase.table('classes').select('teacher_id, subject_id').order('class_id')):
+        for row in rows:
+            if row.get('teacher_id') and row.get('subject_id'):
+                index.setdefault(row['teacher_id'], set()).add(row['subject_id'])
+    return index
+
+
+def invalidate_teacher_subjects():
+    """
+    Drop the cached teacher -> subject index in every worker.
+    
+    Call this after changing class assignments (teacher_id/subject_id on
+    `classes`); the next lookup reloads it.
+    """
+    with _teacher_subjects_lock:
+        _teacher_subjects['index'] = None
+    _touch_stamp('teacher-subjects')
+
+
+def get_teacher_subject_ids(teacher_id):
+    """
+    Get the IDs of the subjects a teacher teaches (via their classes).
+    
+    Served from the cached teacher -> subject index, so this is normally free.
+    
+    Args:
+        teacher_id (str): The teacher's unique identifier
+        
+    Returns:
+        list: subject_id values (may be empty)
+    """
+    stamp = _read_stamp('teacher-subjects')
+    with _teacher_subjects_lock:
+        index = _teacher_subjects['index']
+        if (index is None or stamp != _teacher_subjects['stamp']
+                or time.time() - _teacher_subjects['loaded_at'] > TEACHER_SUBJECTS_TTL_SECONDS):
+            try:
+                index = _load_teacher_subject_index()
+            except Exception as e:
+                print(f"Error loading teacher subjects: {e}")
+                # Keep serving the old index (if any) rather than locking teachers out,
+                # and don't retry on every request while Supabase is unhappy
+                if index is None:
+                    return []
+                _teacher_subjects['loaded_at'] = time.time()
+            else:
+                _teacher_subjects.update(index=index, loaded_at=time.time(), stamp=stamp)
+    return sorted(index.get(teacher_id, ()))
+
+
+def get_pending_approvals_for_teacher(teacher_id):
+    """
+    Get all pending photo proof submissions for a teacher's subjects.
+    Used by teacher dashboard to show Y1 student submissions awaiting approval.
+    
+    Args:
+        teacher_id (str): The teacher's unique identifier
+        
+    Returns:
+        dict: { 'books': [...], 'materials': [...] } with pending items
+    """
+    try:
+        # Only books for subjects this teacher teaches
+        subject_ids = get_teacher_subject_ids(teacher_id)
+        
+        if not subject_ids:
+            return {'books': [], 'materials': []}
         
         # Get books pending approval for these subjects
         books_result = supabase.table('books').select('''
@@ -740,7 +1451,7 @@ def get_pending_approvals_for_teacher(teacher_id):
         # So we return empty materials list for teachers
         
         return {
-            'books': books_result.data if books_result.data else [],
+            'books': _with_thumbnail_urls(books_result.data),
             'materials': []
         }
         
@@ -749,6 +1460,19 @@ def get_pending_approvals_for_teacher(teacher_id):
         return {'books': [], 'materials': []}
 
 
+def _with_thumbnail_urls(items):
+    """
+    Give every pending item a thumbnail_url for the approval lists.
+    
+    Uses image_thumbnail_url once the background image job has made one,
+    otherwise falls back to the original proof image.
+    """
+    items = items or []
+    for item in items:
+        item['thumbnail_url'] = item.get('image_thumbnail_url') or item.get('image_proof_url')
+    return items
+
+
 def get_pending_approvals_for_staff(staff_id, staff_role):
     """
     Get pending material approvals for lab staff or coaches.
@@ -773,14 +1497,127 @@ def get_pending_approvals_for_staff(staff_id, staff_role):
             )
         ''').eq('subject_id', subject_id).eq('approval_status', 'pending').not_.is_('image_proof_url', 'null').execute()
         
-        return result.data if result.data else []
+        return _with_thumbnail_urls(result.data)
         
     except Exception as e:
         print(f"Error getting pending material approvals: {e}")
         return []
 
 
-def approve_book(book_id, teacher_id, action='approve', rejection_reason=None):
+def get_approvals_version(item_type, subject_ids):
+    """
+    Latest proof change/review timestamp among a reviewer's items.
+    
+    Two single-row index lookups, so a dashboard can check "anything new?"
+    without running the full pending-approvals query. Doubles as the cursor
+    for get_pending_approval_changes().
+    
+    Args:
+        item_type (str): 'book' or 'material'
+        subject_ids (list): The reviewer's subjects
+        
+    Returns:
+        str: ISO timestamp of the most recent proof change or review ('' if none)
+    """
+    try:
+        from datetime import datetime
+        
+        table_name = 'books' if item_type == 'book' else 'materials'
+        latest = []
+        # proof_updated_at covers new submissions and the image job's renditions
+        for column in ('proof_updated_at', 'approved_at'):
+            result = supabase.table(table_name).select(column).in_('subject_id', subject_ids) \
+                .not_.is_(column, 'null').order(column, desc=True).limit(1).execute()
+            if result.data:
+                latest.append(result.data[0][column])
+        return max(latest, key=datetime.fromisoformat) if latest else ''
+        
+    except Exception as e:
+        print(f"Error getting approvals version: {e}")
+        return ''
+
+
+def get_pending_approval_changes(item_type, subject_ids, since):
+    """
+    What changed in a reviewer's pending list since a cursor.
+    
+    Args:
+        item_type (str): 'book' or 'material'
+        subject_ids (list): The reviewer's subjects
+        since (str): ISO timestamp cursor (from get_approvals_version)
+        
+    Returns:
+        dict: { 'changed': [pending items whose proof changed since], 'removed': [ids reviewed since] }
+    """
+    try:
+        table_name = 'books' if item_type == 'book' else 'materials'
+        id_column = 'book_id' if item_type == 'book' else 'material_id'
+        
+        # Same shape as the full pending-approvals queries
+        select = '''
+            *,
+            student_id (
+                student_id,
+                first_name,
+                last_name,
+                year_group
+            )''' + (''',
+            subject_id (
+                subject_id,
+                subject_name
+            )''' if item_type == 'book' else '')
+        
+        changed = supabase.table(table_name).select(select).in_('subject_id', subject_ids) \
+            .eq('approval_status', 'pending').not_.is_('image_proof_url', 'null') \
+            .gte('proof_updated_at', since).execute()
+        
+        reviewed = supabase.table(table_name).select(id_column).in_('subject_id', subject_ids) \
+            .neq('approval_status', 'pending').gte('approved_at', since).execute()
+        
+        return {
+            'changed': _with_thumbnail_urls(changed.data),
+            'removed': [row[id_column] for row in reviewed.data or []]
+        }
+        
+    except Exception as e:
+        print(f"Error getting pending approval changes: {e}")
+        return None
+
+
+def _review_update_data(staff_id, action, rejection_reason=None):
+    """
+    Column updates for approving or rejecting a proof submission.
+    
+    When approved, sets both approval_status='approved' AND returned=true
+    This ensures consistency between approval workflow and testing via DB edits.
+    
+    Returns:
+        dict: Columns to update, or None if the action is invalid
+    """
+    from datetime import datetime
+    
+    update_data = {
+        'approved_by': staff_id,
+        'approved_at': datetime.utcnow().isoformat()
+    }
+    
+    if action == 'approve':
+        update_data['approval_status'] = 'approved'
+        update_data['returned'] = True  # Also mark as returned for consistency
+        update_data['rejection_reason'] = None  # Clear any previous rejection
+    elif action == 'reject':
+        update_data['approval_status'] = 'rejected'
+        update_data['returned'] = False  # Ensure not marked as returned
+        if rejection_reason:
+            update_data['rejection_reason'] = rejection_reason
+    else:
+        print(f"Invalid action: {action}")
+        return None
+    
+    return update_data
+
+
+def approve_book(book_id, teacher_id, action='approve', rejection_reason=None, subject_ids=None):
     """
     Approve or reject a Y1 student's book photo proof submission.
     
@@ -792,32 +1629,21 @@ def approve_book(book_id, teacher_id, action='approve', rejection_reason=None):
         teacher_id (str): The teacher approving/rejecting
         action (str): 'approve' or 'reject'
         rejection_reason (str, optional): Reason for rejection (required if action='reject')
+        subject_ids (list, optional): Only update the book if it is in one of these subjects
         
     Returns:
         dict: Updated book record, or None on failure
     """
     try:
-        from datetime import datetime
-        
-        update_data = {
-            'approved_by': teacher_id,
-            'approved_at': datetime.utcnow().isoformat()
-        }
-        
-        if action == 'approve':
-            update_data['approval_status'] = 'approved'
-            update_data['returned'] = True  # Also mark as returned for consistency
-            update_data['rejection_reason'] = None  # Clear any previous rejection
-        elif action == 'reject':
-            update_data['approval_status'] = 'rejected'
-            update_data['returned'] = False  # Ensure not marked as returned
-            if rejection_reason:
-                update_data['rejection_reason'] = rejection_reason
-        else:
-            print(f"Invalid action: {action}")
+        update_data = _review_update_data(teacher_id, action, rejection_reason)
+        if update_data is None:
             return None
         
-        result = supabase.table('books').update(update_data).eq('book_id', book_id).execute()
+        query = supabase.table('books').update(update_data).eq('book_id', book_id)
+        if subject_ids is not None:
+            query = query.in_('subject_id', subject_ids)
+        result = query.execute()
+        _bump_versions(result.data)
         return result.data[0] if result.data else None
         
     except Exception as e:
@@ -825,7 +1651,7 @@ def approve_book(book_id, teacher_id, action='approve', rejection_reason=None):
         return None
 
 
-def approve_material(material_id, staff_id, action='approve', rejection_reason=None):
+def approve_material(material_id, staff_id, action='approve', rejection_reason=None, subject_ids=None):
     """
     Approve or reject a Y1 student's material photo proof submission.
     
@@ -837,32 +1663,21 @@ def approve_material(material_id, staff_id, action='approve', rejection_reason=N
         staff_id (str): The staff member approving (lab_staff_id or coach_id)
         action (str): 'approve' or 'reject'
         rejection_reason (str, optional): Reason for rejection
+        subject_ids (list, optional): Only update the material if it is in one of these subjects
         
     Returns:
         dict: Updated material record, or None on failure
     """
     try:
-        from datetime import datetime
-        
-        update_data = {
-            'approved_by': staff_id,
-            'approved_at': datetime.utcnow().isoformat()
-        }
-        
-        if action == 'approve':
-            update_data['approval_status'] = 'approved'
-            update_data['returned'] = True  # Also mark as returned for consistency
-            update_data['rejection_reason'] = None
-        elif action == 'reject':
-            update_data['approval_status'] = 'rejected'
-            update_data['returned'] = False  # Ensure not marked as returned
-            if rejection_reason:
-                update_data['rejection_reason'] = rejection_reason
-        else:
-            print(f"Invalid action: {action}")
+        update_data = _review_update_data(staff_id, action, rejection_reason)
+        if update_data is None:
             return None
         
-        result = supabase.table('materials').update(update_data).eq('material_id', material_id).execute()
+        query = supabase.table('materials').update(update_data).eq('material_id', material_id)
+        if subject_ids is not None:
+            query = query.in_('subject_id', subject_ids)
+        result = query.execute()
+        _bump_versions(result.data)
         return result.data[0] if result.data else None
         
     except Exception as e:
@@ -870,12 +1685,53 @@ def approve_material(material_id, staff_id, action='approve', rejection_reason=N
         return None
 
 
+def review_items_bulk(item_type, item_ids, staff_id, action, rejection_reason=None, subject_ids=None):
+    """
+    Approve or reject many books or materials at once.
+    
+    Runs one UPDATE ... WHERE id IN (...) per chunk of IDs instead of one
+    request per item. When subject_ids is given, only items in those subjects
+    are touched, so staff can't review items outside their remit.
+    
+    Args:
+        item_type (str): 'book' or 'material'
+        item_ids (list): book_id or material_id values
+        staff_id (str): The teacher/staff member reviewing
+        action (str): 'approve' or 'reject'
+        rejection_reason (str, optional): Reason for rejection
+        subject_ids (list, optional): Restrict the update to these subjects
+        
+    Returns:
+        list: The updated records (items that didn't match are simply absent)
+    """
+    update_data = _review_update_data(staff_id, action, rejection_reason)
+    if update_data is None or not item_ids:
+        return []
+    
+    table_name = 'books' if item_type == 'book' else 'materials'
+    id_column = 'book_id' if item_type == 'book' else 'material_id'
+    
+    updated = []
+    for chunk in _chunked(list(item_ids)):
+        try:
+            query = supabase.table(table_name).update(update_data).in_(id_column, chunk)
+            if subject_ids is not None:
+                query = query.in_('subject_id', subject_ids)
+            result = query.execute()
+            _bump_versions(result.data)
+            updated.extend(result.data or [])
+        except Exception as e:
+            # Keep going: items in this chunk are reported as not updated
+            print(f"Error bulk reviewing {item_type}s: {e}")
+    return updated
+
+
 def upload_proof_image(item_type, item_id, student_id, file_path):
     """
-    Upload a proof image to Supabase Storage and update the record.
+    Upload a proof image file from disk to Supabase Storage and update the record.
     
-    This function handles the file upload to Supabase Storage and updates
-    the corresponding database record with the image URL.
+    Thin wrapper around upload_proof_stream() for images that are already on
+    disk (e.g. ones handed to a background job).
     
     Args:
         item_type (str): 'book' or 'material'
@@ -887,11 +1743,8 @@ def upload_proof_image(item_type, item_id, student_id, file_path):
         dict: { 'success': bool, 'image_url': str } or error info
     """
     try:
-        from datetime import datetime
         import os
         
-        print(f"[DEBUG upload_proof_image] Starting upload - type: {item_type}, id: {item_id}, student: {student_id}")
-        
         # Verify file exists
         if not os.path.exists(file_path):
             print(f"[ERROR] File not found: {file_path}")
@@ -900,59 +1753,111 @@ def upload_proof_image(item_type, item_id, student_id, file_path):
                 'message': f'File not found: {file_path}'
             }
         
-        # Generate unique filename
-        timestamp = int(datetime.utcnow().timestamp())
-        file_ext = os.path.splitext(file_path)[1]
-        storage_path = f"{item_type}s/{student_id}/{item_id}_{timestamp}{file_ext}"
-        
-        print(f"[DEBUG] Storage path: {storage_path}")
-        
-        # Read file data
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        
-        print(f"[DEBUG] File data read: {len(file_data)} bytes")
-        
         # Determine content type based on file extension
+        file_ext = os.path.splitext(file_path)[1]
         content_type = "image/jpeg"
         if file_ext.lower() in ['.png']:
             content_type = "image/png"
         elif file_ext.lower() in ['.heic']:
             content_type = "image/heic"
         
-        print(f"[DEBUG] Content type: {content_type}")
+        with open(file_path, 'rb') as f:
+            return upload_proof_stream(item_type, item_id, student_id, f, content_type, file_ext)
         
-        # Upload to Supabase Storage
-        print(f"[DEBUG] Uploading to Supabase Storage bucket: clearance-proofs")
-        try:
-            result = supabase.storage.from_('clearance-proofs').upload(
-                path=storage_path,
-                file=file_data,
-                file_options={"content-type": content_type, "upsert": "true"}
-            )
-            print(f"[DEBUG] Upload result: {result}")
-        except Exception as upload_error:
-            print(f"[ERROR] Supabase upload failed: {upload_error}")
-            # Check if bucket exists
+    except Exception as e:
+        print(f"[ERROR] Exception in upload_proof_image: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            'success': False,
+            'message': f'Upload failed: {str(e)}'
+        }
+
+
+def upload_proof_stream(item_type, item_id, student_id, stream, content_type, file_ext):
+    """
+    Upload a proof image to Supabase Storage and update the record.
+    
+    The image is streamed to storage in chunks straight from `stream`; nothing
+    is written to disk and no extra in-memory copy of the whole file is made.
+    The number of bytes copied to storage is logged for every upload.
+    
+    Objects are stored under the SHA-256 of their contents, so when a student
+    retries with the same photo the storage write is skipped and only the
+    record is updated. Known objects are looked up in the local proof index
+    first, then in storage.
+    
+    Args:
+        item_type (str): 'book' or 'material'
+        item_id (str): The book_id or material_id
+        student_id (str): The student's ID (for organizing storage)
+        stream: Seekable binary stream positioned at the start of the image
+        content_type (str): The image's MIME type
+        file_ext (str): File extension to store it under, e.g. '.jpg'
+        
+    Returns:
+        dict: { 'success': bool, 'image_url': str, 'deduplicated': bool } or error info
+    """
+    try:
+        import io
+        from datetime import datetime
+        from uploads import CountingReader, hash_stream, get_proof_index, stream_size
+        
+        print(f"[DEBUG upload_proof_stream] Starting upload - type: {item_type}, id: {item_id}, student: {student_id}")
+        
+        # Content-addressed filename: the same photo always maps to the same object
+        content_hash = hash_stream(stream)
+        storage_path = f"{item_type}s/{student_id}/{content_hash}{file_ext}"
+        
+        print(f"[DEBUG] Storage path: {storage_path}, content type: {content_type}")
+        
+        bucket = supabase.storage.from_('clearance-proofs')
+        proof_index = get_proof_index()
+        already_stored = proof_index.contains(storage_path) or _proof_object_exists(bucket, storage_path)
+        
+        # The storage client streams buffered readers; everything else is taken as a path
+        counter = CountingReader(stream)
+        reader = io.BufferedReader(counter)
+        
+        if already_stored:
+            print(f"[UPLOAD] {storage_path}: already stored, 0 bytes copied to storage")
+        else:
+            # Upload to Supabase Storage
+            print("[DEBUG] Uploading to Supabase Storage bucket: clearance-proofs")
             try:
-                buckets = supabase.storage.list_buckets()
-                print(f"[DEBUG] Available buckets: {[b['name'] for b in buckets]}")
-                if 'clearance-proofs' not in [b['name'] for b in buckets]:
-                    return {
-                        'success': False,
-                        'message': 'Storage bucket "clearance-proofs" does not exist. Please contact administrator.'
-                    }
-            except Exception as bucket_check_error:
-                print(f"[ERROR] Could not check buckets: {bucket_check_error}")
-            
-            return {
-                'success': False,
-                'message': f'Upload failed: {str(upload_error)}'
-            }
+                result = bucket.upload(
+                    path=storage_path,
+                    file=reader,
+                    file_options={"content-type": content_type, "upsert": "true"}
+                )
+                print(f"[DEBUG] Upload result: {result}")
+            except Exception as upload_error:
+                print(f"[ERROR] Supabase upload failed: {upload_error}")
+                # Check if bucket exists
+                try:
+                    buckets = supabase.storage.list_buckets()
+                    print(f"[DEBUG] Available buckets: {[b['name'] for b in buckets]}")
+                    if 'clearance-proofs' not in [b['name'] for b in buckets]:
+                        return {
+                            'success': False,
+                            'message': 'Storage bucket "clearance-proofs" does not exist. Please contact administrator.'
+                        }
+                except Exception as bucket_check_error:
+                    print(f"[ERROR] Could not check buckets: {bucket_check_error}")
+                
+                return {
+                    'success': False,
+                    'message': f'Upload failed: {str(upload_error)}'
+                }
+            finally:
+                print(f"[UPLOAD] {storage_path}: {counter.bytes_read} bytes copied to storage")
+        
+        # Remember it so a retry of the same photo skips storage entirely
+        proof_index.add(storage_path, stream_size(stream))
         
         # Get public URL
-        print(f"[DEBUG] Getting public URL...")
-        public_url = supabase.storage.from_('clearance-proofs').get_public_url(storage_path)
+        print("[DEBUG] Getting public URL...")
+        public_url = bucket.get_public_url(storage_path)
         print(f"[DEBUG] Public URL: {public_url}")
         
         # Update database record
@@ -960,13 +1865,17 @@ def upload_proof_image(item_type, item_id, student_id, file_path):
         id_column = 'book_id' if item_type == 'book' else 'material_id'
         
         print(f"[DEBUG] Updating {table_name} table, column {id_column} = {item_id}")
+        submitted_at = datetime.utcnow().isoformat()
         
         try:
             update_result = supabase.table(table_name).update({
                 'image_proof_url': public_url,
-                'submitted_at': datetime.utcnow().isoformat(),
+                'image_thumbnail_url': None,  # Set again by the background image job
+                'submitted_at': submitted_at,
+                'proof_updated_at': submitted_at,
                 'approval_status': 'pending'
             }).eq(id_column, item_id).execute()
+            _bump_versions(update_result.data)
             
             print(f"[DEBUG] Database update result: {update_result.data}")
             
@@ -974,6 +1883,9 @@ def upload_proof_image(item_type, item_id, student_id, file_path):
                 return {
                     'success': True,
                     'image_url': public_url,
+                    'storage_path': storage_path,
+                    'subject_id': update_result.data[0].get('subject_id'),
+                    'deduplicated': already_stored,
                     'message': 'Proof image uploaded successfully'
                 }
             else:
@@ -990,7 +1902,7 @@ def upload_proof_image(item_type, item_id, student_id, file_path):
             }
         
     except Exception as e:
-        print(f"[ERROR] Exception in upload_proof_image: {e}")
+        print(f"[ERROR] Exception in upload_proof_stream: {e}")
         import traceback
         traceback.print_exc()
         return {
@@ -999,6 +1911,189 @@ def upload_proof_image(item_type, item_id, student_id, file_path):
         }
 
 
+def _proof_object_exists(bucket, storage_path):
+    """Ask storage whether a proof object exists (False if the check itself fails)."""
+    try:
+        return bucket.exists(storage_path)
+    except Exception as e:
+        print(f"[DEBUG] Could not check for existing proof object {storage_path}: {e}")
+        return False
+
+
+def download_proof_image(storage_path):
+    """
+    Download an uploaded proof image from the clearance-proofs bucket.
+    
+    Returns:
+        bytes: The image data, or None on failure
+    """
+    try:
+        return supabase.storage.from_('clearance-proofs').download(storage_path)
+    except Exception as e:
+        print(f"Error downloading proof image {storage_path}: {e}")
+        return None
+
+
+def save_proof_renditions(item_type, item_id, storage_path, original_url, image, thumbnail):
+    """
+    Store the normalized proof image and its thumbnail next to the original,
+    and point the item's record at them.
+    
+    The record is only updated if it still references the original upload, so
+    a slow job can't overwrite a newer proof the student has since submitted.
+    proof_updated_at moves to when the reviewable image was ready, which
+    advances get_approvals_version() and brings the item (with its new URLs)
+    back into get_pending_approval_changes() for dashboards that already
+    listed it; submitted_at keeps the student's submission time.
+    
+    Args:
+        item_type (str): 'book' or 'material'
+        item_id (str): The book_id or material_id
+        storage_path (str): Storage path of the original upload
+        original_url (str): Public URL of the original upload
+        image (tuple): (bytes, content_type, ext) of the normalized image
+        thumbnail (tuple): (bytes, content_type, ext) of the thumbnail
+        
+    Returns:
+        dict: { 'image_url': str, 'thumbnail_url': str, 'updated': bool }
+    """
+    import os
+    from datetime import datetime
+    from uploads import get_proof_index
+    
+    bucket = supabase.storage.from_('clearance-proofs')
+    proof_index = get_proof_index()
+    base_path = os.path.splitext(storage_path)[0]
+    urls = {}
+    for name, (data, content_type, ext) in (('image', image), ('thumbnail', thumbnail)):
+        path = f"{base_path}.{name}{ext}"
+        # Renditions are named after the original's content hash, so a re-upload reuses them
+        if not proof_index.contains(path):
+            bucket.upload(path=path, file=data, file_options={"content-type": content_type, "upsert": "true"})
+            proof_index.add(path, len(data))
+        urls[name] = bucket.get_public_url(path)
+    
+    table_name = 'books' if item_type == 'book' else 'materials'
+    id_column = 'book_id' if item_type == 'book' else 'material_id'
+    result = supabase.table(table_name).update({
+        'image_proof_url': urls['image'],
+        'image_thumbnail_url': urls['thumbnail'],
+        'proof_updated_at': datetime.utcnow().isoformat()
+    }).eq(id_column, item_id).eq('image_proof_url', original_url).execute()
+    _bump_versions(result.data)
+    
+    return {
+        'image_url': urls['image'],
+        'thumbnail_url': urls['thumbnail'],
+        'updated': bool(result.data)
+    }
+
+
+def _proof_object_base(path):
+    """Storage path of the original upload an object belongs to, minus its extension."""
+    import os
+    
+    base = os.path.splitext(path)[0]
+    for suffix in ('.image', '.thumbnail'):
+        if base.endswith(suffix):
+            return base[:-len(suffix)]
+    return base
+
+
+def list_proof_objects():
+    """
+    List every object in the clearance-proofs bucket.
+    
+    Returns:
+        list: [{ 'path': str, 'created_at': datetime or None }]
+    """
+    from datetime import datetime
+    
+    bucket = supabase.storage.from_('clearance-proofs')
+    page_size = 1000
+    objects = []
+    folders = ['']
+    while folders:
+        prefix = folders.pop()
+        offset = 0
+        while True:
+            entries = bucket.list(prefix, {'limit': page_size, 'offset': offset})
+            for entry in entries:
+                path = f"{prefix}/{entry['name']}" if prefix else entry['name']
+                if entry.get('id') is None:
+                    folders.append(path)  # Folders come back without an id
+                    continue
+                created_at = entry.get('created_at')
+                objects.append({
+                    'path': path,
+                    'created_at': datetime.fromisoformat(created_at) if created_at else None
+                })
+            if len(entries) < page_size:
+                break
+            offset += page_size
+    return objects
+
+
+def find_orphaned_proof_objects(min_age_seconds):
+    """
+    Find proof objects that no book or material record points at any more.
+    
+    An object counts as in use if a record references it or another rendition
+    of the same upload (original, normalized image or thumbnail). Objects
+    younger than min_age_seconds are left alone so in-flight uploads and
+    background image jobs are never touched.
+    
+    Args:
+        min_age_seconds (int): Only report objects older than this
+        
+    Returns:
+        list: Storage paths of orphaned objects
+    """
+    from datetime import datetime, timezone, timedelta
+    
+    referenced = set()
+    for table_name in ('books', 'materials'):
+        page_size = 1000
+        offset = 0
+        while True:
+            result = supabase.table(table_name).select('image_proof_url, image_thumbnail_url') \
+                .not_.is_('image_proof_url', 'null') \
+                .range(offset, offset + page_size - 1).execute()
+            for row in result.data or []:
+                for url in (row.get('image_proof_url'), row.get('image_thumbnail_url')):
+                    if url and '/clearance-proofs/' in url:
+                        path = url.split('/clearance-proofs/', 1)[1].split('?', 1)[0]
+                        referenced.add(_proof_object_base(path))
+            if len(result.data or []) < page_size:
+                break
+            offset += page_size
+    
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=min_age_seconds)
+    return [
+        obj['path'] for obj in list_proof_objects()
+        if _proof_object_base(obj['path']) not in referenced
+        and obj['created_at'] is not None and obj['created_at'] < cutoff
+    ]
+
+
+def delete_proof_objects(paths):
+    """
+    Delete proof objects from storage and forget them in the local proof index.
+    
+    Returns:
+        int: Number of objects deleted
+    """
+    from uploads import get_proof_index
+    
+    bucket = supabase.storage.from_('clearance-proofs')
+    deleted = 0
+    for batch in _chunked(list(paths), 100):
+        bucket.remove(batch)
+        get_proof_index().remove(batch)
+        deleted += len(batch)
+    return deleted
+
+
 def get_class_by_id(class_id):
     """
     Get complete class information including year_group and color_block.
@@ -0,0 +1,432 @@
+"""
+Eclari Uploads
+
+Helpers for proof image uploads that keep the image in memory, without
+spooling it to disk or copying it several times.
+
+Proof upload routes are wrapped in proof_upload_request, which caps the
+request body at MAX_PROOF_SIZE (so Werkzeug refuses oversized bodies before
+reading them) and, because of that cap, holds the file in a BytesIO instead
+of Werkzeug's default spooled temp file. Every other route keeps the default
+spooling under its own limit. The image type is sniffed from the first bytes rather than trusted from
+the filename. The buffer is then passed to the storage client through
+CountingReader, which streams it out in chunks and records how many bytes
+were copied.
+
+Proof objects are content-addressed by the SHA-256 of their bytes, so a
+retried upload of the same photo reuses the stored object. ProofIndex keeps a
+small local record of hashes already in storage, so that check usually needs
+no storage round trip.
+
+Large proofs on slow connections can use a resumable chunked upload instead
+(ChunkedUpload). Each chunk is written at its offset in a single file on local
+disk, so there is nothing to assemble when the last chunk arrives, and a
+dropped connection only loses the chunk that was in flight.
+
+After upload, a background job normalizes each proof photo into a capped-size
+JPEG plus a small thumbnail (normalize_proof_image).
+"""
+
+import io
+import os
+import re
+import json
+import time
+import fcntl
+import uuid
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from functools import wraps
+from flask import Request, request
+
+# Largest proof image we accept
+MAX_PROOF_SIZE = 5 * 1024 * 1024
+# Room for the multipart boundaries and the other form fields
+MULTIPART_OVERHEAD = 64 * 1024
+# Body limit for every route that doesn't set its own (JSON and small forms;
+# also covers a chunked-upload chunk)
+MAX_REQUEST_SIZE = 1024 * 1024
+
+
+class EclariRequest(Request):
+    """Request class that can keep uploaded files in memory (see proof_upload_request)."""
+
+    # Set per request, before the form is parsed
+    files_in_memory = False
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.files_in_memory:
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+def proof_upload_request(view):
+    """
+    Route decorator for proof uploads: cap the body at one proof image and
+    keep its file in memory (safe because of the cap).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request.max_content_length = MAX_PROOF_SIZE + MULTIPART_OVERHEAD
+        request.files_in_memory = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# ===== CONTENT SNIFFING =====
+
+# ISO base media brands used by HEIC/HEIF photos (iPhone camera default)
+_HEIF_BRANDS = {b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1'}
+
+
+def sniff_image_type(stream):
+    """
+    Work out an upload's image type from its first bytes.
+
+    Args:
+        stream: Seekable binary stream; its position is left unchanged
+
+    Returns:
+        tuple: (content_type, file_extension), or None if it isn't a supported image
+    """
+    position = stream.tell()
+    head = stream.read(16)
+    stream.seek(position)
+
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg', '.jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png', '.png'
+    if head[4:8] == b'ftyp' and head[8:12] in _HEIF_BRANDS:
+        return 'image/heic', '.heic'
+    return None
+
+
+def stream_size(stream):
+    """Size of a seekable stream in bytes, without reading it."""
+    position = stream.tell()
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(position)
+    return size
+
+
+# ===== CONTENT ADDRESSING =====
+
+# Local index entries are trusted for this long; older ones are re-checked
+# against storage (the orphan cleanup never deletes anything younger)
+PROOF_INDEX_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def hash_stream(stream):
+    """
+    SHA-256 hex digest of a seekable stream's contents; its position is left unchanged.
+
+    In-memory uploads are hashed straight from their buffer without copying.
+    """
+    digest = hashlib.sha256()
+    position = stream.tell()
+    if hasattr(stream, 'getbuffer'):
+        with stream.getbuffer() as buffer:
+            digest.update(buffer)
+    else:
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(64 * 1024), b''):
+            digest.update(chunk)
+    stream.seek(position)
+    return digest.hexdigest()
+
+
+class ProofIndex:
+    """
+    Local SQLite record of proof objects known to exist in storage.
+
+    Shared by every gunicorn worker on the machine, like the job queue.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv(
+            'PROOF_INDEX_PATH', os.path.join(tempfile.gettempdir(), 'eclari-proof-index.sqlite3')
+        )
+        self._execute('PRAGMA journal_mode=WAL')
+        self._execute('''
+            CREATE TABLE IF NOT EXISTS proof_objects (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                recorded_at REAL NOT NULL
+            )
+        ''')
+
+    def _execute(self, sql, params=()):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def contains(self, path):
+        """True if the object was recorded recently enough to trust without asking storage."""
+        cutoff = time.time() - PROOF_INDEX_TTL_SECONDS
+        return bool(self._execute(
+            "SELECT 1 FROM proof_objects WHERE path = ? AND recorded_at > ?", (path, cutoff)
+        ))
+
+    def add(self, path, size=None):
+        self._execute(
+            "INSERT OR REPLACE INTO proof_objects (path, size, recorded_at) VALUES (?, ?, ?)",
+            (path, size, time.time())
+        )
+
+    def remove(self, paths):
+        for path in paths:
+            self._execute("DELETE FROM proof_objects WHERE path = ?", (path,))
+
+
+_proof_index = None
+_proof_index_lock = threading.Lock()
+
+
+def get_proof_index():
+    """This process's ProofIndex, created on first use."""
+    global _proof_index
+    with _proof_index_lock:
+        if _proof_index is None:
+            _proof_index = ProofIndex()
+        return _proof_index
+
+
+# ===== INSTRUMENTED STREAMING =====
+
+class CountingReader(io.RawIOBase):
+    """
+    Read-only view of a stream that counts the bytes read through it.
+
+    Wrap it in io.BufferedReader before handing it to the storage client,
+    which streams buffered readers in chunks but treats other objects as paths.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.source.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.source.seek(offset, whence)
+
+    def tell(self):
+        return self.source.tell()
+
+    def readinto(self, buffer):
+        n = self.source.readinto(buffer)
+        self.bytes_read += n or 0
+        return n
+
+
+# ===== RESUMABLE CHUNKED UPLOADS =====
+
+# Chunk size clients are asked to use: small enough to finish on weak Wi-Fi
+CHUNKED_UPLOAD_CHUNK_SIZE = 512 * 1024
+# Chunked upload sessions that haven't completed within a day are discarded
+CHUNKED_UPLOAD_TTL_SECONDS = 24 * 60 * 60
+
+
+class ChunkedUpload:
+    """
+    One resumable upload session.
+
+    Lives in ``CHUNKED_UPLOAD_DIR`` (default: system temp dir) as
+    ``<upload_id>.json`` (who/what/how big) plus ``<upload_id>.part`` (the bytes
+    received so far). Chunks must be sent in order, but a chunk may start
+    anywhere up to the bytes already received, so re-sending a chunk whose
+    response was lost is harmless.
+    """
+
+    def __init__(self, upload_id, info):
+        self.upload_id = upload_id
+        self.info = info
+        self.directory = self.upload_dir()
+
+    @staticmethod
+    def upload_dir():
+        directory = os.getenv(
+            'CHUNKED_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'eclari-uploads')
+        )
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    @property
+    def info_path(self):
+        return os.path.join(self.directory, f"{self.upload_id}.json")
+
+    @property
+    def part_path(self):
+        return os.path.join(self.directory, f"{self.upload_id}.part")
+
+    @classmethod
+    def create(cls, student_id, item_type, item_id, size):
+        """Start a new upload session for `size` bytes."""
+        cls.expire_stale()
+        upload = cls(uuid.uuid4().hex, {
+            'student_id': student_id,
+            'item_type': item_type,
+            'item_id': item_id,
+            'size': size,
+            'created_at': time.time()
+        })
+        open(upload.part_path, 'wb').close()
+        fd, temp_path = tempfile.mkstemp(dir=upload.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(upload.info, f)
+        os.replace(temp_path, upload.info_path)
+        return upload
+
+    @classmethod
+    def load(cls, upload_id):
+        """Read an upload session from disk, or None if it doesn't exist."""
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+            return None
+        upload = cls(upload_id, None)
+        try:
+            with open(upload.info_path) as f:
+                upload.info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return upload
+
+    @classmethod
+    def expire_stale(cls):
+        """Remove sessions older than CHUNKED_UPLOAD_TTL_SECONDS."""
+        cutoff = time.time() - CHUNKED_UPLOAD_TTL_SECONDS
+        directory = cls.upload_dir()
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    @property
+    def size(self):
+        return self.info['size']
+
+    def received(self):
+        """Bytes received so far (the offset the next chunk should start at)."""
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    def write_chunk(self, start, source, length):
+        """
+        Write `length` bytes from `source` at offset `start`, streaming them
+        to disk in blocks.
+
+        Returns:
+            int: Bytes received so far
+
+        Raises:
+            ValueError: The chunk would leave a gap or run past the declared size
+        """
+        with open(self.part_path, 'r+b') as f:
+            # Two workers handling the same chunk (a client retry racing the
+            # original) must not both pass the gap check and interleave writes
+            fcntl.flock(f, fcntl.LOCK_EX)
+            received = os.fstat(f.fileno()).st_size
+            if start > received:
+                raise ValueError(f'Chunk starts at {start} but only {received} bytes have been received')
+            if start + length > self.size:
+                raise ValueError(f'Chunk runs past the declared size of {self.size} bytes')
+
+            f.seek(start)
+            remaining = length
+            while remaining:
+                block = source.read(min(remaining, 64 * 1024))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+            f.flush()
+        if remaining:
+            raise ValueError(f'Chunk ended {remaining} bytes short')
+        return self.received()
+
+    def is_complete(self):
+        return self.received() == self.size
+
+    def open(self):
+        """The assembled upload, as a read-only binary file."""
+        return open(self.part_path, 'rb')
+
+    def discard(self):
+        for path in (self.part_path, self.info_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# ===== IMAGE NORMALIZATION =====
+
+# Longest edge of the normalized proof image and of its thumbnail
+PROOF_MAX_EDGE = 1600
+THUMBNAIL_MAX_EDGE = 320
+
+
+def normalize_proof_image(data):
+    """
+    Turn an uploaded proof photo into a capped-size JPEG plus a WebP thumbnail.
+
+    Phone photos are rotated upright from their EXIF orientation, and their
+    metadata (including GPS) is dropped. HEIC photos need the optional
+    pillow-heif package.
+
+    Args:
+        data (bytes): The original image
+
+    Returns:
+        dict: {'image': (bytes, content_type, ext), 'thumbnail': (bytes, content_type, ext)}
+
+    Raises:
+        RuntimeError: Pillow (or pillow-heif for HEIC) isn't installed
+    """
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        raise RuntimeError('Pillow is not installed; proof images are left as uploaded')
+
+    if data[4:12] in {b'ftyp' + brand for brand in _HEIF_BRANDS}:
+        try:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+        except ImportError:
+            raise RuntimeError('pillow-heif is not installed; HEIC proofs are left as uploaded')
+
+    with Image.open(io.BytesIO(data)) as original:
+        # Let the JPEG decoder downscale while decoding instead of decoding at full size
+        scale = PROOF_MAX_EDGE / max(original.size)
+        if scale < 1:
+            original.draft('RGB', (round(original.width * scale), round(original.height * scale)))
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    image.thumbnail((PROOF_MAX_EDGE, PROOF_MAX_EDGE), Image.LANCZOS)
+    normalized = io.BytesIO()
+    image.save(normalized, 'JPEG', quality=85, optimize=True, progressive=True)
+
+    image.thumbnail((THUMBNAIL_MAX_EDGE, THUMBNAIL_MAX_EDGE), Image.LANCZOS)
+    thumbnail = io.BytesIO()
+    if features.check('webp'):
+        image.save(thumbnail, 'WEBP', quality=75, method=4)
+        thumbnail_type = ('image/webp', '.webp')
+    else:
+        image.save(thumbnail, 'JPEG', quality=75, optimize=True)
+        thumbnail_type = ('image/jpeg', '.jpg')
+
+    return {
+        'image': (normalized.getvalue(), 'image/jpeg', '.jpg'),
+        'thumbnail': (thumbnail.getvalue(), *thumbnail_type)
+    }
@@ -4,14 +4,18 @@ import { resolve } from 'path'
 export default defineConfig({
   build: {
     outDir: 'static/js',
+    // static/js/.vite/manifest.json maps each entry to its hashed file (read by assets.py)
+    manifest: true,
     rollupOptions: {
       input: {
         auth: resolve(__dirname, 'src/auth.js'),
         app: resolve(__dirname, 'src/app.js')
       },
       output: {
-        entryFileNames: '[name].bundle.js',
-        assetFileNames: '[name].[ext]'
+        // Content-hashed names so Flask can serve them as immutable
+        entryFileNames: '[name].[hash].bundle.js',
+        chunkFileNames: '[name].[hash].chunk.js',
+        assetFileNames: '[name].[hash].[ext]'
       }
     },
     emptyOutDir: false, // Don't clear the entire static/js directory